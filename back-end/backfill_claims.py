@@ -0,0 +1,418 @@
+"""
+Exportação e backfill em massa da tabela de sinistros.
+
+Varre a tabela com Scan paralelo (um segmento por tarefa, distribuídos entre
+processos), aplica uma transformação a cada sinistro e regrava em lotes com
+BatchWriteItem. A leitura e a escrita respeitam um orçamento de capacidade
+(RCU/WCU por segundo) para não competir com o tráfego de produção, e cada
+segmento mantém um checkpoint próprio com o LastEvaluatedKey: ao executar
+novamente, os segmentos concluídos são pulados e os demais continuam de onde
+pararam.
+
+Transformações embutidas (aplicadas ao item lógico, com nomes longos):
+    compact     regrava no esquema compacto atual (ClaimItemCodec)
+    index-keys  acrescenta as chaves g1pk/g2pk dos GSIs
+    retention   define o TTL (expiresAt) conforme CLAIM_RETENTION_DAYS
+    all         todas as anteriores (padrão)
+    modulo:funcao  função própria que recebe e retorna o item (None = pular)
+
+Itens sem alteração não são regravados. A transformação não pode mudar as
+chaves da tabela (sessionId/createdAt).
+
+Com --export-dir, cada página lida é exportada só depois de seus itens
+serem gravados, imediatamente antes de o checkpoint avançar: uma página
+relida após falha não é repetida. Uma interrupção exatamente entre os dois
+passos ainda pode repetir a página; leitores devem deduplicar por
+(sessionId, createdAt), como faz o simulate_plan_rules.py.
+
+Com --dry-run os checkpoints ficam em <checkpoint-dir>/dry-run/, separados
+dos da execução real, que continua processando todos os segmentos.
+
+Uso:
+    python back-end/backfill_claims.py --table iamigos-dental-claims-prod \\
+        --checkpoint-dir checkpoints/ --workers 8 --segments 64 --max-wcu 500
+    python back-end/backfill_claims.py --table iamigos-dental-claims-prod \\
+        --checkpoint-dir checkpoints/ --export-dir export/ --dry-run
+"""
+
+import argparse
+import gzip
+import importlib
+import json
+import logging
+import math
+import os
+import sys
+import time
+from collections import Counter
+from multiprocessing import Pool
+
+import boto3
+from botocore.config import Config
+from botocore.exceptions import ClientError
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from orchestrator_lambda import (  # noqa: E402
+    BatchWriteBuffer,
+    ClaimAggregates,
+    ClaimArchive,
+    ClaimItemCodec,
+    DataManager,
+    ItemSerializer,
+)
+
+logger = logging.getLogger("backfill_claims")
+
+KEY_ATTRIBUTES = ("sessionId", "createdAt")
+THROTTLING_ERROR_CODES = (
+    "ProvisionedThroughputExceededException",
+    "ThrottlingException",
+    "RequestLimitExceeded",
+)
+
+
+class CapacityLimiter:
+    """
+    Limitador por unidades de capacidade (token bucket com débito).
+
+    O consumo é registrado depois da chamada (o Scan só informa a capacidade
+    consumida na resposta); quando o saldo fica negativo, a próxima chamada
+    espera até ele ser reposto.
+    """
+
+    def __init__(self, units_per_second, burst_seconds=1.0):
+        self.rate = units_per_second
+        self.capacity = units_per_second * burst_seconds
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait(self):
+        """Bloqueia enquanto o saldo estiver negativo."""
+        if self.rate <= 0:
+            return
+        self._refill()
+        if self.tokens < 0:
+            time.sleep(-self.tokens / self.rate)
+            self._refill()
+
+    def consume(self, units):
+        if self.rate > 0:
+            self._refill()
+            self.tokens -= units
+
+
+def load_transform(name):
+    """Retorna a função de transformação (item lógico -> item lógico ou None)."""
+    if ":" in name:
+        module_name, _, function_name = name.partition(":")
+        return getattr(importlib.import_module(module_name), function_name)
+
+    data_manager = DataManager(buffered_writes=False)
+    steps = {
+        "compact": [],
+        "index-keys": [data_manager._with_index_keys],
+        "retention": [data_manager._with_retention],
+        "all": [data_manager._with_index_keys, data_manager._with_retention],
+    }
+    if name not in steps:
+        raise ValueError(f"Transformação desconhecida: {name}")
+
+    def transform(item):
+        for step in steps[name]:
+            item = step(item)
+        return item
+
+    return transform
+
+
+def migrate_item(stored, transform):
+    """
+    Aplica a transformação a um item gravado (qualquer versão do esquema).
+
+    Returns:
+        dict | None: Item codificado a regravar, ou None se nada mudou
+    """
+    if stored.get("claimType") not in ClaimAggregates.CLAIM_TYPES:
+        return None
+
+    item = transform(ClaimItemCodec.decode(stored))
+    if item is None:
+        return None
+    if any(item.get(name) != stored.get(name) for name in KEY_ATTRIBUTES):
+        raise ValueError("A transformação não pode alterar as chaves da tabela")
+
+    encoded = ClaimItemCodec.encode(item)
+    return None if encoded == stored else encoded
+
+
+def checkpoint_path(checkpoint_dir, segment, total_segments):
+    return os.path.join(
+        checkpoint_dir, f"segment-{segment:05d}-of-{total_segments:05d}.json"
+    )
+
+
+def load_segment_checkpoint(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as checkpoint:
+        return json.load(checkpoint)
+
+
+def save_segment_checkpoint(path, state):
+    # Escrita atômica: um checkpoint nunca fica truncado
+    temporary = f"{path}.tmp"
+    with open(temporary, "w", encoding="utf-8") as checkpoint:
+        json.dump(state, checkpoint)
+    os.replace(temporary, path)
+
+
+def scan_page(client, request, limiter, max_retries):
+    """Lê uma página do segmento, repetindo com backoff se houver throttling."""
+    attempt = 0
+    while True:
+        limiter.wait()
+        try:
+            response = client.scan(**request)
+            limiter.consume(
+                response.get("ConsumedCapacity", {}).get("CapacityUnits", 0)
+            )
+            return response
+        except ClientError as e:
+            if (
+                e.response["Error"]["Code"] not in THROTTLING_ERROR_CODES
+                or attempt >= max_retries
+            ):
+                raise
+            attempt += 1
+            time.sleep(min(0.1 * 2**attempt, 10.0))
+
+
+def run_segment(args, segment, transform):
+    """Processa um segmento do Scan do checkpoint até o fim (executa no worker)."""
+    path = checkpoint_path(args.checkpoint_dir, segment, args.segments)
+    state = load_segment_checkpoint(path) or {
+        "segment": segment,
+        "total_segments": args.segments,
+        "last_evaluated_key": None,
+        "done": False,
+        "scanned": 0,
+        "changed": 0,
+        "written": 0,
+        "errors": 0,
+    }
+    if state["done"]:
+        return {**state, "skipped": True}
+
+    session = boto3.session.Session(region_name=args.region)
+    client = session.client(
+        "dynamodb",
+        config=Config(
+            max_pool_connections=8, retries={"mode": "standard", "max_attempts": 3}
+        ),
+    )
+    # Orçamento global dividido entre os processos
+    read_limiter = CapacityLimiter(args.max_rcu / args.workers)
+    write_limiter = CapacityLimiter(args.max_wcu / args.workers)
+    buffer = BatchWriteBuffer(
+        client,
+        args.table,
+        key_attributes=KEY_ATTRIBUTES,
+        max_items=10**9,
+        max_wait_seconds=float("inf"),
+    )
+    export = None
+    if args.export_dir:
+        # Membros gzip concatenados continuam legíveis após uma retomada
+        export = gzip.open(
+            os.path.join(args.export_dir, f"segment-{segment:05d}.jsonl.gz"),
+            "at",
+            encoding="utf-8",
+        )
+
+    request = {
+        "TableName": args.table,
+        "Segment": segment,
+        "TotalSegments": args.segments,
+        "Limit": args.page_size,
+        "ReturnConsumedCapacity": "TOTAL",
+    }
+    started = time.monotonic()
+
+    try:
+        while True:
+            if state["last_evaluated_key"]:
+                request["ExclusiveStartKey"] = state["last_evaluated_key"]
+            response = scan_page(client, request, read_limiter, args.max_retries)
+
+            changed = []
+            export_lines = []
+            for raw in response.get("Items", []):
+                stored = ItemSerializer.deserialize(raw)
+                if export:
+                    export_lines.append(
+                        json.dumps(
+                            ClaimItemCodec.decode(stored),
+                            ensure_ascii=False,
+                            separators=(",", ":"),
+                            default=ClaimArchive._json_default,
+                        )
+                        + "\n"
+                    )
+                try:
+                    migrated = migrate_item(stored, transform)
+                except Exception as e:
+                    state["errors"] += 1
+                    logger.warning(
+                        "Falha ao transformar %s: %s", stored.get("sessionId"), e
+                    )
+                    continue
+                if migrated is not None:
+                    changed.append(migrated)
+
+            state["scanned"] += len(response.get("Items", []))
+            state["changed"] += len(changed)
+
+            if changed and not args.dry_run:
+                for item in changed:
+                    write_limiter.wait()
+                    write_limiter.consume(
+                        max(1, math.ceil(ClaimItemCodec.item_size(item) / 1024))
+                    )
+                    buffer.add(item)
+                failed = buffer.flush()
+                if failed:
+                    # Não avança o checkpoint: a página será relida na retomada
+                    state["errors"] += failed
+                    save_segment_checkpoint(path, state)
+                    return {**state, "failed": True}
+                state["written"] += len(changed)
+
+            # A página só entra na exportação quando o checkpoint vai avançar;
+            # uma página relida na retomada não é exportada de novo
+            if export:
+                export.write("".join(export_lines))
+                export.flush()
+            state["last_evaluated_key"] = response.get("LastEvaluatedKey")
+            state["done"] = state["last_evaluated_key"] is None
+            save_segment_checkpoint(path, state)
+            if state["done"]:
+                break
+
+    finally:
+        if export:
+            export.close()
+        buffer.executor.shutdown()
+
+    state["elapsed_seconds"] = round(time.monotonic() - started, 2)
+    return state
+
+
+# Transformação carregada uma vez por processo
+_worker_transform = None
+
+
+def _init_worker(transform_name):
+    global _worker_transform
+    _worker_transform = load_transform(transform_name)
+
+
+def _run_segment_in_worker(task):
+    args, segment = task
+    return run_segment(args, segment, _worker_transform)
+
+
+def run(args):
+    os.makedirs(args.checkpoint_dir, exist_ok=True)
+    if args.export_dir:
+        os.makedirs(args.export_dir, exist_ok=True)
+
+    # Falha cedo se a transformação não existir
+    load_transform(args.transform)
+
+    tasks = [(args, segment) for segment in range(args.segments)]
+    totals = Counter()
+    started = time.monotonic()
+
+    with Pool(
+        processes=args.workers, initializer=_init_worker, initargs=(args.transform,)
+    ) as pool:
+        for state in pool.imap_unordered(_run_segment_in_worker, tasks):
+            for field in ("scanned", "changed", "written", "errors"):
+                totals[field] += state.get(field, 0)
+            totals["segments_done"] += 1 if state.get("done") else 0
+            totals["segments_failed"] += 1 if state.get("failed") else 0
+            totals["segments_skipped"] += 1 if state.get("skipped") else 0
+            logger.warning(
+                "Segmento %d: %d lidos, %d alterados, %d gravados",
+                state["segment"],
+                state["scanned"],
+                state["changed"],
+                state["written"],
+            )
+
+    elapsed = time.monotonic() - started
+    summary = {
+        **totals,
+        "total_segments": args.segments,
+        "dry_run": args.dry_run,
+        "elapsed_seconds": round(elapsed, 2),
+        "items_per_second": round(totals["scanned"] / elapsed, 2) if elapsed else 0.0,
+    }
+    print(json.dumps(summary, indent=2, ensure_ascii=False))
+    return 0 if not totals["segments_failed"] and not totals["errors"] else 1
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Exporta/regrava a tabela de sinistros com Scan paralelo"
+    )
+    parser.add_argument("--table", default=os.environ.get("DYNAMO_TABLE"))
+    parser.add_argument(
+        "--checkpoint-dir", required=True, help="Diretório dos checkpoints por segmento"
+    )
+    parser.add_argument("--transform", default="all")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 4)
+    parser.add_argument(
+        "--segments", type=int, default=0, help="Segmentos do Scan (padrão: 4x workers)"
+    )
+    parser.add_argument("--page-size", type=int, default=500)
+    parser.add_argument(
+        "--max-rcu", type=float, default=1000.0, help="RCU por segundo (total)"
+    )
+    parser.add_argument(
+        "--max-wcu", type=float, default=500.0, help="WCU por segundo (total)"
+    )
+    parser.add_argument("--max-retries", type=int, default=8)
+    parser.add_argument(
+        "--export-dir", help="Também exporta os itens lidos em JSONL gzip"
+    )
+    parser.add_argument(
+        "--dry-run", action="store_true", help="Conta as alterações sem gravar"
+    )
+    parser.add_argument("--region", default=os.environ.get("AWS_REGION"))
+    args = parser.parse_args()
+
+    if not args.table:
+        parser.error("--table ou DYNAMO_TABLE é obrigatório")
+    args.segments = args.segments or args.workers * 4
+    if args.dry_run:
+        # Checkpoints próprios: um dry-run concluído não pode marcar como
+        # "done" os segmentos que a execução real ainda precisa gravar
+        args.checkpoint_dir = os.path.join(args.checkpoint_dir, "dry-run")
+    # DataManager (usado pelas transformações) lê tabela e região do ambiente
+    os.environ["DYNAMO_TABLE"] = args.table
+    if args.region:
+        os.environ["AWS_DEFAULT_REGION"] = args.region
+
+    logging.basicConfig(level=logging.WARNING, format="%(asctime)s %(message)s")
+    return run(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,160 @@
+"""
+Benchmark da busca de clínicas próximas (ClinicDirectory.nearest).
+
+Gera diretórios sintéticos (clínicas concentradas em capitais, como na base
+real) e mede, para cada tamanho, o tempo de construção do índice e a latência
+p50/p95 da busca top-k com filtros de plano e especialidade (inclusive uma
+especialidade rara), comparando com a varredura completa por haversine.
+Uma amostra das buscas é conferida contra a varredura. A coluna "todas"
+mede o ranqueamento vetorizado de todas as clínicas do diretório como
+candidatas (haversine em um passe + argpartition), sem a grade.
+
+Uso:
+    python back-end/benchmarks/bench_clinic_search.py [--sizes 1000,10000,100000,300000]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from orchestrator_lambda import ClinicDirectory  # noqa: E402
+
+# (lat, lon, peso) de algumas capitais
+CITIES = [
+    (-23.5505, -46.6333, 30),
+    (-22.9068, -43.1729, 15),
+    (-19.9167, -43.9345, 8),
+    (-15.7939, -47.8828, 6),
+    (-12.9714, -38.5014, 6),
+    (-30.0346, -51.2177, 6),
+    (-25.4284, -49.2733, 6),
+    (-8.0476, -34.8770, 5),
+    (-3.7319, -38.5267, 5),
+    (-3.1190, -60.0217, 3),
+]
+PLANS = ["basic", "premium"]
+SPECIALTIES = ["geral", "ortodontia", "endodontia", "periodontia", "implante"]
+# Especialidade rara (~0,2% das clínicas): exercita o ranqueamento direto
+RARE_SPECIALTY = "odontopediatria"
+
+
+def build_clinics(count, rng):
+    weights = [weight for _, _, weight in CITIES]
+    clinics = []
+    for index in range(count):
+        lat, lon, _ = rng.choices(CITIES, weights=weights)[0]
+        clinics.append(
+            {
+                "id": f"clinic_{index:07d}",
+                "name": f"Clínica {index}",
+                "lat": lat + rng.gauss(0, 0.15),
+                "lon": lon + rng.gauss(0, 0.15),
+                "accepted_plans": rng.sample(PLANS, rng.randint(1, 2)),
+                "specialties": ["geral"]
+                + rng.sample(SPECIALTIES[1:], 2)
+                + ([RARE_SPECIALTY] if rng.random() < 0.002 else []),
+            }
+        )
+    return clinics
+
+
+def brute_force(directory, lat, lon, k, plan_tier, specialty):
+    candidates = [
+        (directory.haversine_km(lat, lon, clinic["lat"], clinic["lon"]), clinic["id"])
+        for clinic in directory.clinics
+        if plan_tier in clinic["accepted_plans"]
+        and (specialty == "geral" or specialty in clinic["specialties"])
+    ]
+    candidates.sort()
+    return [
+        clinic_id
+        for distance, clinic_id in candidates[:k]
+        if distance <= ClinicDirectory.DEFAULT_MAX_DISTANCE_KM
+    ]
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", default="1000,10000,100000,300000")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    print(
+        f"{'clínicas':>10} {'índice (s)':>11} {'p50 (ms)':>9} {'p95 (ms)':>9} "
+        f"{'todas p50 (ms)':>15} {'varredura p50 (ms)':>19} {'speedup':>8}"
+    )
+    for size in (int(value) for value in args.sizes.split(",")):
+        rng = random.Random(args.seed)
+        clinics = build_clinics(size, rng)
+
+        started = time.perf_counter()
+        directory = ClinicDirectory(clinics, version="bench")
+        build_seconds = time.perf_counter() - started
+
+        queries = []
+        for _ in range(args.queries):
+            lat, lon, _ = rng.choice(CITIES)
+            queries.append(
+                (
+                    lat + rng.gauss(0, 0.2),
+                    lon + rng.gauss(0, 0.2),
+                    rng.choice(PLANS),
+                    rng.choice(SPECIALTIES + [RARE_SPECIALTY]),
+                )
+            )
+
+        indexed = []
+        for lat, lon, plan_tier, specialty in queries:
+            started = time.perf_counter()
+            directory.nearest(
+                lat, lon, k=args.k, plan_tier=plan_tier, specialty=specialty
+            )
+            indexed.append((time.perf_counter() - started) * 1000)
+
+        everything = np.arange(size, dtype=np.int32)
+        ranked_all = []
+        for lat, lon, _, _ in queries:
+            started = time.perf_counter()
+            directory._rank(
+                lat, lon, everything, args.k, ClinicDirectory.DEFAULT_MAX_DISTANCE_KM
+            )
+            ranked_all.append((time.perf_counter() - started) * 1000)
+
+        # A varredura completa é lenta: mede e confere uma amostra das consultas
+        scanned = []
+        for lat, lon, plan_tier, specialty in queries[: max(10, args.queries // 20)]:
+            started = time.perf_counter()
+            expected = brute_force(directory, lat, lon, args.k, plan_tier, specialty)
+            scanned.append((time.perf_counter() - started) * 1000)
+            found = [
+                clinic["id"]
+                for _, clinic in directory.nearest(
+                    lat, lon, k=args.k, plan_tier=plan_tier, specialty=specialty
+                )
+            ]
+            assert found == expected, (lat, lon, found, expected)
+
+        p50 = percentile(indexed, 0.5)
+        print(
+            f"{size:>10} {build_seconds:>11.2f} {p50:>9.3f} "
+            f"{percentile(indexed, 0.95):>9.3f} {percentile(ranked_all, 0.5):>15.3f} "
+            f"{percentile(scanned, 0.5):>19.2f} "
+            f"{percentile(scanned, 0.5) / p50:>7.0f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Microbenchmark da conversão de valores monetários.
+
+Compara a função anterior (re.sub + replace, um texto por chamada) com
+CurrencyParser.parse_batch, que recebe todos os textos de uma vez e retorna
+um array float64 e a máscara de validade. Também conta quantos textos a
+função anterior converte de forma incorreta (ex.: "1.000" lido como 1.0).
+
+Uso:
+    python back-end/benchmarks/bench_currency_parsing.py [--size 100000]
+"""
+
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from orchestrator_lambda import CurrencyParser  # noqa: E402
+
+
+def legacy_extract_currency_value(text):
+    """Implementação anterior de DocumentProcessor._extract_currency_value."""
+    try:
+        if not text:
+            return 0.0
+        clean_text = re.sub(r"[^\d,.]", "", text)
+        if "," in clean_text and "." in clean_text:
+            clean_text = clean_text.replace(".", "").replace(",", ".")
+        elif "," in clean_text:
+            clean_text = clean_text.replace(",", ".")
+        return float(clean_text) if clean_text else 0.0
+    except (ValueError, TypeError):
+        return 0.0
+
+
+def build_samples(size, seed=7):
+    """Gera textos monetários no formato brasileiro com o valor esperado."""
+    rng = random.Random(seed)
+    samples = []
+    expected = []
+
+    for _ in range(size):
+        reais = rng.choice([rng.randint(1, 999), rng.randint(1000, 9_999_999)])
+        cents = rng.randint(0, 99)
+        grouped = f"{reais:,}".replace(",", ".")
+        style = rng.randint(0, 3)
+        if style == 0:
+            text = f"R$ {grouped},{cents:02d}"
+        elif style == 1:
+            text = f"{grouped},{cents:02d}"
+        elif style == 2:
+            # Valor inteiro sem centavos, como aparece em muitos recibos
+            text, cents = f"R$ {grouped}", 0
+        else:
+            text = f"R${reais},{cents:02d}"
+        samples.append(text)
+        expected.append(reais + cents / 100)
+
+    return samples, expected
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--size", type=int, default=100_000)
+    parser.add_argument(
+        "--distinct",
+        type=int,
+        default=0,
+        help="Limita a quantidade de valores distintos (0 = todos distintos)",
+    )
+    args = parser.parse_args()
+
+    samples, expected = build_samples(args.distinct or args.size)
+    if args.distinct:
+        samples = [samples[i % args.distinct] for i in range(args.size)]
+        expected = [expected[i % args.distinct] for i in range(args.size)]
+
+    started = time.perf_counter()
+    legacy = [legacy_extract_currency_value(text) for text in samples]
+    legacy_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    values, valid = CurrencyParser.parse_batch(samples)
+    batch_seconds = time.perf_counter() - started
+
+    legacy_wrong = sum(abs(a - b) > 0.005 for a, b in zip(legacy, expected))
+    batch_wrong = sum(abs(a - b) > 0.005 for a, b in zip(values.tolist(), expected))
+
+    print(f"textos={args.size} distintos={args.distinct or args.size}")
+    print(
+        f"legado (por item):  {legacy_seconds * 1e6 / args.size:6.2f} µs/texto  "
+        f"incorretos={legacy_wrong}"
+    )
+    print(
+        f"parse_batch:        {batch_seconds * 1e6 / args.size:6.2f} µs/texto  "
+        f"incorretos={batch_wrong} inválidos={int((~valid).sum())}"
+    )
+
+
+if __name__ == "__main__":
+    main()
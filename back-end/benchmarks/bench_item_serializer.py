@@ -0,0 +1,107 @@
+"""
+Microbenchmark da serialização de itens para o DynamoDB.
+
+Compara ItemSerializer (conversores pré-resolvidos por atributo, aceita
+float) com o TypeSerializer do boto3 aplicado atributo a atributo, sobre
+itens de sinistro já codificados no esquema compacto (ClaimItemCodec).
+O TypeSerializer recebe uma cópia com floats convertidos para Decimal, já
+que rejeita floats.
+
+Uso:
+    python back-end/benchmarks/bench_item_serializer.py [--items 20000]
+"""
+
+import argparse
+import os
+import sys
+import timeit
+from decimal import Decimal
+
+from boto3.dynamodb.types import TypeSerializer
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from orchestrator_lambda import ClaimItemCodec, ItemSerializer  # noqa: E402
+
+
+def build_items(count):
+    """Itens de pré-aprovação e reembolso no formato gravado pelo DataManager."""
+    items = []
+    for index in range(count):
+        created_at = f"2025-03-01T10:{index // 60 % 60:02d}:{index % 60:02d}.000000"
+        if index % 2:
+            item = {
+                "sessionId": f"lex_{index:08d}",
+                "claimType": "pre_approval",
+                "processStep": "symptoms_analysis",
+                "createdAt": created_at,
+                "symptoms": "Dor no dente do siso inferior direito há três dias",
+                "planTier": "basic",
+                "location": "01310-100",
+                "diagnosis": {
+                    "urgency_level": "media",
+                    "possible_conditions": ["Cárie"],
+                },
+                "preApproval": {"approved": True, "coverage_percentage": 0.7},
+                "clinics": ["clinic_0001", "clinic_0002", "clinic_0003"],
+                "status": "processed",
+            }
+        else:
+            item = {
+                "sessionId": f"lex_{index:08d}",
+                "claimType": "reimbursement",
+                "processStep": "document_processing",
+                "createdAt": created_at,
+                "documentKey": f"uploads/{index}/nota.pdf",
+                "planTier": "premium",
+                "procedureValue": 350.0,
+                "reimbursementResult": {"status": "approved", "amount": 315.0},
+                "status": "approved",
+                "reimbursementAmount": 315.0,
+            }
+        items.append(ClaimItemCodec.encode(item))
+    return items
+
+
+def to_decimal(item):
+    return {
+        name: Decimal(repr(value)) if isinstance(value, float) else value
+        for name, value in item.items()
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--items", type=int, default=20_000)
+    args = parser.parse_args()
+
+    items = build_items(args.items)
+    decimal_items = [to_decimal(item) for item in items]
+
+    type_serializer = TypeSerializer()
+    item_serializer = ItemSerializer()
+
+    def with_type_serializer():
+        for item in decimal_items:
+            {name: type_serializer.serialize(value) for name, value in item.items()}
+
+    def with_item_serializer():
+        for item in items:
+            item_serializer.serialize(item)
+
+    assert item_serializer.serialize(decimal_items[0]) == {
+        name: type_serializer.serialize(value)
+        for name, value in decimal_items[0].items()
+    }
+
+    baseline = min(timeit.repeat(with_type_serializer, number=1, repeat=5))
+    current = min(timeit.repeat(with_item_serializer, number=1, repeat=5))
+
+    print(f"itens={args.items}")
+    print(f"TypeSerializer: {baseline * 1e6 / args.items:6.2f} µs/item")
+    print(f"ItemSerializer: {current * 1e6 / args.items:6.2f} µs/item")
+    print(f"ganho:          {baseline / current:6.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Microbenchmark do mapeamento de condições para procedimentos.
+
+Compara a busca ingênua (cada sinônimo do catálogo procurado no texto, custo
+proporcional ao tamanho do catálogo) com ProcedureMatcher, o autômato de
+Aho-Corasick sobre tokens compilado por PlanRules, usando o catálogo real
+acrescido de procedimentos sintéticos.
+
+Uso:
+    python back-end/benchmarks/bench_procedure_matcher.py [--procedures 20000]
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from orchestrator_lambda import PlanRules, ProcedureMatcher  # noqa: E402
+
+SYLLABLES = ["ca", "ri", "ge", "pul", "den", "to", "mo", "lar", "gi", "va", "ne", "so"]
+
+
+def build_catalog(size, synonyms, seed=7):
+    """Catálogo real mais procedimentos sintéticos com sinônimos de 1 a 3 palavras."""
+    rng = random.Random(seed)
+    with open(os.path.join(os.path.dirname(__file__), "..", PlanRules.RULES_FILE)) as f:
+        catalog = json.load(f)["procedures"]
+
+    def word():
+        return "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4)))
+
+    for index in range(size):
+        catalog[f"proc{index:06d}"] = [
+            " ".join(word() for _ in range(rng.randint(1, 3))) for _ in range(synonyms)
+        ]
+    return catalog
+
+
+def build_conditions(catalog, size, seed=11):
+    """Condições no estilo do Bedrock: um sinônimo cercado de texto livre."""
+    rng = random.Random(seed)
+    terms = [term for values in catalog.values() for term in values]
+    fillers = ["suspeita de", "possível", "quadro de", "com dor", "no dente 36", "leve"]
+    return [
+        f"{rng.choice(fillers)} {rng.choice(terms)} {rng.choice(fillers)}"
+        for _ in range(size)
+    ]
+
+
+def naive_find(patterns, text):
+    """Procura cada sinônimo (já tokenizado) no texto tokenizado."""
+    haystack = f" {' '.join(ProcedureMatcher.tokenize(text))} "
+    return {code for needle, code in patterns if needle in haystack}
+
+
+def timed(function):
+    started = time.perf_counter()
+    result = function()
+    return result, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--procedures", type=int, default=20_000)
+    parser.add_argument("--synonyms", type=int, default=5)
+    parser.add_argument("--conditions", type=int, default=2_000)
+    args = parser.parse_args()
+
+    catalog = build_catalog(args.procedures, args.synonyms)
+    conditions = build_conditions(catalog, args.conditions)
+
+    matcher, build_seconds = timed(lambda: ProcedureMatcher(catalog))
+    patterns = [
+        (f" {' '.join(ProcedureMatcher.tokenize(term))} ", code)
+        for code, terms in catalog.items()
+        for term in (code, *terms)
+    ]
+
+    # A busca ingênua é lenta demais para todas as condições
+    sample = conditions[: max(1, len(conditions) // 20)]
+    naive, naive_seconds = timed(
+        lambda: [naive_find(patterns, condition) for condition in sample]
+    )
+    fast, fast_seconds = timed(
+        lambda: [set(matcher.find(condition)) for condition in conditions]
+    )
+
+    # O matcher resolve sobreposições; basta que encontre algo sempre que a
+    # busca ingênua encontra
+    missing = sum(1 for old, new in zip(naive, fast) if old and not new)
+
+    naive_ms = naive_seconds * 1000 / len(sample)
+    fast_ms = fast_seconds * 1000 / len(conditions)
+    print(f"catálogo: {len(catalog):,} procedimentos, {len(patterns):,} termos")
+    print(f"compilação do autômato: {build_seconds * 1000:.0f} ms")
+    print(f"{'método':<22}{'ms/condição':>14}{'condições/s':>16}")
+    print(f"{'busca ingênua':<22}{naive_ms:>14.4f}{1000 / naive_ms:>16,.0f}")
+    print(f"{'ProcedureMatcher':<22}{fast_ms:>14.4f}{1000 / fast_ms:>16,.0f}")
+    print(f"speedup: {naive_ms / fast_ms:.0f}x, sem casamento no matcher: {missing}")
+
+
+if __name__ == "__main__":
+    main()
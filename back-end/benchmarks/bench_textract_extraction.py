@@ -0,0 +1,148 @@
+"""
+Benchmark da extração de dados do Textract AnalyzeExpense.
+
+Gera respostas sintéticas com várias páginas (ExpenseDocuments), muitos
+SummaryFields e LineItemGroups, e compara a extração por tabela de despacho
+(DocumentProcessor._extract_expense_data) com a cadeia de testes por
+substring usada anteriormente.
+
+Uso:
+    python back-end/benchmarks/bench_textract_extraction.py [--pages 50] [--items 40]
+"""
+
+import argparse
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from orchestrator_lambda import DocumentProcessor  # noqa: E402
+
+SUMMARY_TYPES = [
+    "TOTAL",
+    "SUBTOTAL",
+    "TAX",
+    "AMOUNT_PAID",
+    "INVOICE_RECEIPT_DATE",
+    "VENDOR_NAME",
+    "VENDOR_ADDRESS",
+    "INVOICE_RECEIPT_ID",
+    "RECEIVER_NAME",
+    "OTHER",
+]
+
+
+def _field(field_type, text, confidence):
+    return {
+        "Type": {"Text": field_type, "Confidence": confidence},
+        "ValueDetection": {"Text": text, "Confidence": confidence},
+    }
+
+
+def build_response(pages, items_per_page, seed=42):
+    """Monta uma resposta AnalyzeExpense sintética."""
+    rng = random.Random(seed)
+    documents = []
+
+    for page in range(pages):
+        summary_fields = []
+        for field_type in SUMMARY_TYPES:
+            if field_type in ("TOTAL", "SUBTOTAL", "TAX", "AMOUNT_PAID"):
+                text = f"R$ {rng.randint(1, 9)}.{rng.randint(100, 999)},{rng.randint(10, 99)}"
+            elif field_type == "INVOICE_RECEIPT_DATE":
+                text = f"{rng.randint(1, 28):02d}/{rng.randint(1, 12):02d}/2025"
+            else:
+                text = f"{field_type.lower()} página {page}"
+            summary_fields.append(_field(field_type, text, rng.uniform(60, 99.9)))
+
+        line_items = []
+        for item in range(items_per_page):
+            line_items.append(
+                {
+                    "LineItemExpenseFields": [
+                        _field(
+                            "ITEM", f"Procedimento {page}-{item}", rng.uniform(60, 99.9)
+                        ),
+                        _field(
+                            "PRICE",
+                            f"R$ {rng.randint(50, 900)},00",
+                            rng.uniform(60, 99.9),
+                        ),
+                        _field("QUANTITY", "1", rng.uniform(60, 99.9)),
+                        _field("EXPENSE_ROW", "linha", rng.uniform(60, 99.9)),
+                    ]
+                }
+            )
+
+        documents.append(
+            {
+                "ExpenseIndex": page + 1,
+                "SummaryFields": summary_fields,
+                "LineItemGroups": [{"LineItemGroupIndex": 1, "LineItems": line_items}],
+            }
+        )
+
+    return {"ExpenseDocuments": documents}
+
+
+def legacy_extract(processor, textract_response):
+    """Extração anterior: testes por substring, último campo vence."""
+    extracted_data = {}
+    for expense_doc in textract_response.get("ExpenseDocuments", []):
+        for summary_field in expense_doc.get("SummaryFields", []):
+            field_type = summary_field.get("Type", {}).get("Text", "").lower()
+            field_text = summary_field.get("ValueDetection", {}).get("Text", "")
+            if "total" in field_type or "amount" in field_type:
+                extracted_data["total_amount"] = processor._extract_currency_value(
+                    field_text
+                )
+            elif "date" in field_type:
+                extracted_data["date"] = field_text
+            elif "vendor" in field_type or "provider" in field_type:
+                extracted_data["provider_name"] = field_text
+            elif "description" in field_type:
+                extracted_data["procedure_description"] = field_text
+            elif "tax" in field_type:
+                extracted_data["tax_amount"] = processor._extract_currency_value(
+                    field_text
+                )
+    return extracted_data
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--pages", type=int, default=50)
+    parser.add_argument("--items", type=int, default=40)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    # Evita criar clientes AWS: apenas os métodos de extração são medidos
+    processor = DocumentProcessor.__new__(DocumentProcessor)
+    response = build_response(args.pages, args.items)
+
+    legacy = timeit.timeit(
+        lambda: legacy_extract(processor, response), number=args.repeat
+    )
+    current = timeit.timeit(
+        lambda: processor._extract_expense_data(response), number=args.repeat
+    )
+
+    result = processor._extract_expense_data(response)
+    print(f"páginas={args.pages} itens/página={args.items} repetições={args.repeat}")
+    print(
+        f"legado (só SummaryFields):     {legacy / args.repeat * 1000:8.2f} ms/resposta"
+    )
+    print(
+        f"despacho (+ LineItemGroups):   {current / args.repeat * 1000:8.2f} ms/resposta"
+    )
+    print(
+        f"procedimentos extraídos: {len(result.get('procedures', []))} "
+        f"total_amount={result.get('total_amount')} "
+        f"confiança={result.get('field_confidence', {}).get('total_amount')}"
+    )
+
+
+if __name__ == "__main__":
+    main()
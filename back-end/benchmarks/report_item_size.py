@@ -0,0 +1,179 @@
+"""
+Relatório do tamanho médio dos itens de sinistro antes e depois do esquema compacto.
+
+Monta itens de pré-aprovação, reembolso e busca com o formato gravado
+anteriormente (versão 1: nomes longos, clínicas completas, ARNs dos tópicos)
+e os codifica com ClaimItemCodec (versão 2). Mostra o tamanho médio estimado
+pelas regras do DynamoDB e as unidades de escrita (WCU, 1 KB) por item.
+
+Uso:
+    python back-end/benchmarks/report_item_size.py [--samples 1000]
+"""
+
+import argparse
+import math
+import os
+import random
+import sys
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from orchestrator_lambda import ClaimItemCodec  # noqa: E402
+
+TOPIC_ARN = "arn:aws:sns:us-east-1:123456789012:iamigos-dental-{}-notifications-prod"
+
+SYMPTOMS = [
+    "Dor forte no dente do siso inferior direito há três dias, piora à noite",
+    "Sensibilidade ao frio e ao doce nos dentes da frente, sangramento na gengiva "
+    "ao escovar e mau hálito persistente nas últimas semanas",
+    "Quebrei parte de um dente molar mastigando, sem dor no momento",
+]
+
+
+def build_clinic(index):
+    return {
+        "id": f"clinic_{index:04d}",
+        "name": f"Clínica Odontológica Sorriso Saudável Unidade {index}",
+        "address": f"Rua Principal, {100 + index} - Centro - São Paulo/SP",
+        "phone": "(11) 3333-4444",
+        "specialties": ["geral", "ortodontia", "endodontia"],
+        "accepted_plans": ["basic", "premium"],
+        "distance": f"{index * 0.7 + 0.4:.1f} km",
+    }
+
+
+def build_legacy_items(rng, created_at):
+    """Itens no formato da versão 1, como eram gravados pelo DataManager."""
+    session_id = f"lex_{created_at.strftime('%Y%m%d_%H%M%S_%f')}"
+    plan_tier = rng.choice(["basic", "premium"])
+
+    pre_approval = {
+        "sessionId": session_id,
+        "claimType": "pre_approval",
+        "processStep": "symptoms_analysis",
+        "createdAt": created_at.isoformat(),
+        "symptoms": rng.choice(SYMPTOMS),
+        "planTier": plan_tier,
+        "location": "01310-100",
+        "diagnosis": {
+            "possible_conditions": ["Cárie profunda", "Pulpite", "Pericoronarite"],
+            "urgency_level": rng.choice(["baixa", "media", "alta"]),
+            "recommended_actions": [
+                "Consulta de avaliação com clínico geral",
+                "Radiografia periapical",
+            ],
+            "coverage_probability": "media",
+            "estimated_complexity": "moderado",
+        },
+        "preApproval": {
+            "approved": True,
+            "plan_tier": plan_tier,
+            "coverage_percentage": Decimal("0.7"),
+            "max_coverage": Decimal("300.0"),
+            "urgency_level": "media",
+            "complexity": "moderado",
+        },
+        "clinics": [build_clinic(index) for index in range(5)],
+        "status": "processed",
+        "notificationTopics": {
+            "clientes": TOPIC_ARN.format("client"),
+            "dentistas": TOPIC_ARN.format("dentist"),
+        },
+    }
+
+    amount = Decimal(str(rng.randint(100, 900)))
+    reimbursement = {
+        "sessionId": session_id,
+        "claimType": "reimbursement",
+        "processStep": "document_processing",
+        "createdAt": created_at.isoformat(),
+        "documentKey": f"uploads/2025/03/{session_id}/nota-fiscal.pdf",
+        "planTier": plan_tier,
+        "procedureValue": amount,
+        "reimbursementResult": {
+            "status": "approved",
+            "amount": amount * Decimal("0.7"),
+            "percentage": Decimal("0.7"),
+            "original_amount": amount,
+            "max_allowed": Decimal("300.0"),
+            "message": f"Reembolso aprovado no valor de R$ {amount * Decimal('0.7'):.2f}",
+        },
+        "status": "approved",
+        "reimbursementAmount": amount * Decimal("0.7"),
+        "documentData": {
+            "total_amount": amount,
+            "date": "05/03/2025",
+            "provider_name": "Clínica Odontológica Sorriso Saudável LTDA...",
+            "fields_count": 9,
+        },
+        "notificationTopics": {
+            "clientes": TOPIC_ARN.format("client"),
+            "dentistas": "none",
+        },
+    }
+
+    search = {
+        "sessionId": session_id,
+        "claimType": "dentist_search",
+        "processStep": "clinic_search",
+        "createdAt": created_at.isoformat(),
+        "location": "01310-100",
+        "planTier": plan_tier,
+        "specialty": "geral",
+        "dentistsFound": 5,
+        "status": "completed",
+    }
+
+    return {
+        "pre_approval": pre_approval,
+        "reimbursement": reimbursement,
+        "dentist_search": search,
+    }
+
+
+def compact(item):
+    """Aplica as mudanças de conteúdo do DataManager e codifica na versão 2."""
+    item = dict(item)
+    if "clinics" in item:
+        item["clinics"] = ClaimItemCodec.clinic_references(item["clinics"])
+    return ClaimItemCodec.encode(item)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--samples", type=int, default=1000)
+    args = parser.parse_args()
+
+    rng = random.Random(3)
+    start = datetime(2025, 3, 1)
+    sizes = {}
+
+    for index in range(args.samples):
+        created_at = start + timedelta(seconds=index * 37)
+        for claim_type, item in build_legacy_items(rng, created_at).items():
+            before = ClaimItemCodec.item_size(item)
+            encoded = compact(item)
+            after = ClaimItemCodec.item_size(encoded)
+            assert ClaimItemCodec.decode(encoded)["claimType"] == claim_type
+            totals = sizes.setdefault(claim_type, [0, 0, 0, 0])
+            totals[0] += before
+            totals[1] += after
+            totals[2] += math.ceil(before / 1024)
+            totals[3] += math.ceil(after / 1024)
+
+    print(f"amostras por tipo={args.samples}")
+    print(
+        f"{'tipo':<16}{'v1 bytes':>10}{'v2 bytes':>10}{'redução':>10}{'WCU v1':>8}{'WCU v2':>8}"
+    )
+    for claim_type, (before, after, wcu_before, wcu_after) in sizes.items():
+        print(
+            f"{claim_type:<16}{before / args.samples:>10.0f}{after / args.samples:>10.0f}"
+            f"{1 - after / before:>10.0%}{wcu_before / args.samples:>8.2f}"
+            f"{wcu_after / args.samples:>8.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
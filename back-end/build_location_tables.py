@@ -0,0 +1,179 @@
+"""
+Gera as tabelas offline do LocationResolver.
+
+Produz, no diretório de saída:
+    cep_prefixes.npy  tabela ordenada (prefixo de 5 dígitos, lat, lon) com o
+                      centroide de cada prefixo, aberta com mmap pela Lambda
+    cities.json       municípios (nome, UF, lat, lon) para o índice de trigramas
+
+Fontes aceitas: CSV de CEPs geocodificados (colunas cep, lat/latitude,
+lon/longitude), snapshot do diretório de clínicas (cada clínica com CEP e
+coordenadas contribui para o centroide) e CSV de municípios (colunas
+nome/name, uf ou codigo_uf, lat/latitude, lon/longitude, como o do IBGE).
+
+Uso:
+    python back-end/build_location_tables.py --ceps ceps.csv \\
+        --cities municipios.csv --output-dir SAM-test/data
+    python back-end/build_location_tables.py \\
+        --clinic-snapshot directory.json.gz --output-dir SAM-test/data
+"""
+
+import argparse
+import csv
+import gzip
+import json
+import os
+import re
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from orchestrator_lambda import LocationResolver  # noqa: E402
+
+# Códigos de UF do IBGE
+UF_CODES = {
+    "11": "RO", "12": "AC", "13": "AM", "14": "RR", "15": "PA", "16": "AP",
+    "17": "TO", "21": "MA", "22": "PI", "23": "CE", "24": "RN", "25": "PB",
+    "26": "PE", "27": "AL", "28": "SE", "29": "BA", "31": "MG", "32": "ES",
+    "33": "RJ", "35": "SP", "41": "PR", "42": "SC", "43": "RS", "50": "MS",
+    "51": "MT", "52": "GO", "53": "DF",
+}  # fmt: skip
+
+
+def first_column(row, *names):
+    for name in names:
+        if row.get(name) not in (None, ""):
+            return row[name]
+    return None
+
+
+def open_text(path, encoding="utf-8-sig"):
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding=encoding, newline="")
+    return open(path, encoding=encoding, newline="")
+
+
+def sniff_reader(handle):
+    sample = handle.read(4096)
+    handle.seek(0)
+    dialect = csv.Sniffer().sniff(sample, delimiters=",;\t|")
+    return csv.DictReader(handle, dialect=dialect)
+
+
+def iter_cep_points(path):
+    """(cep, lat, lon) de um CSV de CEPs geocodificados."""
+    with open_text(path) as handle:
+        for row in sniff_reader(handle):
+            row = {name.strip().lower(): value for name, value in row.items() if name}
+            cep = first_column(row, "cep", "postal_code")
+            lat = first_column(row, "lat", "latitude")
+            lon = first_column(row, "lon", "lng", "longitude")
+            if cep and lat and lon:
+                yield cep, float(lat.replace(",", ".")), float(lon.replace(",", "."))
+
+
+def iter_clinic_points(path):
+    """(cep, lat, lon) das clínicas de um snapshot do diretório."""
+    with open(path, "rb") as handle:
+        body = handle.read()
+    if body[:2] == b"\x1f\x8b":
+        body = gzip.decompress(body)
+    for clinic in json.loads(body).get("clinics", []):
+        if clinic.get("cep") and clinic.get("lat") is not None:
+            yield clinic["cep"], float(clinic["lat"]), float(clinic["lon"])
+
+
+def build_cep_table(points):
+    """Centroide por prefixo de 5 dígitos, ordenado para busca binária."""
+    sums = {}
+    for cep, lat, lon in points:
+        digits = re.sub(r"\D", "", cep)
+        if len(digits) != 8 or not (-35 <= lat <= 6 and -75 <= lon <= -28):
+            # Fora do território brasileiro: coordenada inválida
+            continue
+        entry = sums.setdefault(int(digits[:5]), [0.0, 0.0, 0])
+        entry[0] += lat
+        entry[1] += lon
+        entry[2] += 1
+
+    table = np.zeros(len(sums), dtype=LocationResolver.CEP_DTYPE)
+    for position, prefix in enumerate(sorted(sums)):
+        sum_lat, sum_lon, count = sums[prefix]
+        table[position] = (prefix, sum_lat / count, sum_lon / count)
+    return table
+
+
+def load_cities(path):
+    cities = []
+    with open_text(path) as handle:
+        for row in sniff_reader(handle):
+            row = {name.strip().lower(): value for name, value in row.items() if name}
+            name = first_column(row, "nome", "name", "municipio", "cidade")
+            lat = first_column(row, "lat", "latitude")
+            lon = first_column(row, "lon", "lng", "longitude")
+            uf = first_column(row, "uf", "estado", "sigla_uf")
+            if not uf:
+                uf = UF_CODES.get(str(first_column(row, "codigo_uf") or ""), "")
+            if name and lat and lon:
+                cities.append(
+                    {
+                        "name": name.strip(),
+                        "uf": uf.strip().upper(),
+                        "lat": round(float(lat.replace(",", ".")), 5),
+                        "lon": round(float(lon.replace(",", ".")), 5),
+                    }
+                )
+    return cities
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Gera as tabelas offline de CEP e municípios"
+    )
+    parser.add_argument("--ceps", action="append", default=[], help="CSV de CEPs")
+    parser.add_argument(
+        "--clinic-snapshot",
+        action="append",
+        default=[],
+        help="Snapshot do diretório de clínicas (JSON, opcionalmente gzip)",
+    )
+    parser.add_argument("--cities", help="CSV de municípios")
+    parser.add_argument("--output-dir", required=True)
+    args = parser.parse_args()
+
+    if not (args.ceps or args.clinic_snapshot or args.cities):
+        parser.error("informe --ceps, --clinic-snapshot e/ou --cities")
+    os.makedirs(args.output_dir, exist_ok=True)
+    summary = {}
+
+    if args.ceps or args.clinic_snapshot:
+
+        def points():
+            for path in args.ceps:
+                yield from iter_cep_points(path)
+            for path in args.clinic_snapshot:
+                yield from iter_clinic_points(path)
+
+        table = build_cep_table(points())
+        np.save(os.path.join(args.output_dir, LocationResolver.CEP_TABLE_FILE), table)
+        summary["cep_prefixes"] = len(table)
+        summary["cep_table_bytes"] = table.nbytes
+
+    if args.cities:
+        cities = load_cities(args.cities)
+        with open(
+            os.path.join(args.output_dir, LocationResolver.CITIES_FILE),
+            "w",
+            encoding="utf-8",
+        ) as output:
+            json.dump(cities, output, ensure_ascii=False, separators=(",", ":"))
+        summary["cities"] = len(cities)
+
+    print(json.dumps(summary, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
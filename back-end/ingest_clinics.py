@@ -0,0 +1,593 @@
+"""
+Gera o snapshot do diretório de clínicas a partir de exportações de cadastro.
+
+Lê em streaming (uma passada, memória proporcional às clínicas mantidas e não
+às linhas do arquivo) CSVs de estabelecimentos como o tbEstabelecimento do
+CNES (separador e colunas detectados; nomes do CNES ou genéricos: id, nome,
+cep, lat, lon...). Arquivos auxiliares opcionais associam estabelecimentos a
+especialidades e a planos aceitos. Para cada linha:
+
+    - mantém só estabelecimentos odontológicos: com serviço odontológico
+      associado (códigos de serviço do CNES, --dental-service-codes, ou
+      descrição com termo odontológico) ou nome com termo odontológico em
+      palavra inteira; --all mantém todos
+    - normaliza nome, endereço, telefone, especialidades e planos
+    - deduplica por código e por (nome, CEP, número), unindo as listas;
+      sem CEP só o código deduplica
+    - clínicas sem credenciamento informado ficam sem planos aceitos, a menos
+      que --default-plans indique explicitamente quais assumir
+    - usa as coordenadas do cadastro quando válidas; senão geocodifica pelo
+      LocationResolver (CEP e, na falta, cidade) com cache persistente em
+      arquivo JSON reaproveitado entre execuções
+
+A saída é o snapshot JSON (gzip) carregado pela Lambda (ClinicDirectory),
+gravado em arquivo local ou em s3://bucket/chave.
+
+Uso:
+    python back-end/ingest_clinics.py --establishments tbEstabelecimento.csv \\
+        --specialties servicos.csv --plans credenciamento.csv --encoding latin-1 \\
+        --output s3://meu-bucket/clinics/directory.json.gz
+    python back-end/ingest_clinics.py --establishments clinicas.csv --all \\
+        --default-plans basic --output directory.json.gz
+"""
+
+import argparse
+import csv
+import gzip
+import json
+import logging
+import os
+import re
+import sys
+import time
+import unicodedata
+from collections import Counter
+from datetime import datetime
+from functools import lru_cache
+
+import boto3
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from build_location_tables import (  # noqa: E402
+    UF_CODES,
+    first_column,
+    open_text,
+    sniff_reader,
+)
+from orchestrator_lambda import LocationResolver  # noqa: E402
+
+logger = logging.getLogger("ingest_clinics")
+
+# Termo (sem acento, minúsculo) -> especialidade usada pelo bot. Termos
+# genéricos (cirurgia, radiologia...) só valem em serviço já odontológico
+SPECIALTY_TERMS = [
+    ("odontoped", "odontopediatria"),
+    ("ortodon", "ortodontia"),
+    ("ortopedia funcional", "ortodontia"),
+    ("endodon", "endodontia"),
+    ("periodon", "periodontia"),
+    ("implant", "implante"),
+    ("protese", "protese"),
+    ("cirurgia", "cirurgia"),
+    ("bucomaxilo", "cirurgia"),
+    ("estomatolog", "estomatologia"),
+    ("radiolog", "radiologia"),
+    ("clinico geral", "geral"),
+    ("clinica geral", "geral"),
+    ("atencao basica", "geral"),
+    ("saude bucal", "geral"),
+    ("odontolog", "geral"),
+]
+PLAN_ALIASES = {
+    "basic": "basic",
+    "basico": "basic",
+    "essencial": "basic",
+    "premium": "premium",
+    "plus": "premium",
+    "completo": "premium",
+}
+# Termos odontológicos em palavra inteira ("Presidente" e "Independente"
+# não contam)
+DENTAL_TERM_PATTERN = re.compile(
+    r"\bodonto|\b(?:orto|endo|perio|implanto)don|\bdent(?:e|es|al|ais|ista|istas"
+    r"|ario|aria|arios|arias)\b|\bsorriso|\boral\b|\bbuca(?:l|is)\b|bucomaxilo"
+    r"|\bestomatolog"
+)
+# Serviço especializado 114 do CNES (Serviço de Atenção à Saúde Bucal)
+DENTAL_SERVICE_CODES = ("114",)
+SERVICE_CODE_COLUMNS = ("co_servico", "co_servico_especializado", "codigo_servico")
+SPECIALTY_COLUMNS = (
+    "ds_servico_especializado",
+    "ds_classificacao",
+    "especialidade",
+    "specialty",
+    "servico",
+)
+NON_DIGITS = re.compile(r"\D")
+SEPARATORS = re.compile(r"[|;,/]")
+LEGAL_SUFFIXES = {"ltda", "me", "epp", "eireli", "sa", "s/a", "s.a", "ss", "mei"}
+LOWERCASE_WORDS = {"de", "da", "do", "das", "dos", "e"}
+ID_COLUMNS = ("co_cnes", "cnes", "id", "codigo", "co_unidade")
+
+
+# Nomes, bairros e especialidades se repetem muito nos cadastros: caches
+# limitados evitam renormalizar o mesmo texto a cada linha
+@lru_cache(maxsize=65536)
+def fold(text):
+    """Minúsculas, sem acentos e com espaços simples."""
+    text = unicodedata.normalize("NFKD", str(text or ""))
+    text = text.encode("ascii", "ignore").decode("ascii")
+    return " ".join(text.lower().split())
+
+
+def dict_reader(handle):
+    """DictReader com os nomes de coluna em minúsculas (normalizados uma vez)."""
+    reader = sniff_reader(handle)
+    reader.fieldnames = [name.strip().lower() for name in reader.fieldnames]
+    return reader
+
+
+@lru_cache(maxsize=65536)
+def title_case(text):
+    words = " ".join(str(text or "").split()).lower().split(" ")
+    return " ".join(
+        word if index and word in LOWERCASE_WORDS else word[:1].upper() + word[1:]
+        for index, word in enumerate(words)
+        if word
+    )
+
+
+@lru_cache(maxsize=65536)
+def normalize_name(text):
+    """Nome fantasia em título, sem sufixos societários (LTDA, ME...)."""
+    words = " ".join(str(text or "").split()).split(" ")
+    while len(words) > 1 and words[-1].lower().strip(".-,") in LEGAL_SUFFIXES:
+        words.pop()
+    return title_case(" ".join(words).strip(" -,"))
+
+
+def normalize_specialties(values, dental=False):
+    """
+    Especialidades do bot para descrições de serviço. Sem dental=True (serviço
+    já sabidamente odontológico), só valores com termo odontológico contam.
+    """
+    specialties = set()
+    for value in values:
+        folded = fold(value)
+        if not (dental or DENTAL_TERM_PATTERN.search(folded)):
+            continue
+        for term, specialty in SPECIALTY_TERMS:
+            if term in folded:
+                specialties.add(specialty)
+                break
+        else:
+            specialties.add("geral")
+    return specialties
+
+
+def normalize_plans(values):
+    return {
+        PLAN_ALIASES[fold(value)] for value in values if fold(value) in PLAN_ALIASES
+    }
+
+
+def format_cep(value):
+    digits = NON_DIGITS.sub("", str(value or ""))
+    return f"{digits[:5]}-{digits[5:]}" if len(digits) == 8 else None
+
+
+def format_phone(value):
+    digits = NON_DIGITS.sub("", str(value or ""))
+    if len(digits) in (10, 11):
+        return f"({digits[:2]}) {digits[2:-4]}-{digits[-4:]}"
+    return " ".join(str(value or "").split()) or None
+
+
+def parse_coordinates(lat, lon):
+    """(lat, lon) do cadastro, ou None se ausente ou fora do Brasil."""
+    try:
+        lat = float(str(lat).replace(",", "."))
+        lon = float(str(lon).replace(",", "."))
+    except (TypeError, ValueError):
+        return None
+    if not (-35 <= lat <= 6 and -75 <= lon <= -28):
+        return None
+    return lat, lon
+
+
+def split_values(text):
+    if not text:
+        return []
+    return [value for value in SEPARATORS.split(text) if value.strip()]
+
+
+def load_side_table(path, encoding, value_columns, normalize):
+    """{código do estabelecimento: set(valores normalizados)} de um CSV."""
+    table = {}
+    with open_text(path, encoding) as handle:
+        for row in dict_reader(handle):
+            values = normalize(split_values(first_column(row, *value_columns)))
+            if not values:
+                continue
+            for column in ID_COLUMNS:
+                if row.get(column):
+                    table.setdefault(row[column].strip(), set()).update(values)
+    return table
+
+
+def load_specialties(path, encoding, dental_codes):
+    """
+    {código do estabelecimento: set(especialidades)} do arquivo de serviços.
+
+    Com coluna de código de serviço (rlEstabServClass do CNES), só as linhas
+    dos códigos odontológicos contam; sem ela, cada descrição precisa ter
+    termo odontológico.
+    """
+    table = {}
+    with open_text(path, encoding) as handle:
+        for row in dict_reader(handle):
+            code = first_column(row, *SERVICE_CODE_COLUMNS)
+            if code is not None:
+                code = NON_DIGITS.sub("", code).lstrip("0")
+                if code not in dental_codes:
+                    continue
+            values = split_values(first_column(row, *SPECIALTY_COLUMNS))
+            specialties = normalize_specialties(values, dental=code is not None)
+            if code is not None and not specialties:
+                specialties = {"geral"}
+            if not specialties:
+                continue
+            for column in ID_COLUMNS:
+                if row.get(column):
+                    table.setdefault(row[column].strip(), set()).update(specialties)
+    return table
+
+
+def load_municipalities(path, encoding):
+    """{código IBGE (6 dígitos): (nome, UF)}."""
+    municipalities = {}
+    with open_text(path, encoding) as handle:
+        for row in dict_reader(handle):
+            code = NON_DIGITS.sub(
+                "",
+                first_column(row, "codigo_ibge", "codigo_municipio", "co_municipio")
+                or "",
+            )
+            name = first_column(row, "nome", "name", "municipio", "no_municipio")
+            uf = first_column(row, "uf", "sigla_uf") or UF_CODES.get(code[:2], "")
+            if len(code) >= 6 and name:
+                municipalities[code[:6]] = (name.strip(), uf.strip().upper())
+    return municipalities
+
+
+class GeocodeCache:
+    """Cache persistente (JSON) das coordenadas resolvidas por CEP/cidade."""
+
+    def __init__(self, resolver, path=None):
+        self.resolver = resolver
+        self.path = path
+        self.entries = {}
+        self.stats = Counter()
+        if path and os.path.exists(path):
+            with open(path, encoding="utf-8") as cache_file:
+                self.entries = json.load(cache_file)
+
+    def _lookup(self, key, resolve):
+        if key in self.entries:
+            self.stats["hits"] += 1
+        else:
+            self.stats["misses"] += 1
+            coordinates = resolve()
+            self.entries[key] = list(coordinates) if coordinates else None
+        return tuple(self.entries[key]) if self.entries[key] else None
+
+    def geocode(self, cep, city, uf):
+        """((lat, lon), origem) pelo CEP e, na falta, pela cidade."""
+        if cep:
+            coordinates = self._lookup(
+                f"cep:{cep}", lambda: self.resolver.resolve_cep(cep)
+            )
+            if coordinates:
+                return coordinates, "cep"
+        if city:
+            query = f"{city} - {uf}" if uf else city
+            coordinates = self._lookup(
+                f"city:{fold(query)}", lambda: self.resolver.resolve_city(query)
+            )
+            if coordinates:
+                return coordinates, "city"
+        return None, None
+
+    def save(self):
+        if not self.path:
+            return
+        # Escrita atômica: o cache nunca fica truncado
+        temporary = f"{self.path}.tmp"
+        with open(temporary, "w", encoding="utf-8") as cache_file:
+            json.dump(self.entries, cache_file, separators=(",", ":"))
+        os.replace(temporary, self.path)
+
+
+def iter_establishments(path, encoding):
+    with open_text(path, encoding) as handle:
+        yield from dict_reader(handle)
+
+
+def build_clinic(row, specialties_by_id, plans_by_id, municipalities, args):
+    """Clínica normalizada (sem coordenadas) ou None se não for odontológica."""
+    keys = [row[column].strip() for column in ID_COLUMNS if row.get(column)]
+    if not keys:
+        return None
+
+    raw_name = first_column(row, "no_fantasia", "nome_fantasia", "nome", "name")
+    raw_name = raw_name or first_column(row, "no_razao_social", "razao_social")
+    if not raw_name:
+        return None
+
+    dental_name = bool(DENTAL_TERM_PATTERN.search(fold(raw_name)))
+    specialties = set()
+    plans = set()
+    for key in keys:
+        specialties |= specialties_by_id.get(key, set())
+        plans |= plans_by_id.get(key, set())
+    specialties |= normalize_specialties(
+        split_values(first_column(row, "especialidades", "specialties")),
+        dental=args.all or dental_name,
+    )
+    plans |= normalize_plans(
+        split_values(first_column(row, "planos", "accepted_plans", "plans"))
+    )
+
+    if not (args.all or specialties or dental_name):
+        return None
+
+    code = NON_DIGITS.sub("", first_column(row, "co_municipio_gestor", "co_ibge") or "")
+    city, uf = municipalities.get(code[:6], (None, None))
+    city = city or first_column(row, "no_municipio", "municipio", "cidade", "city")
+    uf = uf or first_column(row, "sg_uf", "uf", "estado", "state")
+    uf = uf or UF_CODES.get(str(first_column(row, "co_estado_gestor") or ""))
+
+    street = title_case(first_column(row, "no_logradouro", "logradouro", "endereco"))
+    number = (first_column(row, "nu_endereco", "numero") or "").strip()
+    district = title_case(first_column(row, "no_bairro", "bairro"))
+    address = ", ".join(part for part in (street, number) if part)
+    if district:
+        address = f"{address} - {district}" if address else district
+
+    return {
+        "id": f"{args.id_prefix}{keys[0]}",
+        "name": normalize_name(raw_name),
+        "address": address,
+        "city": title_case(city) if city else None,
+        "state": uf.strip().upper() if uf else None,
+        "cep": format_cep(first_column(row, "co_cep", "cep")),
+        "phone": format_phone(first_column(row, "nu_telefone", "telefone", "phone")),
+        "specialties": sorted(specialties | {"geral"}),
+        "accepted_plans": sorted(plans or set(args.default_plans)),
+        "coordinates": parse_coordinates(
+            first_column(row, "nu_latitude", "latitude", "lat"),
+            first_column(row, "nu_longitude", "longitude", "lon", "lng"),
+        ),
+    }
+
+
+def dedup_key(clinic):
+    # Sem CEP o nome sozinho juntaria clínicas homônimas de cidades diferentes
+    if not clinic["cep"]:
+        return None
+    number = NON_DIGITS.sub("", clinic["address"].split(",")[-1].split("-")[0])
+    return fold(clinic["name"]), clinic["cep"], number
+
+
+def merge(existing, clinic):
+    existing["specialties"] = sorted(
+        set(existing["specialties"]) | set(clinic["specialties"])
+    )
+    existing["accepted_plans"] = sorted(
+        set(existing["accepted_plans"]) | set(clinic["accepted_plans"])
+    )
+    for field in ("phone", "cep", "city", "state", "address"):
+        existing[field] = existing[field] or clinic[field]
+    existing["coordinates"] = existing["coordinates"] or clinic["coordinates"]
+
+
+def write_snapshot(snapshot, output):
+    body = gzip.compress(
+        json.dumps(snapshot, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    )
+    if output.startswith("s3://"):
+        bucket, _, key = output[len("s3://") :].partition("/")
+        boto3.client("s3").put_object(
+            Bucket=bucket, Key=key, Body=body, ContentType="application/json"
+        )
+    else:
+        with open(output, "wb") as snapshot_file:
+            snapshot_file.write(body)
+    return len(body)
+
+
+def run(args):
+    started = time.monotonic()
+    dental_codes = {code.lstrip("0") for code in args.dental_service_codes}
+    specialties_by_id = {}
+    for path in args.specialties:
+        for key, specialties in load_specialties(
+            path, args.encoding, dental_codes
+        ).items():
+            specialties_by_id.setdefault(key, set()).update(specialties)
+    plans_by_id = {}
+    for path in args.plans:
+        plans_by_id.update(
+            load_side_table(
+                path, args.encoding, ("plano", "plan", "planos"), normalize_plans
+            )
+        )
+    municipalities = (
+        load_municipalities(args.municipalities, args.encoding)
+        if args.municipalities
+        else {}
+    )
+
+    resolver = LocationResolver.from_directory(args.location_data)
+    geocoder = GeocodeCache(resolver, args.geocode_cache)
+
+    clinics = {}
+    ids_by_dedup_key = {}
+    stats = Counter()
+    next_progress = args.progress_every
+
+    for path in args.establishments:
+        for row in iter_establishments(path, args.encoding):
+            stats["rows"] += 1
+            if stats["rows"] >= next_progress:
+                next_progress += args.progress_every
+                logger.warning(
+                    "%d linhas, %d clínicas (%.0f linhas/s)",
+                    stats["rows"],
+                    len(clinics),
+                    stats["rows"] / (time.monotonic() - started),
+                )
+
+            clinic = build_clinic(
+                row, specialties_by_id, plans_by_id, municipalities, args
+            )
+            if clinic is None:
+                stats["skipped_not_dental"] += 1
+                continue
+
+            key = dedup_key(clinic)
+            existing_id = (
+                clinic["id"]
+                if clinic["id"] in clinics
+                else key and ids_by_dedup_key.get(key)
+            )
+            if existing_id:
+                merge(clinics[existing_id], clinic)
+                stats["duplicates_merged"] += 1
+                continue
+            clinics[clinic["id"]] = clinic
+            if key:
+                ids_by_dedup_key[key] = clinic["id"]
+
+    output_clinics = []
+    for clinic in clinics.values():
+        coordinates, source = clinic.pop("coordinates"), "registry"
+        if coordinates is None:
+            coordinates, source = geocoder.geocode(
+                clinic["cep"], clinic["city"], clinic["state"]
+            )
+        if coordinates is None:
+            stats["skipped_no_location"] += 1
+            continue
+        stats[f"located_by_{source}"] += 1
+        clinic["lat"], clinic["lon"] = round(coordinates[0], 6), round(
+            coordinates[1], 6
+        )
+        output_clinics.append(
+            {field: value for field, value in clinic.items() if value is not None}
+        )
+    geocoder.save()
+
+    output_clinics.sort(key=lambda clinic: clinic["id"])
+    version = args.version or datetime.utcnow().strftime("%Y%m%dT%H%M%SZ")
+    snapshot_bytes = write_snapshot(
+        {
+            "version": version,
+            "generated_at": datetime.utcnow().isoformat(),
+            "sources": [os.path.basename(path) for path in args.establishments],
+            "clinics": output_clinics,
+        },
+        args.output,
+    )
+
+    elapsed = time.monotonic() - started
+    summary = {
+        "version": version,
+        "output": args.output,
+        "rows": stats["rows"],
+        "clinics": len(output_clinics),
+        "skipped_not_dental": stats["skipped_not_dental"],
+        "duplicates_merged": stats["duplicates_merged"],
+        "skipped_no_location": stats["skipped_no_location"],
+        "located_by_registry": stats["located_by_registry"],
+        "located_by_cep": stats["located_by_cep"],
+        "located_by_city": stats["located_by_city"],
+        "geocode_cache_hits": geocoder.stats["hits"],
+        "geocode_cache_misses": geocoder.stats["misses"],
+        "snapshot_bytes": snapshot_bytes,
+        "elapsed_seconds": round(elapsed, 2),
+        "rows_per_second": round(stats["rows"] / elapsed, 1) if elapsed else 0.0,
+    }
+    print(json.dumps(summary, indent=2, ensure_ascii=False))
+    return 0 if output_clinics else 1
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Gera o snapshot do diretório de clínicas a partir de CSVs"
+    )
+    parser.add_argument(
+        "--establishments",
+        action="append",
+        required=True,
+        help="CSV de estabelecimentos (ex.: tbEstabelecimento do CNES)",
+    )
+    parser.add_argument(
+        "--specialties",
+        action="append",
+        default=[],
+        help="CSV estabelecimento -> serviço/especialidade",
+    )
+    parser.add_argument(
+        "--dental-service-codes",
+        nargs="+",
+        default=list(DENTAL_SERVICE_CODES),
+        help="Códigos de serviço do CNES considerados odontológicos",
+    )
+    parser.add_argument(
+        "--plans", action="append", default=[], help="CSV estabelecimento -> plano"
+    )
+    parser.add_argument("--municipalities", help="CSV de municípios do IBGE")
+    parser.add_argument(
+        "--default-plans",
+        nargs="+",
+        default=[],
+        help="Planos assumidos para clínicas sem credenciamento informado "
+        "(padrão: nenhum)",
+    )
+    parser.add_argument(
+        "--all",
+        action="store_true",
+        help="Mantém todos os estabelecimentos (arquivo já filtrado)",
+    )
+    parser.add_argument("--id-prefix", default="cnes_")
+    parser.add_argument("--encoding", default="utf-8-sig")
+    parser.add_argument(
+        "--location-data",
+        default=os.environ.get(
+            "LOCATION_DATA_DIR",
+            os.path.join(
+                os.path.dirname(os.path.abspath(__file__)), "..", "SAM-test", "data"
+            ),
+        ),
+        help="Diretório com as tabelas do LocationResolver",
+    )
+    parser.add_argument(
+        "--geocode-cache",
+        default="geocode-cache.json",
+        help="Arquivo do cache de geocodificação ('' desativa)",
+    )
+    parser.add_argument("--version", help="Versão do snapshot (padrão: data/hora)")
+    parser.add_argument("--output", required=True, help="Arquivo ou s3://bucket/chave")
+    parser.add_argument("--progress-every", type=int, default=500000)
+    args = parser.parse_args()
+
+    args.default_plans = sorted(normalize_plans(args.default_plans))
+    csv.field_size_limit(1 << 20)
+    logging.basicConfig(level=logging.WARNING, format="%(asctime)s %(message)s")
+    return run(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
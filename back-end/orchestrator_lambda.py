@@ -1,9 +1,24 @@
+import base64
+import copy
+import gzip
+import heapq
 import json
 import boto3
+import hashlib
 import os
 import logging
+import math
+import random
 import re
-from datetime import datetime
+import threading
+import time
+import unicodedata
+import zlib
+import xml.etree.ElementTree as ElementTree
+import numpy as np
+from collections import Counter, OrderedDict, deque
+from datetime import date, datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
 from decimal import Decimal
 from botocore.exceptions import ClientError, BotoCoreError
 
@@ -13,6 +28,8 @@ logger.setLevel(logging.INFO)
 
 # Instância global para reutilização entre invocações
 processor = None
+aggregates = None
+archive = None
 
 
 def lambda_handler(event, context):
@@ -27,12 +44,15 @@ def lambda_handler(event, context):
         if processor is None:
             processor = DentalClaimsProcessor()
 
+        # Identidade estável da requisição (antes de gerar um lexSessionId)
+        idempotency_identity = IdempotencyStore.request_identity(event)
+
         # GERAR OU RECUPERAR LEX_SESSION_ID ÚNICO
         session_attributes = event.get("sessionAttributes", {})
         lex_session_id = session_attributes.get("lexSessionId")
 
         if not lex_session_id:
-            lex_session_id = f"lex_{datetime.utcnow().strftime('%Y%m%d_%H%M%S_%f')}"
+            lex_session_id = ClaimIdGenerator.default().new_id()
             session_attributes["lexSessionId"] = lex_session_id
             logger.info(
                 "Novo lexSessionId gerado", extra={"lex_session_id": lex_session_id}
@@ -46,9 +66,24 @@ def lambda_handler(event, context):
         # Atualizar session attributes com o ID único
         event["sessionAttributes"] = session_attributes
 
+        if event.get("httpMethod") == "GET":
+            # Consultas somente leitura (ex.: /aggregates)
+            status_code, body, headers = processor.process_api_query(event)
+            return {
+                "statusCode": status_code,
+                "headers": {
+                    "Content-Type": "application/json",
+                    "Access-Control-Allow-Origin": "*",
+                    **headers,
+                },
+                "body": "" if body is None else json.dumps(body, default=str),
+            }
+
         if "httpMethod" in event:
             # É uma chamada via API Gateway - converter resposta
-            lex_response = processor.process_lex_event(event, context)
+            lex_response = processor.process_lex_event(
+                event, context, idempotency_identity
+            )
             return {
                 "statusCode": 200,
                 "headers": {
@@ -59,7 +94,7 @@ def lambda_handler(event, context):
             }
         else:
             # Chamada direta do Lex - retornar formato original
-            return processor.process_lex_event(event, context)
+            return processor.process_lex_event(event, context, idempotency_identity)
 
     except Exception as e:
         logger.critical(
@@ -107,6 +142,49 @@ def lambda_handler(event, context):
                 },
             }
 
+    finally:
+        # Gravações agrupadas precisam ser descarregadas antes do container congelar
+        if processor is not None:
+            try:
+                processor.data_manager.flush()
+                cache_metrics = processor.data_manager.cache_metrics()
+                # Só há o que reportar depois que alguma leitura passou pelo cache
+                if cache_metrics["lookups"]:
+                    logger.info("Métricas do cache de leitura", extra=cache_metrics)
+            except Exception as e:
+                logger.error(
+                    "Erro ao descarregar gravações pendentes",
+                    extra={"error_type": type(e).__name__, "error_message": str(e)},
+                )
+
+
+def stream_handler(event, context):
+    """
+    Handler do DynamoDB Streams da tabela de sinistros.
+
+    Arquiva no S3 os sinistros expirados por TTL e atualiza os agregados por
+    dia/plano; uma exceção faz o Lambda repetir o lote, e o marcador de lote
+    em ClaimAggregates evita contagem dupla.
+    """
+    global aggregates, archive
+
+    if aggregates is None:
+        aggregates = ClaimAggregates(
+            boto3.client("dynamodb"), os.environ["DYNAMO_TABLE"]
+        )
+    if archive is None and os.environ.get("ARCHIVE_BUCKET"):
+        archive = ClaimArchive(os.environ["ARCHIVE_BUCKET"])
+
+    records = event.get("Records", [])
+    # Arquivar antes de agregar: o objeto do lote é sobrescrito numa reentrega
+    archived = archive.archive_stream_records(records) if archive else 0
+    updated = aggregates.apply_stream_records(records)
+    return {
+        "records": len(records),
+        "aggregates_updated": updated,
+        "claims_archived": archived,
+    }
+
 
 class DentalClaimsProcessor:
     """
@@ -135,9 +213,37 @@ class DentalClaimsProcessor:
             self.data_manager = DataManager()
             print("✅ DataManager criado")
 
+            self.idempotency_store = IdempotencyStore(
+                self.data_manager.client,
+                self.data_manager.table_name,
+                self.data_manager.serializer,
+            )
+            print("✅ IdempotencyStore criado")
+
+            self.aggregates = ClaimAggregates(
+                self.data_manager.client,
+                self.data_manager.table_name,
+                self.data_manager.serializer,
+            )
+            self.archive = (
+                ClaimArchive(os.environ["ARCHIVE_BUCKET"])
+                if os.environ.get("ARCHIVE_BUCKET")
+                else None
+            )
+            # max-age das respostas da busca de dentistas (CloudFront/navegador)
+            self.dentist_search_max_age = int(
+                os.environ.get("DENTIST_SEARCH_MAX_AGE", "300")
+            )
+
             self.validator = ClaimValidator()
             print("✅ ClaimValidator criado")
 
+            self.clinic_directory_loader = ClinicDirectoryLoader.from_environment()
+            print("✅ ClinicDirectory carregado")
+
+            self.location_resolver = LocationResolver.from_environment()
+            print("✅ LocationResolver carregado")
+
             print("🔧 Criando FlowProcessor...")
             self.flow_processor = FlowProcessor(
                 validator=self.validator,
@@ -145,6 +251,8 @@ class DentalClaimsProcessor:
                 document_processor=self.document_processor,
                 data_manager=self.data_manager,
                 notification_manager=self.notification_manager,
+                clinic_directory_loader=self.clinic_directory_loader,
+                location_resolver=self.location_resolver,
             )
             print("✅ FlowProcessor criado")
 
@@ -184,24 +292,33 @@ class DentalClaimsProcessor:
 
         logger.info("Variáveis de ambiente validadas com sucesso")
 
-    def process_lex_event(self, event, context):
+    def process_lex_event(self, event, context, idempotency_identity=None):
         """
         Processa eventos do Amazon Lex com rastreamento unificado.
 
         Args:
             event: Dados do evento do Lex
             context: Contexto de execução Lambda
+            idempotency_identity: Identidade estável da requisição
+                (IdempotencyStore.request_identity); sem ela, a
+                idempotência é ignorada
 
         Returns:
             dict: Resposta formatada para o Lex
         """
+        idempotency_key = None
         try:
 
             print("📍 ETAPA 1: Início do método")
 
+            original_session_id = event.get("sessionAttributes", {}).get("lexSessionId")
             event = self._parse_api_gateway_event(event)
 
             session_attributes = event.get("sessionAttributes", {})
+            # O evento convertido do API Gateway não traz o ID gerado no handler
+            if original_session_id and "lexSessionId" not in session_attributes:
+                session_attributes["lexSessionId"] = original_session_id
+                event["sessionAttributes"] = session_attributes
             lex_session_id = session_attributes.get("lexSessionId", "unknown")
 
             print("📍 ETAPA 2: Session attributes OK")
@@ -246,6 +363,33 @@ class DentalClaimsProcessor:
                 },
             )
 
+            # Retentativas do Lex/API Gateway reutilizam a resposta já gerada
+            if idempotency_identity:
+                idempotency_key = IdempotencyStore.build_key(
+                    idempotency_identity,
+                    intent_name,
+                    slots,
+                    cursor=(
+                        FlowProcessor.dentist_search_cursor(slots, session_attributes)
+                        if intent_name == "BuscarDentistas"
+                        else None
+                    ),
+                )
+                previous = self.idempotency_store.begin(idempotency_key)
+                if previous["state"] == "completed":
+                    logger.info(
+                        "Resposta idempotente reutilizada",
+                        extra={"lex_session_id": lex_session_id},
+                    )
+                    return previous["response"]
+                if previous["state"] == "in_progress":
+                    idempotency_key = None
+                    return self._build_error_response(
+                        "Sua solicitação já está em processamento. Aguarde alguns instantes."
+                    )
+                if previous["state"] == "unavailable":
+                    idempotency_key = None
+
             # Roteamento de intenções
             print("📍 ETAPA 7: Iniciando roteamento de intenções")
             if intent_name == "SolicitarPreAprovacao":
@@ -282,9 +426,20 @@ class DentalClaimsProcessor:
                 },
             )
 
-            return self._build_lex_response(result, session_attributes)
+            lex_response = self._build_lex_response(result, session_attributes)
+
+            if idempotency_key:
+                if result.get("status") == "success":
+                    self.idempotency_store.complete(idempotency_key, lex_response)
+                else:
+                    # Falhas não são memorizadas: a próxima tentativa reprocessa
+                    self.idempotency_store.release(idempotency_key)
+
+            return lex_response
 
         except ClientError as e:
+            if idempotency_key:
+                self.idempotency_store.release(idempotency_key)
             error_code = e.response["Error"]["Code"]
             lex_session_id = event.get("sessionAttributes", {}).get(
                 "lexSessionId", "unknown"
@@ -303,6 +458,8 @@ class DentalClaimsProcessor:
             )
 
         except Exception as e:
+            if idempotency_key:
+                self.idempotency_store.release(idempotency_key)
 
             print(f"💥 ERRO CAPTURADO: {type(e).__name__}: {str(e)}")
             import traceback
@@ -324,6 +481,127 @@ class DentalClaimsProcessor:
 
             return self._build_error_response("Erro interno do sistema")
 
+    def process_api_query(self, event):
+        """
+        Atende as consultas GET do API Gateway.
+
+        Rotas:
+            /aggregates                          -> totais gerais
+            /aggregates?plan=premium             -> totais de um plano
+            /aggregates?from=AAAA-MM-DD&to=...   -> totais por dia
+            /archive?from=AAAA-MM-DD&to=...      -> sinistros arquivados
+                (filtros: type, sessionId, status, plan, limit)
+            /dentists?location=...&plan=...&specialty=...&limit=...
+            /dentists?cursor=...                 -> próxima página da busca
+
+        /aggregates e /archive exigem requisição assinada (SigV4) e
+        respondem 403 a chamadas anônimas; /dentists é público.
+
+        Returns:
+            tuple: (status HTTP, corpo da resposta, cabeçalhos adicionais)
+        """
+        path = event.get("path", "")
+        params = event.get("queryStringParameters") or {}
+
+        route = path.rstrip("/").rsplit("/", 1)[-1]
+        if route == "dentists":
+            return self._query_dentists(params, event.get("headers") or {})
+        if route not in ("aggregates", "archive"):
+            return 404, {"error": "not_found", "path": path}, {}
+        if not self._is_iam_caller(event):
+            # Relatórios são para ferramentas internas (rotas com AWS_IAM)
+            return 403, {"error": "forbidden"}, {}
+
+        status_code, body = self._query_reports(route, params)
+        return status_code, body, {}
+
+    @staticmethod
+    def _is_iam_caller(event):
+        """Indica se o API Gateway autenticou a requisição via IAM (SigV4)."""
+        identity = (event.get("requestContext") or {}).get("identity") or {}
+        return bool(identity.get("userArn"))
+
+    def _query_dentists(self, params, headers):
+        """
+        Busca paginada de dentistas cacheável por CDN.
+
+        A resposta depende só da consulta normalizada, do cursor e da versão
+        do diretório: leva Cache-Control público e um ETag do corpo, e um
+        If-None-Match igual recebe 304 sem corpo.
+        """
+        if not (params.get("cursor") or params.get("location")):
+            return 400, {"error": "missing_parameter", "parameter": "location"}, {}
+
+        try:
+            page = self.flow_processor.search_dentists(
+                params.get("location"),
+                params.get("plan"),
+                params.get("specialty"),
+                cursor=params.get("cursor"),
+                limit=int(params["limit"]) if params.get("limit") else None,
+            )
+        except ValueError as e:
+            return 400, {"error": "invalid_parameter", "message": str(e)}, {}
+
+        digest = hashlib.sha256(
+            json.dumps(page, sort_keys=True, default=str).encode("utf-8")
+        ).hexdigest()
+        cache_headers = {
+            "Cache-Control": f"public, max-age={self.dentist_search_max_age}",
+            "ETag": f'"{digest[:32]}"',
+        }
+
+        if_none_match = next(
+            (
+                value
+                for name, value in headers.items()
+                if name.lower() == "if-none-match"
+            ),
+            "",
+        )
+        candidates = {
+            tag.strip().removeprefix("W/") for tag in if_none_match.split(",")
+        }
+        if cache_headers["ETag"] in candidates or "*" in candidates:
+            return 304, None, cache_headers
+        return 200, page, cache_headers
+
+    def _query_reports(self, route, params):
+        """Relatórios (/aggregates e /archive)."""
+        try:
+            if route == "archive":
+                return self._query_archive(params)
+            if params.get("from"):
+                days = self.aggregates.get_days(
+                    params["from"], params.get("to") or params["from"]
+                )
+                return 200, {"days": days}
+            if params.get("plan"):
+                return 200, self.aggregates.get_plan(params["plan"])
+            return 200, self.aggregates.get("agg#all")
+
+        except ValueError as e:
+            return 400, {"error": "invalid_range", "message": str(e)}
+
+    def _query_archive(self, params):
+        """Consulta a camada fria (ClaimArchive) a partir da query string."""
+        if self.archive is None:
+            return 503, {"error": "archive_not_configured"}
+        if not params.get("from"):
+            return 400, {"error": "missing_parameter", "parameter": "from"}
+
+        limit = min(int(params.get("limit") or 100), 1000)
+        claims = self.archive.query(
+            params["from"],
+            params.get("to") or params["from"],
+            claim_type=params.get("type"),
+            session_id=params.get("sessionId"),
+            status=params.get("status"),
+            plan_tier=params.get("plan"),
+            limit=limit,
+        )
+        return 200, {"claims": claims, "count": len(claims)}
+
     def _build_lex_response(self, result, session_attributes):
         """
         Constrói resposta formatada para o Amazon Lex.
@@ -516,6 +794,7 @@ class DentalClaimsProcessor:
                                 "especialidade",
                                 "treatment",
                             ],
+                            "cursor": ["cursor", "nextCursor", "pageToken"],
                         }
 
                         for lex_slot, possible_keys in slot_mapping.items():
@@ -910,19 +1189,384 @@ class AIAnalyzer:
 class DataManager:
     """Gerencia todas as operações de persistência no DynamoDB."""
 
-    def __init__(self):
-        self.dynamodb = boto3.resource("dynamodb")
+    def __init__(self, buffered_writes=None, read_client=None, cache=None):
+        # Cliente de baixo nível + serializador próprio (aceita floats)
+        self.client = boto3.client("dynamodb")
         self.table_name = os.environ["DYNAMO_TABLE"]
-        self.table = self.dynamodb.Table(self.table_name)
-        logger.info("DataManager inicializado")
+        self.serializer = ItemSerializer()
+        self.index_shards = int(os.environ.get("CLAIM_INDEX_SHARDS", "8"))
+        self._query_executor = None
+        # Sinistros expiram da tabela quente e seguem para o ClaimArchive (0 = nunca)
+        self.retention_days = int(os.environ.get("CLAIM_RETENTION_DAYS", "365"))
+
+        # Leituras: cliente plugável (boto3 ou DAX, mesma API) + cache local
+        self.read_client = read_client or self._build_read_client()
+        self.cache = cache or ReadCache(
+            max_entries=int(os.environ.get("READ_CACHE_SIZE", "1024")),
+            ttl_seconds=float(os.environ.get("READ_CACHE_TTL_SECONDS", "30")),
+            negative_ttl_seconds=float(
+                os.environ.get("READ_CACHE_NEGATIVE_TTL_SECONDS", "5")
+            ),
+        )
+
+        # Em lotes/workers as gravações são agrupadas em BatchWriteItem
+        if buffered_writes is None:
+            buffered_writes = (
+                os.environ.get("DYNAMO_BUFFERED_WRITES", "false").lower() == "true"
+            )
+        self.write_buffer = (
+            BatchWriteBuffer(self.client, self.table_name, serializer=self.serializer)
+            if buffered_writes
+            else None
+        )
+        logger.info(
+            "DataManager inicializado", extra={"buffered_writes": buffered_writes}
+        )
+
+    def _put_item(self, item):
+        """
+        Codifica o item no esquema compacto e o grava direto na tabela ou no
+        buffer de BatchWriteItem.
+
+        Returns:
+            int | str: Status HTTP do put_item, ou "buffered"
+        """
+        item = ClaimItemCodec.encode(self._with_retention(self._with_index_keys(item)))
+        self.cache.invalidate(
+            ("item", item["sessionId"], item["createdAt"]),
+            ("session", item["sessionId"]),
+        )
+        if self.write_buffer is not None:
+            self.write_buffer.add(item)
+            return "buffered"
+
+        response = self.client.put_item(
+            TableName=self.table_name, Item=self.serializer.serialize(item)
+        )
+        return response["ResponseMetadata"]["HTTPStatusCode"]
+
+    def _build_read_client(self):
+        """Usa o DAX quando DAX_ENDPOINT estiver definido (dependência opcional)."""
+        endpoint = os.environ.get("DAX_ENDPOINT")
+        if not endpoint:
+            return self.client
+        try:
+            from amazondax import AmazonDaxClient
+
+            return AmazonDaxClient(endpoints=[endpoint])
+        except ImportError:
+            logger.warning("amazondax não instalado - leituras direto no DynamoDB")
+            return self.client
+
+    def cache_metrics(self):
+        """Taxa de acerto e latência economizada pelo cache de leitura."""
+        return self.cache.metrics()
+
+    def _timed_read(self, operation, **request):
+        started = time.perf_counter()
+        response = getattr(self.read_client, operation)(**request)
+        self.cache.record_backend_latency((time.perf_counter() - started) * 1000)
+        return response
+
+    def get_claim(self, session_id, created_at):
+        """
+        Lê um sinistro pela chave completa (com cache read-through).
+
+        Returns:
+            dict | None: Item decodificado, ou None se não existir
+        """
+        cache_key = ("item", session_id, created_at)
+        found, claim = self.cache.get(cache_key)
+        if found:
+            return claim
+
+        response = self._timed_read(
+            "get_item",
+            TableName=self.table_name,
+            Key={"sessionId": {"S": session_id}, "createdAt": {"S": created_at}},
+        )
+        claim = (
+            ClaimItemCodec.decode(ItemSerializer.deserialize(response["Item"]))
+            if "Item" in response
+            else None
+        )
+        self.cache.put(cache_key, claim)
+        return claim
+
+    def get_claims(self, keys):
+        """
+        Lê vários sinistros com BatchGetItem, consultando o cache antes.
+
+        Args:
+            keys: Lista de (sessionId, createdAt)
+
+        Returns:
+            dict: {(sessionId, createdAt): item decodificado ou None}
+        """
+        results = {}
+        pending = []
+        for session_id, created_at in dict.fromkeys(keys):
+            found, claim = self.cache.get(("item", session_id, created_at))
+            if found:
+                results[(session_id, created_at)] = claim
+            else:
+                pending.append((session_id, created_at))
+
+        for start in range(0, len(pending), 100):
+            chunk = pending[start : start + 100]
+            request = {
+                self.table_name: {
+                    "Keys": [
+                        {"sessionId": {"S": session_id}, "createdAt": {"S": created_at}}
+                        for session_id, created_at in chunk
+                    ]
+                }
+            }
+            fetched = {}
+            attempt = 0
+            while request:
+                response = self._timed_read("batch_get_item", RequestItems=request)
+                for raw in response.get("Responses", {}).get(self.table_name, []):
+                    claim = ClaimItemCodec.decode(ItemSerializer.deserialize(raw))
+                    fetched[(claim["sessionId"], claim["createdAt"])] = claim
+                request = response.get("UnprocessedKeys") or {}
+                if request:
+                    attempt += 1
+                    time.sleep(random.uniform(0, min(0.05 * 2**attempt, 2.0)))
+
+            for key in chunk:
+                claim = fetched.get(key)
+                self.cache.put(("item", *key), claim)
+                results[key] = claim
+
+        return results
+
+    def get_session_claims(self, session_id):
+        """
+        Lista todos os itens de uma sessão (pré-aprovação, reembolso, busca).
+
+        Returns:
+            list: Itens decodificados, ordenados por createdAt
+        """
+        cache_key = ("session", session_id)
+        found, claims = self.cache.get(cache_key)
+        if found:
+            return claims or []
+
+        claims = []
+        request = {
+            "TableName": self.table_name,
+            "KeyConditionExpression": "sessionId = :session",
+            "ExpressionAttributeValues": {":session": {"S": session_id}},
+        }
+        while True:
+            response = self._timed_read("query", **request)
+            claims.extend(
+                ClaimItemCodec.decode(ItemSerializer.deserialize(raw))
+                for raw in response.get("Items", [])
+            )
+            if "LastEvaluatedKey" not in response:
+                break
+            request["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+        self.cache.put(cache_key, claims or None)
+        return claims
+
+    def flush(self):
+        """Descarrega gravações pendentes (chamar ao final de cada invocação)."""
+        if self.write_buffer is not None:
+            return self.write_buffer.flush()
+        return 0
+
+    def _with_retention(self, item):
+        """
+        Define o TTL (expiresAt, epoch em segundos) dos itens de sinistro,
+        contado a partir do createdAt (importante no backfill de itens antigos).
+        """
+        if (
+            not self.retention_days
+            or "expiresAt" in item
+            or item.get("claimType") not in ClaimAggregates.CLAIM_TYPES
+        ):
+            return item
+        try:
+            created = (
+                datetime.fromisoformat(item["createdAt"])
+                .replace(tzinfo=timezone.utc)
+                .timestamp()
+            )
+        except (KeyError, TypeError, ValueError):
+            created = time.time()
+        return {
+            **item,
+            "expiresAt": int(created) + self.retention_days * 86400,
+        }
+
+    # Índices secundários: partição "<valor>#<shard>" e ordenação por createdAt
+    TYPE_DATE_INDEX = "ClaimTypeDateIndex"
+    STATUS_PLAN_INDEX = "StatusPlanIndex"
+
+    def _shard_for(self, session_id):
+        """Shard do item: derivado do ULID, ou CRC32 para IDs legados."""
+        try:
+            return ClaimIdGenerator.shard_of(session_id, self.index_shards)
+        except ValueError:
+            return zlib.crc32(session_id.encode("utf-8")) % self.index_shards
+
+    def _with_index_keys(self, item):
+        """Acrescenta as chaves dos GSIs (claimType#data e status#plano)."""
+        if "claimType" not in item or "status" not in item:
+            return item
+
+        shard = self._shard_for(item["sessionId"])
+        plan_tier = str(item.get("planTier", "basic")).lower()
+        return {
+            **item,
+            "g1pk": f"{item['claimType']}#{item['createdAt'][:10]}#{shard}",
+            "g2pk": f"{item['status']}#{plan_tier}#{shard}",
+        }
+
+    def query_claims_by_type_and_date(
+        self, claim_type, date, start=None, end=None, limit=None, descending=False
+    ):
+        """
+        Lista sinistros de um tipo em um dia (ex.: reembolsos de hoje).
+
+        Args:
+            claim_type: "pre_approval", "reimbursement" ou "dentist_search"
+            date: Dia no formato AAAA-MM-DD
+            start/end: Limites opcionais de createdAt (ISO, inclusivos)
+            limit: Máximo de itens retornados
+            descending: Mais recentes primeiro
+
+        Returns:
+            list: Itens decodificados, ordenados por createdAt
+        """
+        return self._query_sharded(
+            self.TYPE_DATE_INDEX,
+            "g1pk",
+            f"{claim_type}#{date}",
+            start,
+            end,
+            limit,
+            descending,
+        )
+
+    def query_claims_by_status_and_plan(
+        self, status, plan_tier, start=None, end=None, limit=None, descending=False
+    ):
+        """
+        Lista sinistros por status e plano (ex.: pré-aprovações pendentes premium).
+
+        Requer o GSI StatusPlanIndex, criado no segundo deploy
+        (EnableStatusPlanIndex=true no template).
+
+        Args:
+            status: Status do sinistro ("approved", "processed", "pending"...)
+            plan_tier: Plano dental
+            start/end: Limites opcionais de createdAt (ISO, inclusivos)
+            limit: Máximo de itens retornados
+            descending: Mais recentes primeiro
+
+        Returns:
+            list: Itens decodificados, ordenados por createdAt
+        """
+        return self._query_sharded(
+            self.STATUS_PLAN_INDEX,
+            "g2pk",
+            f"{status}#{str(plan_tier).lower()}",
+            start,
+            end,
+            limit,
+            descending,
+        )
+
+    def _query_sharded(
+        self,
+        index_name,
+        partition_attribute,
+        partition_prefix,
+        start,
+        end,
+        limit,
+        descending,
+    ):
+        """Consulta todos os shards em paralelo e intercala os resultados."""
+        if self._query_executor is None:
+            self._query_executor = ThreadPoolExecutor(
+                max_workers=min(self.index_shards, 16)
+            )
+
+        key_condition = "#pk = :pk"
+        values = {}
+        if start and end:
+            key_condition += " AND createdAt BETWEEN :start AND :end"
+            values.update({":start": {"S": start}, ":end": {"S": end}})
+        elif start:
+            key_condition += " AND createdAt >= :start"
+            values[":start"] = {"S": start}
+        elif end:
+            key_condition += " AND createdAt <= :end"
+            values[":end"] = {"S": end}
+
+        def query_shard(shard):
+            items = []
+            request = {
+                "TableName": self.table_name,
+                "IndexName": index_name,
+                "KeyConditionExpression": key_condition,
+                "ExpressionAttributeNames": {"#pk": partition_attribute},
+                "ExpressionAttributeValues": {
+                    **values,
+                    ":pk": {"S": f"{partition_prefix}#{shard}"},
+                },
+                "ScanIndexForward": not descending,
+            }
+            while True:
+                if limit:
+                    request["Limit"] = limit - len(items)
+                response = self.client.query(**request)
+                items.extend(response.get("Items", []))
+                if "LastEvaluatedKey" not in response or (
+                    limit and len(items) >= limit
+                ):
+                    return items
+                request["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+        shard_results = list(
+            self._query_executor.map(query_shard, range(self.index_shards))
+        )
+
+        # Cada shard já vem ordenado por createdAt: basta intercalar
+        merged = heapq.merge(
+            *shard_results,
+            key=lambda item: item["createdAt"]["S"],
+            reverse=descending,
+        )
+        results = []
+        for item in merged:
+            results.append(ClaimItemCodec.decode(ItemSerializer.deserialize(item)))
+            if limit and len(results) >= limit:
+                break
+
+        logger.info(
+            "Consulta por índice concluída",
+            extra={
+                "index_name": index_name,
+                "partition": partition_prefix,
+                "items": len(results),
+            },
+        )
+        return results
 
     def save_pre_approval_claim(self, claim_data, session_attributes):
         """
         Salva dados de pré-aprovação no DynamoDB com rastreamento unificado.
         """
         try:
-            lex_session_id = session_attributes.get(
-                "lexSessionId", f"lex_{datetime.utcnow().strftime('%Y%m%d_%H%M%S_%f')}"
+            lex_session_id = (
+                session_attributes.get("lexSessionId")
+                or ClaimIdGenerator.default().new_id()
             )
 
             item = {
@@ -935,15 +1579,13 @@ class DataManager:
                 "location": claim_data["location"],
                 "diagnosis": claim_data["diagnosis"],
                 "preApproval": claim_data["pre_approval"],
-                "clinics": claim_data["clinics"],
+                "clinics": ClaimItemCodec.clinic_references(claim_data["clinics"]),
                 "status": "processed",
-                "notificationTopics": {
-                    "clientes": os.environ["SNS_TOPIC_CLIENTES"],
-                    "dentistas": os.environ["SNS_TOPIC_DENTISTAS"],
-                },
             }
+            if claim_data["pre_approval"].get("rules_version"):
+                item["rulesVersion"] = claim_data["pre_approval"]["rules_version"]
 
-            response = self.table.put_item(Item=item)
+            dynamo_status = self._put_item(item)
 
             logger.info(
                 "Pré-aprovação salva com rastreamento unificado",
@@ -951,7 +1593,7 @@ class DataManager:
                     "lex_session_id": lex_session_id,
                     "process_step": "symptoms_analysis",
                     "plan_tier": claim_data["plan_tier"],
-                    "dynamo_status": response["ResponseMetadata"]["HTTPStatusCode"],
+                    "dynamo_status": dynamo_status,
                 },
             )
 
@@ -970,14 +1612,34 @@ class DataManager:
     def save_reimbursement_claim(self, claim_data, session_attributes):
         """
         Salva dados de reembolso no DynamoDB com rastreamento unificado.
+
+        Antes de gravar, registra as impressões digitais do recibo com escrita
+        condicional; se o recibo já pertence a outra sessão (ou a outro
+        documento da mesma sessão), o pedido é salvo com status "duplicate" e
+        valor zerado. Falhas no registro retornam saved=False.
+
+        Returns:
+            dict: {"saved": bool, "duplicate_of": sessionId original ou None}
         """
         try:
-            lex_session_id = session_attributes.get(
-                "lexSessionId", f"lex_{datetime.utcnow().strftime('%Y%m%d_%H%M%S_%f')}"
+            lex_session_id = (
+                session_attributes.get("lexSessionId")
+                or ClaimIdGenerator.default().new_id()
             )
 
             reimbursement_result = claim_data.get("reimbursement_result", {})
 
+            fingerprints = ReceiptFingerprint.build(claim_data.get("document_data", {}))
+            duplicate_of = self._register_receipt_fingerprints(
+                fingerprints, lex_session_id, claim_data.get("document_key", "")
+            )
+            if duplicate_of:
+                reimbursement_result = {
+                    **reimbursement_result,
+                    "status": "duplicate",
+                    "amount": 0.0,
+                }
+
             item = {
                 "sessionId": lex_session_id,
                 "claimType": "reimbursement",
@@ -991,11 +1653,9 @@ class DataManager:
                 "reimbursementAmount": Decimal(
                     str(reimbursement_result.get("amount", 0.0))
                 ),
-                "notificationTopics": {
-                    "clientes": os.environ["SNS_TOPIC_CLIENTES"],
-                    "dentistas": "none",
-                },
             }
+            if reimbursement_result.get("rules_version"):
+                item["rulesVersion"] = reimbursement_result["rules_version"]
 
             # Adicionar dados do documento de forma segura
             if "document_data" in claim_data:
@@ -1010,7 +1670,12 @@ class DataManager:
                 }
                 item["documentData"] = safe_document_data
 
-            response = self.table.put_item(Item=item)
+            if fingerprints:
+                item["receiptFingerprints"] = list(fingerprints.values())
+            if duplicate_of:
+                item["duplicateOf"] = duplicate_of
+
+            dynamo_status = self._put_item(item)
 
             logger.info(
                 "Reembolso salvo com rastreamento unificado",
@@ -1019,11 +1684,12 @@ class DataManager:
                     "process_step": "document_processing",
                     "status": reimbursement_result.get("status", "unknown"),
                     "amount": float(reimbursement_result.get("amount", 0.0)),
-                    "dynamo_status": response["ResponseMetadata"]["HTTPStatusCode"],
+                    "dynamo_status": dynamo_status,
+                    "duplicate_of": duplicate_of,
                 },
             )
 
-            return True
+            return {"saved": True, "duplicate_of": duplicate_of}
 
         except Exception as e:
             logger.error(
@@ -1033,15 +1699,106 @@ class DataManager:
                     "error": str(e),
                 },
             )
-            return False
+            return {"saved": False, "duplicate_of": None}
+
+    def _register_receipt_fingerprints(
+        self, fingerprints, lex_session_id, document_key
+    ):
+        """
+        Registra as impressões digitais do recibo numa única transação
+        (TransactWriteItems) com puts condicionais.
+
+        Cada impressão vira um item de unicidade com chave
+        "receipt#<tipo>#<hash>". A escrita só é aceita se o item não existir
+        ou já pertencer à mesma sessão e ao mesmo documento (retentativas do
+        Lex); a mesma sessão reenviando o recibo com outro documentKey é
+        tratada como duplicidade.
+
+        Args:
+            fingerprints: dict tipo -> hash gerado por ReceiptFingerprint.build
+            lex_session_id: Sessão que está solicitando o reembolso
+            document_key: Chave do documento no S3
+
+        Returns:
+            str: sessionId que já utilizou o recibo, ou None se for inédito
+        """
+        if not fingerprints:
+            return None
+
+        # Registro tudo-ou-nada: se alguma impressão já pertence a outro
+        # pedido, nenhuma fica associada a este (que não será reembolsado)
+        kinds = list(fingerprints)
+        registered_at = datetime.utcnow().isoformat()
+        try:
+            self.client.transact_write_items(
+                TransactItems=[
+                    {
+                        "Put": {
+                            "TableName": self.table_name,
+                            "Item": self.serializer.serialize(
+                                {
+                                    "sessionId": f"receipt#{kind}#{fingerprints[kind]}",
+                                    "createdAt": "fingerprint",
+                                    "claimType": "receipt_fingerprint",
+                                    "ownerSessionId": lex_session_id,
+                                    "documentKey": document_key,
+                                    "registeredAt": registered_at,
+                                }
+                            ),
+                            "ConditionExpression": (
+                                "attribute_not_exists(sessionId) OR "
+                                "(ownerSessionId = :owner AND documentKey = :document_key)"
+                            ),
+                            "ExpressionAttributeValues": {
+                                ":owner": {"S": lex_session_id},
+                                ":document_key": {"S": document_key},
+                            },
+                            "ReturnValuesOnConditionCheckFailure": "ALL_OLD",
+                        }
+                    }
+                    for kind in kinds
+                ]
+            )
+
+        except ClientError as e:
+            if e.response["Error"]["Code"] != "TransactionCanceledException":
+                raise
+
+            reasons = e.response.get("CancellationReasons", [])
+            conflicts = [
+                (kind, reason)
+                for kind, reason in zip(kinds, reasons)
+                if reason.get("Code") == "ConditionalCheckFailed"
+            ]
+            if not conflicts:
+                # Cancelada por conflito de transação ou throttling: sem
+                # decisão sobre duplicidade, o chamador trata como falha
+                raise
+
+            kind, reason = conflicts[0]
+            duplicate_of = (
+                reason.get("Item", {}).get("ownerSessionId", {}).get("S", "unknown")
+            )
+            logger.warning(
+                "Recibo já utilizado em outro reembolso",
+                extra={
+                    "lex_session_id": lex_session_id,
+                    "fingerprint_kind": kind,
+                    "duplicate_of": duplicate_of,
+                },
+            )
+            return duplicate_of
+
+        return None
 
     def save_search_record(self, search_data, session_attributes):
         """
         Salva registro de busca de dentistas no DynamoDB com rastreamento unificado.
         """
         try:
-            lex_session_id = session_attributes.get(
-                "lexSessionId", f"lex_{datetime.utcnow().strftime('%Y%m%d_%H%M%S_%f')}"
+            lex_session_id = (
+                session_attributes.get("lexSessionId")
+                or ClaimIdGenerator.default().new_id()
             )
 
             item = {
@@ -1056,7 +1813,7 @@ class DataManager:
                 "status": "completed",
             }
 
-            self.table.put_item(Item=item)
+            self._put_item(item)
 
             logger.info(
                 "Busca salva com rastreamento unificado",
@@ -1081,74 +1838,1449 @@ class DataManager:
             return False
 
 
-class DocumentProcessor:
-    """Processa documentos usando Amazon Textract para extração de dados."""
+class ClaimItemCodec:
+    """
+    Codificador/decodificador versionado do esquema compacto de itens.
 
-    def __init__(self):
-        self.textract = boto3.client("textract")
-        self.documents_bucket = os.environ["DOCUMENTS_BUCKET"]
-        logger.info("DocumentProcessor inicializado")
+    Versão 1 (legado): nomes longos, mapas completos de diagnóstico, clínicas
+    e ARNs dos tópicos. Versão 2: nomes curtos, clínicas como referências,
+    sem ARNs, e estruturas/textos grandes como JSON comprimido com gzip em
+    atributos binários. As chaves da tabela e do ClaimTypeIndex mantêm os
+    nomes originais.
+    """
 
-    def process_receipt(self, document_key):
+    SCHEMA_VERSION = 2
+    VERSION_ATTRIBUTE = "v"
+
+    # Textos/JSON a partir deste tamanho (bytes) são comprimidos
+    COMPRESSION_THRESHOLD = 128
+
+    ATTRIBUTE_NAMES = {
+        "processStep": "ps",
+        "symptoms": "sy",
+        "planTier": "pt",
+        "location": "lo",
+        "diagnosis": "dg",
+        "preApproval": "pa",
+        "clinics": "cl",
+        "status": "st",
+        "documentKey": "dk",
+        "procedureValue": "pv",
+        "reimbursementResult": "rr",
+        "reimbursementAmount": "ra",
+        "documentData": "dd",
+        "receiptFingerprints": "fp",
+        "duplicateOf": "du",
+        "specialty": "sp",
+        "dentistsFound": "df",
+        "rulesVersion": "rv",
+    }
+    LOGICAL_NAMES = {short: name for name, short in ATTRIBUTE_NAMES.items()}
+
+    # Estruturas serializadas como JSON (evita floats no DynamoDB)
+    JSON_ATTRIBUTES = {
+        "diagnosis",
+        "preApproval",
+        "reimbursementResult",
+        "documentData",
+    }
+    # Textos livres comprimidos quando grandes
+    TEXT_ATTRIBUTES = {"symptoms"}
+
+    @staticmethod
+    def clinic_references(clinics):
+        """Substitui os dados completos das clínicas por seus identificadores."""
+        return [clinic.get("id") or clinic.get("name", "") for clinic in clinics or []]
+
+    @staticmethod
+    def _pack(data):
+        """Retorna o texto como str, ou bytes gzip se passar do limite."""
+        raw = data.encode("utf-8")
+        if len(raw) < ClaimItemCodec.COMPRESSION_THRESHOLD:
+            return data
+        return gzip.compress(raw, mtime=0)
+
+    @staticmethod
+    def _unpack(value):
+        """Inverso de _pack (aceita bytes ou boto3 Binary)."""
+        if isinstance(value, str):
+            return value
+        return gzip.decompress(bytes(getattr(value, "value", value))).decode("utf-8")
+
+    @staticmethod
+    def encode(item):
+        """
+        Converte um item lógico (nomes longos) para o esquema compacto.
+
+        Itens já codificados são retornados sem alteração.
         """
-        Processa recibo/nota fiscal usando Textract.
+        if ClaimItemCodec.VERSION_ATTRIBUTE in item:
+            return item
+
+        encoded = {ClaimItemCodec.VERSION_ATTRIBUTE: ClaimItemCodec.SCHEMA_VERSION}
+        for name, value in item.items():
+            if name == "notificationTopics":
+                continue
+            if name in ClaimItemCodec.JSON_ATTRIBUTES:
+                value = ClaimItemCodec._pack(
+                    json.dumps(
+                        value, ensure_ascii=False, separators=(",", ":"), default=str
+                    )
+                )
+            elif name in ClaimItemCodec.TEXT_ATTRIBUTES and isinstance(value, str):
+                value = ClaimItemCodec._pack(value)
+            encoded[ClaimItemCodec.ATTRIBUTE_NAMES.get(name, name)] = value
+
+        return encoded
+
+    @staticmethod
+    def decode(item):
+        """
+        Converte um item gravado (qualquer versão) para o formato lógico.
 
         Args:
-            document_key: Chave do documento no S3
+            item: Item lido do DynamoDB (resource API)
 
         Returns:
-            dict: Dados extraídos do documento
+            dict: Item com nomes longos e estruturas descomprimidas
         """
-        try:
-            logger.info(
-                "Iniciando análise de documento com Textract",
-                extra={"document_key": document_key},
-            )
+        if ClaimItemCodec.VERSION_ATTRIBUTE not in item:
+            # Versão 1: já está no formato lógico
+            return dict(item)
+
+        decoded = {}
+        for short, value in item.items():
+            if short == ClaimItemCodec.VERSION_ATTRIBUTE:
+                continue
+            name = ClaimItemCodec.LOGICAL_NAMES.get(short, short)
+            if name in ClaimItemCodec.JSON_ATTRIBUTES:
+                value = json.loads(ClaimItemCodec._unpack(value))
+            elif name in ClaimItemCodec.TEXT_ATTRIBUTES:
+                value = ClaimItemCodec._unpack(value)
+            decoded[name] = value
+
+        return decoded
 
-            response = self.textract.analyze_expense(
-                Document={
-                    "S3Object": {"Bucket": self.documents_bucket, "Name": document_key}
-                }
-            )
+    @staticmethod
+    def item_size(item):
+        """
+        Estima o tamanho do item segundo as regras de cálculo do DynamoDB.
 
-            extracted_data = self._extract_expense_data(response)
+        Returns:
+            int: Tamanho em bytes (nomes de atributos + valores)
+        """
+        return sum(
+            len(name.encode("utf-8")) + ClaimItemCodec._value_size(value)
+            for name, value in item.items()
+        )
 
-            logger.info(
-                "Análise Textract concluída",
-                extra={
-                    "fields_extracted": len(extracted_data),
-                    "has_amount": "total_amount" in extracted_data,
-                },
+    @staticmethod
+    def _value_size(value):
+        if value is None or isinstance(value, bool):
+            return 1
+        if isinstance(value, str):
+            return len(value.encode("utf-8"))
+        if isinstance(value, (bytes, bytearray)):
+            return len(value)
+        if isinstance(value, (int, float, Decimal)):
+            digits = len(str(value).lstrip("-").replace(".", "").lstrip("0")) or 1
+            return (digits + 1) // 2 + 1
+        if isinstance(value, dict):
+            return 3 + sum(
+                len(str(name).encode("utf-8")) + ClaimItemCodec._value_size(nested) + 1
+                for name, nested in value.items()
             )
+        if isinstance(value, (list, tuple, set)):
+            return 3 + sum(ClaimItemCodec._value_size(nested) + 1 for nested in value)
+        return len(str(value).encode("utf-8"))
 
-            return extracted_data
 
-        except ClientError as e:
-            error_code = e.response["Error"]["Code"]
-            logger.error(
-                "Erro no Textract",
-                extra={
-                    "error_code": error_code,
-                    "document_key": document_key,
-                },
-            )
+class IdempotencyStore:
+    """
+    Registro de idempotência das requisições do Lex/API Gateway.
 
-            if error_code == "InvalidParameterException":
-                return {"error": "invalid_document_format"}
-            else:
-                return {"error": "textract_service_error"}
+    A chave é o hash de uma identidade estável da requisição (ver
+    request_identity), intenção e slots normalizados. Cada
+    registro fica na tabela de sinistros (sessionId "idem#<hash>") com status
+    IN_PROGRESS ou COMPLETED, gravado com escrita condicional, e expira por
+    TTL no atributo expiresAt.
+    """
 
-        except Exception as e:
+    SORT_KEY = "idempotency"
+    IN_PROGRESS = "IN_PROGRESS"
+    COMPLETED = "COMPLETED"
+
+    def __init__(self, client, table_name, serializer=None):
+        self.client = client
+        self.table_name = table_name
+        self.serializer = serializer or ItemSerializer()
+        self.ttl_seconds = int(os.environ.get("IDEMPOTENCY_TTL_SECONDS", "86400"))
+        # Tempo máximo de um processamento em andamento (acima do timeout da Lambda)
+        self.lock_seconds = int(os.environ.get("IDEMPOTENCY_LOCK_SECONDS", "300"))
+
+    IDEMPOTENCY_HEADERS = ("idempotency-key", "x-idempotency-key")
+
+    @classmethod
+    def request_identity(cls, event):
+        """
+        Identidade estável de uma requisição, repetida nas retentativas.
+
+        Em ordem: lexSessionId já presente na sessão, cabeçalho
+        Idempotency-Key do cliente e requestId do API Gateway. Retorna None
+        se nenhuma existir; um ID gerado na invocação mudaria a cada
+        retentativa e nunca encontraria o registro. O userId do Lex não
+        serve: é o mesmo em todas as conversas do usuário, e a resposta
+        reaproveitada traria sessionAttributes e lexSessionId de uma sessão
+        antiga.
+        """
+        session_id = (event.get("sessionAttributes") or {}).get("lexSessionId")
+        if session_id:
+            return f"session:{session_id}"
+
+        headers = {
+            str(name).lower(): value
+            for name, value in (event.get("headers") or {}).items()
+        }
+        for name in cls.IDEMPOTENCY_HEADERS:
+            if headers.get(name):
+                return f"key:{headers[name]}"
+
+        request_id = (event.get("requestContext") or {}).get("requestId")
+        if request_id:
+            return f"request:{request_id}"
+        return None
+
+    @staticmethod
+    def build_key(identity, intent_name, slots, cursor=None):
+        """
+        Gera a chave de idempotência a partir da identidade, intenção e slots.
+
+        O cursor de paginação entra na chave: pedidos seguidos de "mais
+        resultados" têm os mesmos slots, mas cada um é uma página diferente.
+        """
+        normalized_slots = {
+            name: " ".join(str(value).lower().split())
+            for name, value in (slots or {}).items()
+            if value not in (None, "")
+        }
+        payload = json.dumps(
+            [identity, intent_name, normalized_slots] + ([cursor] if cursor else []),
+            sort_keys=True,
+            ensure_ascii=False,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _key(self, idempotency_key):
+        return {
+            "sessionId": {"S": f"idem#{idempotency_key}"},
+            "createdAt": {"S": self.SORT_KEY},
+        }
+
+    def begin(self, idempotency_key):
+        """
+        Reserva a chave para processamento.
+
+        Returns:
+            dict: {"state": "new" | "in_progress" | "unavailable"} ou
+                {"state": "completed", "response": resposta armazenada}
+        """
+        now = int(time.time())
+        try:
+            self.client.put_item(
+                TableName=self.table_name,
+                Item={
+                    **self._key(idempotency_key),
+                    **self.serializer.serialize(
+                        {
+                            "claimType": "idempotency",
+                            "status": self.IN_PROGRESS,
+                            "lockedUntil": now + self.lock_seconds,
+                            "expiresAt": now + self.ttl_seconds,
+                        }
+                    ),
+                },
+                ConditionExpression=(
+                    "attribute_not_exists(sessionId) OR expiresAt < :now "
+                    "OR (#status = :in_progress AND lockedUntil < :now)"
+                ),
+                ExpressionAttributeNames={"#status": "status"},
+                ExpressionAttributeValues={
+                    ":now": {"N": str(now)},
+                    ":in_progress": {"S": self.IN_PROGRESS},
+                },
+                ReturnValuesOnConditionCheckFailure="ALL_OLD",
+            )
+            return {"state": "new"}
+
+        except ClientError as e:
+            if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+                logger.warning(
+                    "Registro de idempotência indisponível",
+                    extra={"error_code": e.response["Error"]["Code"]},
+                )
+                return {"state": "unavailable"}
+
+            previous = ItemSerializer.deserialize(e.response.get("Item", {}))
+            if previous.get("status") == self.COMPLETED and "response" in previous:
+                return {
+                    "state": "completed",
+                    "response": json.loads(
+                        ClaimItemCodec._unpack(previous["response"])
+                    ),
+                }
+            return {"state": "in_progress"}
+
+    def complete(self, idempotency_key, response):
+        """Armazena a resposta final para as próximas retentativas."""
+        now = int(time.time())
+        try:
+            self.client.put_item(
+                TableName=self.table_name,
+                Item={
+                    **self._key(idempotency_key),
+                    **self.serializer.serialize(
+                        {
+                            "claimType": "idempotency",
+                            "status": self.COMPLETED,
+                            "response": ClaimItemCodec._pack(
+                                json.dumps(response, ensure_ascii=False, default=str)
+                            ),
+                            "completedAt": now,
+                            "expiresAt": now + self.ttl_seconds,
+                        }
+                    ),
+                },
+            )
+        except ClientError as e:
+            logger.warning(
+                "Não foi possível armazenar a resposta idempotente",
+                extra={"error_code": e.response["Error"]["Code"]},
+            )
+
+    def release(self, idempotency_key):
+        """Remove a reserva para que uma nova tentativa seja processada."""
+        try:
+            self.client.delete_item(
+                TableName=self.table_name, Key=self._key(idempotency_key)
+            )
+        except ClientError as e:
+            logger.warning(
+                "Não foi possível liberar a chave de idempotência",
+                extra={"error_code": e.response["Error"]["Code"]},
+            )
+
+
+class ClaimAggregates:
+    """
+    Agregados de sinistros mantidos incrementalmente pelo DynamoDB Streams.
+
+    Cada sinistro gravado soma seus contadores (ADD atômico) nos itens
+    "agg#day#<AAAA-MM-DD>", "agg#plan#<plano>" e "agg#all". Os registros do
+    lote são pré-agregados em memória e aplicados em uma única transação,
+    junto com um marcador do lote: se o Lambda reentregar o mesmo lote, o
+    marcador já existe e nada é somado duas vezes. Relatórios passam a ser
+    leituras de um único item, independente do volume de sinistros.
+    """
+
+    SORT_KEY = "aggregate"
+    # Contador de cada tipo de sinistro
+    CLAIM_TYPES = {
+        "pre_approval": "preApprovals",
+        "reimbursement": "reimbursements",
+        "dentist_search": "dentistSearches",
+    }
+    APPROVED_STATUSES = ("approved", "partial")
+    # Marcador do lote + atualizações (limite de 100 ações por transação)
+    MAX_UPDATES_PER_TRANSACTION = 99
+    MARKER_TTL_SECONDS = 2 * 24 * 3600
+    MAX_RANGE_DAYS = 366
+
+    def __init__(self, client, table_name, serializer=None):
+        self.client = client
+        self.table_name = table_name
+        self.serializer = serializer or ItemSerializer()
+
+    @staticmethod
+    def stream_image(image):
+        """Converte uma imagem do stream (binários em base64) para Python."""
+
+        def restore(value):
+            kind, data = next(iter(value.items()))
+            if kind == "B" and isinstance(data, str):
+                return {"B": base64.b64decode(data)}
+            if kind == "M":
+                return {"M": {name: restore(nested) for name, nested in data.items()}}
+            if kind == "L":
+                return {"L": [restore(nested) for nested in data]}
+            return value
+
+        return ClaimItemCodec.decode(
+            ItemSerializer.deserialize(
+                {name: restore(value) for name, value in image.items()}
+            )
+        )
+
+    @classmethod
+    def contribution(cls, claim):
+        """
+        Contadores que um sinistro soma em cada item de agregado.
+
+        Returns:
+            dict: {sessionId do agregado: {contador: valor}}; vazio para
+                itens que não são sinistros (idempotência, recibos, agregados)
+        """
+        claim_type = claim.get("claimType")
+        if claim_type not in cls.CLAIM_TYPES or "createdAt" not in claim:
+            return {}
+
+        status = claim.get("status", "unknown")
+        counters = {"claims": 1, cls.CLAIM_TYPES[claim_type]: 1}
+
+        if claim_type == "pre_approval":
+            if (claim.get("preApproval") or {}).get("approved"):
+                counters["preApprovalApproved"] = 1
+        elif claim_type == "reimbursement":
+            if status in cls.APPROVED_STATUSES:
+                counters["reimbursementApproved"] = 1
+            elif status == "duplicate":
+                counters["reimbursementDuplicates"] = 1
+            counters["claimedTotal"] = Decimal(str(claim.get("procedureValue", 0)))
+            counters["reimbursedTotal"] = Decimal(
+                str(claim.get("reimbursementAmount", 0))
+            )
+
+        plan_tier = str(claim.get("planTier", "basic")).lower()
+        return {
+            f"agg#day#{claim['createdAt'][:10]}": counters,
+            f"agg#plan#{plan_tier}": counters,
+            "agg#all": counters,
+        }
+
+    @classmethod
+    def accumulate(cls, records):
+        """
+        Pré-agrega um lote de registros do stream.
+
+        INSERT soma a contribuição do sinistro; MODIFY soma a diferença entre
+        a imagem nova e a antiga. REMOVE (inclusive expiração por TTL) não
+        altera os agregados, que representam o histórico.
+        """
+        totals = {}
+
+        def add(contribution, sign):
+            for aggregate_id, counters in contribution.items():
+                target = totals.setdefault(aggregate_id, {})
+                for name, value in counters.items():
+                    target[name] = target.get(name, 0) + sign * value
+
+        for record in records:
+            event_name = record.get("eventName")
+            if event_name not in ("INSERT", "MODIFY"):
+                continue
+            change = record.get("dynamodb", {})
+            if "NewImage" in change:
+                add(cls.contribution(cls.stream_image(change["NewImage"])), 1)
+            if event_name == "MODIFY" and "OldImage" in change:
+                add(cls.contribution(cls.stream_image(change["OldImage"])), -1)
+
+        return {
+            aggregate_id: {name: value for name, value in counters.items() if value}
+            for aggregate_id, counters in totals.items()
+            if any(counters.values())
+        }
+
+    def apply_stream_records(self, records):
+        """
+        Aplica um lote do DynamoDB Streams aos agregados.
+
+        Returns:
+            int: Quantidade de itens de agregado atualizados (0 se o lote já
+                tinha sido aplicado)
+        """
+        totals = self.accumulate(records)
+        if not totals:
+            return 0
+
+        batch_id = hashlib.sha256(
+            "|".join(record.get("eventID", "") for record in records).encode("utf-8")
+        ).hexdigest()
+        now = int(time.time())
+        aggregate_ids = sorted(totals)
+        updated = 0
+
+        for offset in range(0, len(aggregate_ids), self.MAX_UPDATES_PER_TRANSACTION):
+            chunk = aggregate_ids[offset : offset + self.MAX_UPDATES_PER_TRANSACTION]
+            actions = [
+                {
+                    "Put": {
+                        "TableName": self.table_name,
+                        "Item": self.serializer.serialize(
+                            {
+                                "sessionId": f"aggbatch#{batch_id}#{offset}",
+                                "createdAt": self.SORT_KEY,
+                                "expiresAt": now + self.MARKER_TTL_SECONDS,
+                            }
+                        ),
+                        "ConditionExpression": "attribute_not_exists(sessionId)",
+                    }
+                }
+            ]
+            for aggregate_id in chunk:
+                actions.append(
+                    {"Update": self._update_request(aggregate_id, totals[aggregate_id])}
+                )
+
+            try:
+                self.client.transact_write_items(TransactItems=actions)
+                updated += len(chunk)
+            except ClientError as e:
+                reasons = e.response.get("CancellationReasons") or []
+                if (
+                    e.response["Error"]["Code"] == "TransactionCanceledException"
+                    and reasons
+                    and reasons[0].get("Code") == "ConditionalCheckFailed"
+                ):
+                    logger.info(
+                        "Lote do stream já aplicado aos agregados",
+                        extra={"batch_id": batch_id, "offset": offset},
+                    )
+                    continue
+                raise
+
+        logger.info(
+            "Agregados atualizados",
+            extra={
+                "batch_id": batch_id,
+                "aggregates": updated,
+                "records": len(records),
+            },
+        )
+        return updated
+
+    def _update_request(self, aggregate_id, counters):
+        names = {"#updatedAt": "updatedAt"}
+        values = {":updatedAt": {"S": datetime.utcnow().isoformat()}}
+        additions = []
+        for index, (name, value) in enumerate(sorted(counters.items())):
+            names[f"#c{index}"] = name
+            values[f":c{index}"] = ItemSerializer.serialize_value(value)
+            additions.append(f"#c{index} :c{index}")
+
+        return {
+            "TableName": self.table_name,
+            "Key": {
+                "sessionId": {"S": aggregate_id},
+                "createdAt": {"S": self.SORT_KEY},
+            },
+            "UpdateExpression": f"ADD {', '.join(additions)} SET #updatedAt = :updatedAt",
+            "ExpressionAttributeNames": names,
+            "ExpressionAttributeValues": values,
+        }
+
+    @classmethod
+    def _with_rates(cls, aggregate):
+        """Acrescenta as taxas de aprovação calculadas a partir dos contadores."""
+        pre_approvals = aggregate.get("preApprovals", 0)
+        reimbursements = aggregate.get("reimbursements", 0)
+        aggregate["preApprovalRate"] = (
+            float(aggregate.get("preApprovalApproved", 0)) / pre_approvals
+            if pre_approvals
+            else None
+        )
+        aggregate["reimbursementApprovalRate"] = (
+            float(aggregate.get("reimbursementApproved", 0)) / reimbursements
+            if reimbursements
+            else None
+        )
+        return aggregate
+
+    def get(self, aggregate_id):
+        """
+        Lê um agregado ("agg#all", "agg#plan#premium", "agg#day#2025-10-01").
+
+        Returns:
+            dict: Contadores e taxas de aprovação (zerados se não existir)
+        """
+        response = self.client.get_item(
+            TableName=self.table_name,
+            Key={"sessionId": {"S": aggregate_id}, "createdAt": {"S": self.SORT_KEY}},
+        )
+        aggregate = ItemSerializer.deserialize(response.get("Item", {}))
+        aggregate.pop("createdAt", None)
+        aggregate["sessionId"] = aggregate_id
+        return self._with_rates(aggregate)
+
+    def get_plan(self, plan_tier):
+        """Agregado de um plano dental."""
+        return self.get(f"agg#plan#{str(plan_tier).lower()}")
+
+    def get_days(self, start_date, end_date):
+        """
+        Agregados diários de um intervalo (inclusivo) com BatchGetItem.
+
+        Returns:
+            list: Um agregado por dia, em ordem cronológica
+        """
+        start = datetime.strptime(start_date, "%Y-%m-%d").date()
+        end = datetime.strptime(end_date, "%Y-%m-%d").date()
+        if not 0 <= (end - start).days < self.MAX_RANGE_DAYS:
+            raise ValueError(
+                f"Intervalo deve ter de 1 a {self.MAX_RANGE_DAYS} dias (AAAA-MM-DD)"
+            )
+        days = [
+            date.fromordinal(ordinal).isoformat()
+            for ordinal in range(start.toordinal(), end.toordinal() + 1)
+        ]
+
+        found = {}
+        for offset in range(0, len(days), 100):
+            keys = [
+                {
+                    "sessionId": {"S": f"agg#day#{day}"},
+                    "createdAt": {"S": self.SORT_KEY},
+                }
+                for day in days[offset : offset + 100]
+            ]
+            request = {self.table_name: {"Keys": keys}}
+            attempt = 0
+            while request:
+                response = self.client.batch_get_item(RequestItems=request)
+                for item in response.get("Responses", {}).get(self.table_name, []):
+                    aggregate = ItemSerializer.deserialize(item)
+                    found[aggregate["sessionId"]] = aggregate
+                request = response.get("UnprocessedKeys") or {}
+                if request:
+                    attempt += 1
+                    time.sleep(min(0.05 * 2**attempt, 2.0) * random.random())
+
+        results = []
+        for day in days:
+            aggregate = found.get(f"agg#day#{day}", {})
+            aggregate.pop("createdAt", None)
+            aggregate["sessionId"] = f"agg#day#{day}"
+            aggregate["date"] = day
+            results.append(self._with_rates(aggregate))
+        return results
+
+
+class ClaimArchive:
+    """
+    Camada fria dos sinistros: itens expirados por TTL arquivados no S3.
+
+    O stream entrega as remoções feitas pelo TTL (userIdentity do serviço
+    DynamoDB); cada lote vira um arquivo JSONL comprimido com gzip por
+    partição, em "<prefixo>claimType=<tipo>/date=<AAAA-MM-DD>/<lote>.jsonl.gz".
+    O nome do arquivo deriva dos eventIDs do lote, então uma reentrega
+    sobrescreve o mesmo objeto em vez de duplicar registros.
+    """
+
+    TTL_PRINCIPAL = "dynamodb.amazonaws.com"
+    MAX_RANGE_DAYS = 366
+
+    def __init__(self, bucket, s3_client=None, prefix=None):
+        self.bucket = bucket
+        self.s3 = s3_client or boto3.client("s3")
+        self.prefix = (
+            prefix
+            if prefix is not None
+            else os.environ.get("ARCHIVE_PREFIX", "claims-archive/")
+        )
+
+    @classmethod
+    def is_ttl_removal(cls, record):
+        """Indica se o registro do stream é uma expiração feita pelo TTL."""
+        identity = record.get("userIdentity") or {}
+        return (
+            record.get("eventName") == "REMOVE"
+            and identity.get("type") == "Service"
+            and identity.get("principalId") == cls.TTL_PRINCIPAL
+        )
+
+    @staticmethod
+    def _json_default(value):
+        if isinstance(value, Decimal):
+            return int(value) if value == value.to_integral_value() else float(value)
+        if isinstance(value, (set, frozenset)):
+            return sorted(value)
+        if isinstance(value, (bytes, bytearray)):
+            return base64.b64encode(value).decode("ascii")
+        return str(value)
+
+    def _partition_prefix(self, claim_type, day):
+        return f"{self.prefix}claimType={claim_type}/date={day}/"
+
+    def archive_stream_records(self, records):
+        """
+        Arquiva os sinistros expirados de um lote do stream.
+
+        Returns:
+            int: Quantidade de sinistros arquivados
+        """
+        partitions = {}
+        for record in records:
+            if not self.is_ttl_removal(record):
+                continue
+            image = record.get("dynamodb", {}).get("OldImage")
+            if not image:
+                continue
+            claim = ClaimAggregates.stream_image(image)
+            if claim.get("claimType") not in ClaimAggregates.CLAIM_TYPES:
+                continue
+
+            # Chaves dos GSIs só fazem sentido na tabela quente
+            claim.pop("g1pk", None)
+            claim.pop("g2pk", None)
+            claim["archivedAt"] = datetime.utcnow().isoformat()
+            key = (claim["claimType"], claim.get("createdAt", "")[:10] or "unknown")
+            partitions.setdefault(key, []).append(claim)
+
+        if not partitions:
+            return 0
+
+        batch_id = hashlib.sha256(
+            "|".join(record.get("eventID", "") for record in records).encode("utf-8")
+        ).hexdigest()[:32]
+
+        archived = 0
+        for (claim_type, day), claims in sorted(partitions.items()):
+            claims.sort(key=lambda claim: claim.get("createdAt", ""))
+            body = "".join(
+                json.dumps(
+                    claim,
+                    ensure_ascii=False,
+                    separators=(",", ":"),
+                    default=self._json_default,
+                )
+                + "\n"
+                for claim in claims
+            )
+            self.s3.put_object(
+                Bucket=self.bucket,
+                Key=f"{self._partition_prefix(claim_type, day)}{batch_id}.jsonl.gz",
+                Body=gzip.compress(body.encode("utf-8"), mtime=0),
+                ContentType="application/x-ndjson",
+                ContentEncoding="gzip",
+            )
+            archived += len(claims)
+
+        logger.info(
+            "Sinistros expirados arquivados",
+            extra={
+                "batch_id": batch_id,
+                "claims": archived,
+                "partitions": len(partitions),
+            },
+        )
+        return archived
+
+    def query(
+        self,
+        start_date,
+        end_date,
+        claim_type=None,
+        session_id=None,
+        status=None,
+        plan_tier=None,
+        limit=None,
+    ):
+        """
+        Consulta o arquivo frio por intervalo de datas (podando partições).
+
+        Args:
+            start_date/end_date: Dias AAAA-MM-DD (inclusivos) de createdAt
+            claim_type: Restringe a um tipo de sinistro
+            session_id/status/plan_tier: Filtros opcionais por registro
+            limit: Máximo de registros retornados
+
+        Returns:
+            list: Sinistros arquivados, em ordem de partição e createdAt
+        """
+        start = datetime.strptime(start_date, "%Y-%m-%d").date()
+        end = datetime.strptime(end_date, "%Y-%m-%d").date()
+        if not 0 <= (end - start).days < self.MAX_RANGE_DAYS:
+            raise ValueError(
+                f"Intervalo deve ter de 1 a {self.MAX_RANGE_DAYS} dias (AAAA-MM-DD)"
+            )
+
+        claim_types = [claim_type] if claim_type else list(ClaimAggregates.CLAIM_TYPES)
+        plan_tier = str(plan_tier).lower() if plan_tier else None
+        results = []
+
+        for ordinal in range(start.toordinal(), end.toordinal() + 1):
+            day = date.fromordinal(ordinal).isoformat()
+            for current_type in claim_types:
+                for key in self._list_partition(current_type, day):
+                    for claim in self._read_object(key):
+                        if session_id and claim.get("sessionId") != session_id:
+                            continue
+                        if status and claim.get("status") != status:
+                            continue
+                        if (
+                            plan_tier
+                            and str(claim.get("planTier", "")).lower() != plan_tier
+                        ):
+                            continue
+                        results.append(claim)
+                        if limit and len(results) >= limit:
+                            return results
+
+        return results
+
+    def _list_partition(self, claim_type, day):
+        paginator = self.s3.get_paginator("list_objects_v2")
+        for page in paginator.paginate(
+            Bucket=self.bucket, Prefix=self._partition_prefix(claim_type, day)
+        ):
+            for obj in page.get("Contents", []):
+                yield obj["Key"]
+
+    def _read_object(self, key):
+        body = self.s3.get_object(Bucket=self.bucket, Key=key)["Body"].read()
+        for line in gzip.decompress(body).decode("utf-8").splitlines():
+            if line:
+                yield json.loads(line)
+
+
+class ItemSerializer:
+    """
+    Serializador de itens para o cliente DynamoDB de baixo nível.
+
+    Os atributos conhecidos do esquema de sinistros têm o conversor
+    resolvido uma única vez (KNOWN_ATTRIBUTE_TYPES); os demais passam pelo
+    conversor genérico. Floats são aceitos e gravados com repr(), sem a
+    exigência de Decimal do TypeSerializer do boto3.
+    """
+
+    KNOWN_ATTRIBUTE_TYPES = {
+        "sessionId": "S",
+        "createdAt": "S",
+        "claimType": "S",
+        "v": "N",
+        "ps": "S",
+        "sy": "S|B",
+        "pt": "S",
+        "lo": "S",
+        "dg": "S|B",
+        "pa": "S|B",
+        "cl": "L<S>",
+        "st": "S",
+        "dk": "S",
+        "pv": "N",
+        "rr": "S|B",
+        "ra": "N",
+        "dd": "S|B",
+        "fp": "L<S>",
+        "du": "S",
+        "sp": "S",
+        "df": "N",
+        "rv": "S",
+        "ownerSessionId": "S",
+        "documentKey": "S",
+        "registeredAt": "S",
+        "g1pk": "S",
+        "g2pk": "S",
+        "expiresAt": "N",
+    }
+
+    def __init__(self, attribute_types=None):
+        types = attribute_types or self.KNOWN_ATTRIBUTE_TYPES
+        compilers = {
+            "S": self._compile_string,
+            "N": self._compile_number,
+            "S|B": self._compile_string_or_binary,
+            "L<S>": self._compile_string_list,
+        }
+        self.plans = {name: compilers[kind]() for name, kind in types.items()}
+
+    def serialize(self, item):
+        """
+        Converte um item Python para o formato AttributeValue.
+
+        Atributos com valor None são omitidos.
+
+        Args:
+            item: dict com valores Python (str, int, float, Decimal, bytes...)
+
+        Returns:
+            dict: Item no formato do cliente de baixo nível
+        """
+        plans = self.plans
+        generic = self.serialize_value
+        return {
+            name: (plans.get(name) or generic)(value)
+            for name, value in item.items()
+            if value is not None
+        }
+
+    def _compile_string(self):
+        generic = self.serialize_value
+
+        def convert(value):
+            return {"S": value} if value.__class__ is str else generic(value)
+
+        return convert
+
+    def _compile_number(self):
+        generic = self.serialize_value
+
+        def convert(value):
+            if value.__class__ is int:
+                return {"N": str(value)}
+            return generic(value)
+
+        return convert
+
+    def _compile_string_or_binary(self):
+        generic = self.serialize_value
+
+        def convert(value):
+            if value.__class__ is str:
+                return {"S": value}
+            if value.__class__ is bytes:
+                return {"B": value}
+            return generic(value)
+
+        return convert
+
+    def _compile_string_list(self):
+        generic = self.serialize_value
+
+        def convert(value):
+            if value.__class__ is list and all(
+                element.__class__ is str for element in value
+            ):
+                return {"L": [{"S": element} for element in value]}
+            return generic(value)
+
+        return convert
+
+    @staticmethod
+    def serialize_value(value):
+        """Conversor genérico para qualquer valor suportado pelo DynamoDB."""
+        if value is None:
+            return {"NULL": True}
+        if isinstance(value, bool):
+            return {"BOOL": value}
+        if isinstance(value, str):
+            return {"S": value}
+        if isinstance(value, (bytes, bytearray)):
+            return {"B": bytes(value)}
+        if isinstance(value, int):
+            return {"N": str(value)}
+        if isinstance(value, float):
+            if value != value or value in (float("inf"), float("-inf")):
+                raise ValueError(f"Valor numérico inválido para o DynamoDB: {value}")
+            return {"N": repr(value)}
+        if isinstance(value, Decimal):
+            return {"N": str(value)}
+        if isinstance(value, dict):
+            return {
+                "M": {
+                    str(name): ItemSerializer.serialize_value(nested)
+                    for name, nested in value.items()
+                }
+            }
+        if isinstance(value, (list, tuple)):
+            return {"L": [ItemSerializer.serialize_value(nested) for nested in value]}
+        if isinstance(value, (set, frozenset)):
+            if all(isinstance(element, str) for element in value):
+                return {"SS": sorted(value)}
+            return {"NS": sorted(str(element) for element in value)}
+        raise TypeError(f"Tipo não suportado pelo DynamoDB: {type(value).__name__}")
+
+    @staticmethod
+    def deserialize(item):
+        """
+        Converte um item no formato AttributeValue para Python.
+
+        Números inteiros viram int e os demais Decimal.
+        """
+        return {
+            name: ItemSerializer.deserialize_value(value)
+            for name, value in item.items()
+        }
+
+    @staticmethod
+    def deserialize_value(value):
+        kind, data = next(iter(value.items()))
+        if kind == "S" or kind == "BOOL":
+            return data
+        if kind == "N":
+            return int(data) if data.lstrip("-").isdigit() else Decimal(data)
+        if kind == "B":
+            return bytes(data)
+        if kind == "M":
+            return {
+                name: ItemSerializer.deserialize_value(nested)
+                for name, nested in data.items()
+            }
+        if kind == "L":
+            return [ItemSerializer.deserialize_value(nested) for nested in data]
+        if kind == "NULL":
+            return None
+        if kind == "SS":
+            return set(data)
+        if kind == "NS":
+            return {
+                int(number) if number.lstrip("-").isdigit() else Decimal(number)
+                for number in data
+            }
+        if kind == "BS":
+            return {bytes(element) for element in data}
+        raise TypeError(f"Tipo DynamoDB desconhecido: {kind}")
+
+
+class BatchWriteBuffer:
+    """
+    Acumula itens e os grava com BatchWriteItem em grupos de 25.
+
+    O buffer é descarregado quando atinge max_items, quando o item mais antigo
+    espera mais que max_wait_seconds (verificado a cada add) ou quando flush()
+    é chamado ao final da invocação. Os grupos são enviados em paralelo e os
+    UnprocessedItems são reenviados com backoff exponencial.
+    """
+
+    BATCH_SIZE = 25
+
+    def __init__(
+        self,
+        client,
+        table_name,
+        key_attributes=("sessionId", "createdAt"),
+        max_items=250,
+        max_wait_seconds=1.0,
+        parallelism=4,
+        max_retries=8,
+        serializer=None,
+    ):
+        self.client = client
+        self.table_name = table_name
+        self.key_attributes = key_attributes
+        self.max_items = max_items
+        self.max_wait_seconds = max_wait_seconds
+        self.max_retries = max_retries
+        self.serializer = serializer or ItemSerializer()
+        self.executor = ThreadPoolExecutor(max_workers=parallelism)
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.oldest_at = None
+        self.stats = {"items": 0, "batches": 0, "retries": 0, "failed": 0}
+
+    def add(self, item):
+        """Adiciona um item; o último item com a mesma chave prevalece."""
+        key = tuple(item.get(attribute) for attribute in self.key_attributes)
+        with self.lock:
+            if not self.pending:
+                self.oldest_at = time.monotonic()
+            self.pending[key] = item
+            should_flush = (
+                len(self.pending) >= self.max_items
+                or time.monotonic() - self.oldest_at >= self.max_wait_seconds
+            )
+
+        if should_flush:
+            self.flush()
+
+    def flush(self):
+        """
+        Grava todos os itens pendentes.
+
+        Returns:
+            int: Quantidade de itens que não puderam ser gravados
+        """
+        with self.lock:
+            items = list(self.pending.values())
+            self.pending = {}
+            self.oldest_at = None
+
+        if not items:
+            return 0
+
+        requests = [
+            {"PutRequest": {"Item": self.serializer.serialize(item)}} for item in items
+        ]
+        batches = [
+            requests[start : start + self.BATCH_SIZE]
+            for start in range(0, len(requests), self.BATCH_SIZE)
+        ]
+        # Cada worker retorna (falhas, retentativas); os contadores são
+        # somados aqui, sob o lock, já que flush() pode rodar em paralelo
+        results = list(self.executor.map(self._write_batch, batches))
+        failed = sum(batch_failed for batch_failed, _ in results)
+
+        with self.lock:
+            self.stats["items"] += len(items) - failed
+            self.stats["batches"] += len(batches)
+            self.stats["retries"] += sum(retries for _, retries in results)
+            self.stats["failed"] += failed
+        if failed:
+            logger.error(
+                "Itens não gravados após retentativas do BatchWriteItem",
+                extra={"failed_items": failed, "table": self.table_name},
+            )
+        return failed
+
+    def _write_batch(self, requests):
+        """
+        Envia um grupo e reenvia os UnprocessedItems com backoff.
+
+        Returns:
+            tuple: (itens não gravados, retentativas feitas)
+        """
+        attempt = 0
+        while requests:
+            try:
+                response = self.client.batch_write_item(
+                    RequestItems={self.table_name: requests}
+                )
+                requests = response.get("UnprocessedItems", {}).get(self.table_name, [])
+            except ClientError as e:
+                if e.response["Error"]["Code"] not in (
+                    "ProvisionedThroughputExceededException",
+                    "ThrottlingException",
+                    "RequestLimitExceeded",
+                ):
+                    logger.error(
+                        "Erro no BatchWriteItem",
+                        extra={"error_code": e.response["Error"]["Code"]},
+                    )
+                    return len(requests), attempt
+
+            if not requests:
+                break
+            if attempt >= self.max_retries:
+                return len(requests), attempt
+
+            attempt += 1
+            # Backoff exponencial com jitter completo
+            time.sleep(random.uniform(0, min(0.05 * 2**attempt, 5.0)))
+
+        return 0, attempt
+
+
+class ReadCache:
+    """
+    Cache LRU com TTL por container, para as leituras do DataManager.
+
+    Guarda também ausências (cache negativo, com TTL menor) para que chaves
+    inexistentes não voltem ao DynamoDB a cada chamada. Thread-safe; as
+    métricas estimam a latência economizada pela média móvel das leituras
+    que foram ao backend.
+    """
+
+    MISSING = object()
+
+    def __init__(self, max_entries=1024, ttl_seconds=30.0, negative_ttl_seconds=5.0):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.negative_ttl_seconds = negative_ttl_seconds
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.backend_latency_ms = None
+        self.stats = {
+            "hits": 0,
+            "negative_hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "invalidations": 0,
+            "saved_ms": 0.0,
+        }
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+
+    def get(self, key):
+        """
+        Returns:
+            tuple: (encontrado, valor); valor é None para ausências em cache
+        """
+        if not self.enabled:
+            return False, None
+
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self.entries[key]
+                self.stats["misses"] += 1
+                return False, None
+
+            self.entries.move_to_end(key)
+            if entry[1] is self.MISSING:
+                self.stats["negative_hits"] += 1
+            else:
+                self.stats["hits"] += 1
+            self.stats["saved_ms"] += self.backend_latency_ms or 0.0
+
+        if entry[1] is self.MISSING:
+            return True, None
+        return True, copy.deepcopy(entry[1])
+
+    def put(self, key, value):
+        """Armazena um valor (None registra a ausência da chave)."""
+        if not self.enabled:
+            return
+
+        if value is None:
+            expires_at = time.monotonic() + self.negative_ttl_seconds
+            value = self.MISSING
+        else:
+            expires_at = time.monotonic() + self.ttl_seconds
+            value = copy.deepcopy(value)
+
+        with self.lock:
+            self.entries[key] = (expires_at, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    def invalidate(self, *keys):
+        with self.lock:
+            for key in keys:
+                if self.entries.pop(key, None) is not None:
+                    self.stats["invalidations"] += 1
+
+    def record_backend_latency(self, elapsed_ms):
+        """Atualiza a média móvel da latência de uma leitura no backend."""
+        with self.lock:
+            if self.backend_latency_ms is None:
+                self.backend_latency_ms = elapsed_ms
+            else:
+                self.backend_latency_ms += 0.2 * (elapsed_ms - self.backend_latency_ms)
+
+    def metrics(self):
+        with self.lock:
+            lookups = (
+                self.stats["hits"] + self.stats["negative_hits"] + self.stats["misses"]
+            )
+            return {
+                **self.stats,
+                "lookups": lookups,
+                "saved_ms": round(self.stats["saved_ms"], 1),
+                "entries": len(self.entries),
+                "hit_ratio": (
+                    round(
+                        (self.stats["hits"] + self.stats["negative_hits"]) / lookups, 4
+                    )
+                    if lookups
+                    else None
+                ),
+                "backend_latency_ms": (
+                    round(self.backend_latency_ms, 2)
+                    if self.backend_latency_ms is not None
+                    else None
+                ),
+            }
+
+
+class DocumentProcessor:
+    """Processa documentos usando Amazon Textract para extração de dados."""
+
+    # Códigos do Textract que indicam limite de TPS excedido (retentáveis)
+    THROTTLING_ERROR_CODES = (
+        "ThrottlingException",
+        "ProvisionedThroughputExceededException",
+        "LimitExceededException",
+    )
+
+    def __init__(self, textract_client=None, documents_bucket=None, s3_client=None):
+        self.textract = textract_client or boto3.client("textract")
+        self.s3 = s3_client or boto3.client("s3")
+        self.documents_bucket = documents_bucket or os.environ["DOCUMENTS_BUCKET"]
+        logger.info("DocumentProcessor inicializado")
+
+    # Documentos maiores que isso não são baixados para o caminho rápido
+    MAX_ELECTRONIC_SCAN_BYTES = 5 * 1024 * 1024
+
+    def process_receipt(self, document_key):
+        """
+        Processa recibo/nota fiscal.
+
+        Notas fiscais eletrônicas (XML de NF-e/NFS-e, ou PDF com o XML
+        embutido) são lidas diretamente dos dados estruturados; o Textract só
+        é usado como fallback. Quando o PDF traz apenas a chave de acesso, os
+        dados da chave complementam o resultado do Textract.
+
+        Args:
+            document_key: Chave do documento no S3
+
+        Returns:
+            dict: Dados extraídos do documento
+        """
+        try:
+            electronic_data = self._process_electronic_invoice(document_key)
+            if electronic_data and electronic_data.get("total_amount"):
+                logger.info(
+                    "Nota fiscal eletrônica processada sem OCR",
+                    extra={
+                        "document_key": document_key,
+                        "source": electronic_data.get("source"),
+                        "fields_extracted": len(electronic_data),
+                    },
+                )
+                return electronic_data
+
+            logger.info(
+                "Iniciando análise de documento com Textract",
+                extra={"document_key": document_key},
+            )
+
+            response = self.textract.analyze_expense(
+                Document={
+                    "S3Object": {"Bucket": self.documents_bucket, "Name": document_key}
+                }
+            )
+
+            extracted_data = self._extract_expense_data(response)
+            if not extracted_data.get("error"):
+                # Dados da chave de acesso têm precedência sobre o OCR
+                extracted_data.update(electronic_data or {})
+                if "image_hash" not in extracted_data:
+                    image_hash = self._get_image_hash(document_key)
+                    if image_hash:
+                        extracted_data["image_hash"] = image_hash
+
+            logger.info(
+                "Análise Textract concluída",
+                extra={
+                    "fields_extracted": len(extracted_data),
+                    "has_amount": "total_amount" in extracted_data,
+                },
+            )
+
+            return extracted_data
+
+        except ClientError as e:
+            error_code = e.response["Error"]["Code"]
+            logger.error(
+                "Erro no Textract",
+                extra={
+                    "error_code": error_code,
+                    "document_key": document_key,
+                },
+            )
+
+            if error_code == "InvalidParameterException":
+                return {"error": "invalid_document_format"}
+            elif error_code in self.THROTTLING_ERROR_CODES:
+                return {"error": "textract_throttled"}
+            else:
+                return {"error": "textract_service_error"}
+
+        except Exception as e:
             logger.error(
                 "Erro inesperado no Textract",
                 extra={"error_type": type(e).__name__, "error_message": str(e)},
             )
             return {"error": "unexpected_error"}
 
+    def _process_electronic_invoice(self, document_key):
+        """
+        Tenta ler o documento como nota fiscal eletrônica, sem OCR.
+
+        Args:
+            document_key: Chave do documento no S3
+
+        Returns:
+            dict: Dados completos (XML), dados parciais da chave de acesso
+                (PDF), ou None quando o documento não é uma nota eletrônica
+        """
+        extension = document_key.rsplit(".", 1)[-1].lower()
+        if extension not in ("xml", "pdf"):
+            return None
+
+        try:
+            response = self.s3.get_object(
+                Bucket=self.documents_bucket, Key=document_key
+            )
+            if response.get("ContentLength", 0) > self.MAX_ELECTRONIC_SCAN_BYTES:
+                return None
+
+            content = response["Body"].read()
+            hints = {"image_hash": response.get("ETag", "").strip('"')}
+
+            if extension == "xml" or content.lstrip()[:5] == b"<?xml":
+                invoice = ElectronicInvoiceParser.parse_xml(content)
+            else:
+                invoice = ElectronicInvoiceParser.parse_pdf(content)
+
+            if not invoice:
+                return None
+            return {**hints, **invoice}
+
+        except (ClientError, BotoCoreError) as e:
+            logger.warning(
+                "Não foi possível ler o documento para o caminho eletrônico",
+                extra={"document_key": document_key, "error": str(e)},
+            )
+            return None
+
+    def _get_image_hash(self, document_key):
+        """
+        Obtém o hash do arquivo no S3 (ETag) para detectar reenvio do mesmo arquivo.
+
+        Args:
+            document_key: Chave do documento no S3
+
+        Returns:
+            str: ETag do objeto, ou None se não for possível obtê-lo
+        """
+        try:
+            response = self.s3.head_object(
+                Bucket=self.documents_bucket, Key=document_key
+            )
+            return response.get("ETag", "").strip('"') or None
+
+        except (ClientError, BotoCoreError) as e:
+            logger.warning(
+                "Não foi possível obter o hash do documento",
+                extra={"document_key": document_key, "error": str(e)},
+            )
+            return None
+
+    # Mapeamento exato dos tipos de SummaryFields do Textract AnalyzeExpense.
+    # Cada tipo aponta para (campo_destino, parser, prioridade); prioridade
+    # menor vence, e dentro da mesma prioridade vence a maior confiança.
+    SUMMARY_FIELD_DISPATCH = {
+        "TOTAL": ("total_amount", "currency", 0),
+        "AMOUNT_PAID": ("total_amount", "currency", 1),
+        "AMOUNT_DUE": ("total_amount", "currency", 2),
+        "SUBTOTAL": ("subtotal_amount", "currency", 0),
+        "TAX": ("tax_amount", "currency", 0),
+        "DISCOUNT": ("discount_amount", "currency", 0),
+        "INVOICE_RECEIPT_DATE": ("date", "text", 0),
+        "ORDER_DATE": ("date", "text", 1),
+        "DELIVERY_DATE": ("date", "text", 2),
+        "VENDOR_NAME": ("provider_name", "text", 0),
+        "NAME": ("provider_name", "text", 1),
+        "VENDOR_ADDRESS": ("provider_address", "text", 0),
+        "VENDOR_PHONE": ("provider_phone", "text", 0),
+        "VENDOR_VAT_NUMBER": ("provider_tax_id", "text", 0),
+        "TAX_PAYER_ID": ("provider_tax_id", "text", 1),
+        "INVOICE_RECEIPT_ID": ("document_number", "text", 0),
+        "RECEIVER_NAME": ("patient_name", "text", 0),
+    }
+
+    # Mapeamento dos campos de LineItemExpenseFields para colunas do procedimento
+    LINE_ITEM_FIELD_DISPATCH = {
+        "ITEM": ("description", "text"),
+        "PRICE": ("amount", "currency"),
+        "UNIT_PRICE": ("unit_price", "currency"),
+        "QUANTITY": ("quantity", "text"),
+        "PRODUCT_CODE": ("code", "text"),
+    }
+
     def _extract_expense_data(self, textract_response):
         """
         Extrai dados estruturados da resposta do Textract.
 
+        Os SummaryFields são resolvidos por tipo exato (SUMMARY_FIELD_DISPATCH)
+        e, quando mais de um campo disputa o mesmo destino, é mantido o de
+        maior prioridade e confiança. Os LineItemGroups viram a lista de
+        procedimentos em "procedures", cada um com sua confiança.
+
         Args:
             textract_response: Resposta da API Textract
 
@@ -1156,32 +3288,62 @@ class DocumentProcessor:
             dict: Dados extraídos do documento
         """
         extracted_data = {}
+        field_confidence = {}
+        field_rank = {}
+        procedures = []
 
         try:
             for expense_doc in textract_response.get("ExpenseDocuments", []):
                 for summary_field in expense_doc.get("SummaryFields", []):
-                    field_type = summary_field.get("Type", {}).get("Text", "").lower()
-                    field_text = summary_field.get("ValueDetection", {}).get("Text", "")
-
-                    # Mapear campos relevantes
-                    if "total" in field_type or "amount" in field_type:
-                        extracted_data["total_amount"] = self._extract_currency_value(
-                            field_text
-                        )
-                    elif "date" in field_type:
-                        extracted_data["date"] = field_text
-                    elif "vendor" in field_type or "provider" in field_type:
-                        extracted_data["provider_name"] = field_text
-                    elif "description" in field_type:
-                        extracted_data["procedure_description"] = field_text
-                    elif "tax" in field_type:
-                        extracted_data["tax_amount"] = self._extract_currency_value(
+                    field_type = summary_field.get("Type", {}).get("Text", "")
+                    dispatch = self.SUMMARY_FIELD_DISPATCH.get(field_type.upper())
+                    if dispatch is None:
+                        continue
+
+                    target, parser, priority = dispatch
+                    value_detection = summary_field.get("ValueDetection", {})
+                    field_text = value_detection.get("Text", "")
+                    if not field_text:
+                        continue
+
+                    confidence = value_detection.get("Confidence", 0.0)
+                    rank = (priority, -confidence)
+                    if target in field_rank and field_rank[target] <= rank:
+                        continue
+
+                    if parser == "currency":
+                        extracted_data[target] = self._extract_currency_value(
                             field_text
                         )
+                    else:
+                        extracted_data[target] = field_text
+                    field_rank[target] = rank
+                    field_confidence[target] = round(confidence, 2)
+
+                for line_item_group in expense_doc.get("LineItemGroups", []):
+                    for line_item in line_item_group.get("LineItems", []):
+                        procedure = self._extract_line_item(line_item)
+                        if procedure:
+                            procedures.append(procedure)
+
+            if procedures:
+                extracted_data["procedures"] = procedures
+                if "procedure_description" not in extracted_data:
+                    extracted_data["procedure_description"] = "; ".join(
+                        procedure["description"]
+                        for procedure in procedures
+                        if procedure.get("description")
+                    )
+
+            if field_confidence:
+                extracted_data["field_confidence"] = field_confidence
 
             logger.info(
                 "Dados extraídos do documento",
-                extra={"extracted_fields": list(extracted_data.keys())},
+                extra={
+                    "extracted_fields": list(extracted_data.keys()),
+                    "procedures_count": len(procedures),
+                },
             )
 
             return extracted_data
@@ -1192,46 +3354,474 @@ class DocumentProcessor:
             )
             return {"error": "data_extraction_failed"}
 
-    def _extract_currency_value(self, text):
+    def _extract_line_item(self, line_item):
+        """
+        Converte um LineItem do Textract em uma linha de procedimento.
+
+        Args:
+            line_item: Item de LineItemGroups.LineItems
+
+        Returns:
+            dict: Procedimento com descrição, valores e confiança (ou None)
+        """
+        procedure = {}
+        confidences = []
+
+        for field in line_item.get("LineItemExpenseFields", []):
+            field_type = field.get("Type", {}).get("Text", "").upper()
+            dispatch = self.LINE_ITEM_FIELD_DISPATCH.get(field_type)
+            if dispatch is None:
+                continue
+
+            target, parser = dispatch
+            value_detection = field.get("ValueDetection", {})
+            field_text = value_detection.get("Text", "")
+            if not field_text or target in procedure:
+                continue
+
+            if parser == "currency":
+                procedure[target] = self._extract_currency_value(field_text)
+            else:
+                procedure[target] = field_text
+            confidences.append(value_detection.get("Confidence", 0.0))
+
+        if not procedure:
+            return None
+
+        # A confiança da linha é a do campo menos confiável
+        procedure["confidence"] = round(min(confidences), 2)
+        return procedure
+
+    def _extract_currency_value(self, text):
+        """
+        Extrai valor numérico de string de moeda.
+
+        Args:
+            text: Texto contendo valor monetário
+
+        Returns:
+            float: Valor numérico extraído (0.0 quando não reconhecido)
+        """
+        value = CurrencyParser.parse(text)
+        if value is None:
+            if text:
+                logger.warning(
+                    "Erro ao extrair valor monetário", extra={"original_text": text}
+                )
+            return 0.0
+        return value
+
+
+class PlanRules:
+    """
+    Regras dos planos (cobertura e reembolso) compiladas de uma tabela versionada.
+
+    A tabela (JSON, ou YAML se PyYAML estiver instalado) vem do S3
+    (PLAN_RULES_BUCKET/PLAN_RULES_KEY) ou do arquivo do pacote
+    (plan_rules.json ao lado do módulo) e é compilada uma vez por container:
+    nomes e aliases normalizados em um dicionário, listas em frozensets.
+    Cobertura e reembolso são avaliados da mesma tabela, toda decisão leva
+    a versão das regras usada e plano desconhecido é recusado em vez de
+    cair no básico.
+    """
+
+    RULES_FILE = "plan_rules.json"
+
+    def __init__(self, table, source=None):
+        try:
+            self.version = str(table["version"])
+            self.warning_penalty = float(table.get("warning_penalty", 0.0))
+            self.plans = {}
+            self.aliases = {}
+            for name, rules in table["plans"].items():
+                name = self._normalize(name)
+                self.plans[name] = {
+                    "coverage_percentage": float(rules["coverage_percentage"]),
+                    "max_amount": float(rules["max_amount"]),
+                    "covered_conditions": frozenset(
+                        rules.get("covered_conditions", [])
+                    ),
+                    "denied_urgency_levels": frozenset(
+                        self._normalize(level)
+                        for level in rules.get("denied_urgency_levels", [])
+                    ),
+                    "denied_complexities": frozenset(
+                        self._normalize(level)
+                        for level in rules.get("denied_complexities", [])
+                    ),
+                }
+                self.aliases[name] = name
+                for alias in rules.get("aliases", []):
+                    self.aliases[self._normalize(alias)] = name
+            self.procedure_matcher = ProcedureMatcher(table.get("procedures", {}))
+        except (AttributeError, KeyError, TypeError, ValueError) as e:
+            raise ValueError(f"Tabela de regras de planos inválida: {e}") from e
+
+        unknown_codes = {
+            code
+            for rules in self.plans.values()
+            for code in rules["covered_conditions"]
+            if code not in self.procedure_matcher.codes
+        }
+        if self.procedure_matcher.codes and unknown_codes:
+            raise ValueError(
+                f"Procedimentos cobertos fora do catálogo: {sorted(unknown_codes)}"
+            )
+
+        if not self.plans:
+            raise ValueError("Tabela de regras de planos sem planos")
+        if not 0.0 <= self.warning_penalty < 1.0 or any(
+            not 0.0 <= rules["coverage_percentage"] <= 1.0
+            for rules in self.plans.values()
+        ):
+            raise ValueError("Percentuais fora do intervalo [0, 1]")
+
+        self.source = source
+        logger.info(
+            "Regras de planos carregadas",
+            extra={
+                "rules_version": self.version,
+                "source": source,
+                "plans": sorted(self.plans),
+            },
+        )
+
+    @staticmethod
+    def _normalize(value):
+        text = unicodedata.normalize("NFKD", str(value or ""))
+        text = "".join(char for char in text if not unicodedata.combining(char))
+        return " ".join(text.lower().split())
+
+    @classmethod
+    def from_document(cls, body, name, source=None):
+        """Compila a tabela de um documento JSON ou YAML (pela extensão)."""
+        if name.endswith((".yaml", ".yml")):
+            try:
+                import yaml
+            except ImportError as e:
+                raise ValueError("PyYAML não instalado para regras em YAML") from e
+            table = yaml.safe_load(body)
+        else:
+            table = json.loads(body)
+        return cls(table, source=source or name)
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path, "rb") as rules_file:
+            return cls.from_document(rules_file.read(), path)
+
+    @classmethod
+    def from_s3(cls, bucket, key, version_id=None, s3_client=None):
+        """Carrega a tabela do S3 (versão específica ou a mais recente)."""
+        s3 = s3_client or boto3.client("s3")
+        request = {"Bucket": bucket, "Key": key}
+        if version_id:
+            request["VersionId"] = version_id
+        response = s3.get_object(**request)
+        return cls.from_document(
+            response["Body"].read(),
+            key,
+            source=f"s3://{bucket}/{key}@{response.get('VersionId', 'latest')}",
+        )
+
+    @classmethod
+    def from_environment(cls):
+        """
+        Tabela do S3 (PLAN_RULES_BUCKET/KEY e VERSION, opcional) ou, sem
+        configuração ou objeto, do arquivo do pacote (PLAN_RULES_FILE).
+        """
+        bucket = os.environ.get("PLAN_RULES_BUCKET")
+        if bucket:
+            try:
+                return cls.from_s3(
+                    bucket,
+                    os.environ.get("PLAN_RULES_KEY", "rules/plan_rules.json"),
+                    version_id=os.environ.get("PLAN_RULES_VERSION"),
+                )
+            except (ClientError, BotoCoreError, ValueError) as e:
+                missing = (
+                    isinstance(e, ClientError)
+                    and e.response.get("Error", {}).get("Code") == "NoSuchKey"
+                )
+                (logger.info if missing else logger.error)(
+                    "Regras de planos do S3 indisponíveis - usando arquivo do pacote",
+                    extra={"error_type": type(e).__name__, "error_message": str(e)},
+                )
+        return cls.from_file(
+            os.environ.get(
+                "PLAN_RULES_FILE",
+                os.path.join(
+                    os.path.dirname(os.path.abspath(__file__)), cls.RULES_FILE
+                ),
+            )
+        )
+
+    def resolve_plan(self, plan_tier):
+        """Nome canônico do plano (aceita aliases), ou None se desconhecido."""
+        return self.aliases.get(self._normalize(plan_tier))
+
+    def evaluate_coverage(self, diagnosis, plan_tier):
+        """
+        Decide a pré-aprovação a partir do diagnóstico do Bedrock: urgência,
+        complexidade e os procedimentos das condições, que precisam estar
+        todos cobertos pelo plano. Condições sem procedimento reconhecido
+        impedem a aprovação automática: o pedido vai para avaliação
+        (requires_review) com elas em unmatched_conditions.
+
+        Returns:
+            dict: Decisão com percentual, teto e rules_version
+        """
+        plan = self.resolve_plan(plan_tier)
+        if plan is None:
+            return {
+                "approved": False,
+                "error": "unknown_plan",
+                "plan_tier": plan_tier,
+                "rules_version": self.version,
+            }
+
+        rules = self.plans[plan]
+        urgency = diagnosis.get("urgency_level", "baixa")
+        complexity = diagnosis.get("estimated_complexity", "simples")
+        procedures, unmatched = self.procedure_matcher.match_conditions(
+            diagnosis.get("possible_conditions", [])
+        )
+        uncovered = sorted(procedures - rules["covered_conditions"])
+        approved = (
+            self._normalize(urgency) not in rules["denied_urgency_levels"]
+            and self._normalize(complexity) not in rules["denied_complexities"]
+            and not uncovered
+            and not unmatched
+        )
+        return {
+            "approved": approved,
+            "requires_review": bool(unmatched),
+            "plan_tier": plan,
+            "coverage_percentage": rules["coverage_percentage"],
+            "max_coverage": rules["max_amount"],
+            "urgency_level": urgency,
+            "complexity": complexity,
+            "procedures": sorted(procedures),
+            "uncovered_procedures": uncovered,
+            "unmatched_conditions": unmatched,
+            "rules_version": self.version,
+        }
+
+    def evaluate_reimbursement(self, document_amount, plan_tier, has_warnings=False):
+        """
+        Calcula o reembolso: percentual do plano, teto e penalidade quando a
+        validação do documento gerou avisos.
+
+        Returns:
+            dict: status, amount, percentage, max_allowed e rules_version
+        """
+        plan = self.resolve_plan(plan_tier)
+        if plan is None:
+            return {
+                "status": "rejected",
+                "error": "unknown_plan",
+                "amount": 0.0,
+                "original_amount": document_amount,
+                "plan_tier": plan_tier,
+                "rules_version": self.version,
+            }
+
+        rules = self.plans[plan]
+        base_amount = document_amount * rules["coverage_percentage"]
+        final_amount = min(base_amount, rules["max_amount"])
+        penalty_applied = bool(has_warnings and self.warning_penalty)
+        if penalty_applied:
+            final_amount *= 1.0 - self.warning_penalty
+
+        status = "approved" if final_amount > 0 else "rejected"
+        if final_amount < base_amount:
+            status = "partial"
+
+        return {
+            "status": status,
+            "amount": round(final_amount, 2),
+            "percentage": rules["coverage_percentage"],
+            "original_amount": document_amount,
+            "max_allowed": rules["max_amount"],
+            "plan_tier": plan,
+            "warning_penalty_applied": penalty_applied,
+            "rules_version": self.version,
+        }
+
+    def evaluate_reimbursement_batch(
+        self, plan_names, plan_index, document_amounts, has_warnings
+    ):
         """
-        Extrai valor numérico de string de moeda.
+        Versão vetorizada de evaluate_reimbursement para simulações sobre o
+        histórico: mesmas regras, aplicadas a colunas NumPy de uma vez.
 
         Args:
-            text: Texto contendo valor monetário
+            plan_names: Nomes de plano distintos (canônicos ou aliases)
+            plan_index: Posição de cada sinistro em plan_names (int)
+            document_amounts: Valor do documento de cada sinistro (float64)
+            has_warnings: Máscara dos sinistros com avisos na validação
 
         Returns:
-            float: Valor numérico extraído
+            dict: Arrays amount, capped e known_plan (plano existe na tabela)
         """
-        try:
-            if not text:
-                return 0.0
+        percentages = np.zeros(len(plan_names))
+        caps = np.zeros(len(plan_names))
+        known = np.zeros(len(plan_names), dtype=bool)
+        for position, name in enumerate(plan_names):
+            plan = self.resolve_plan(name)
+            if plan is not None:
+                percentages[position] = self.plans[plan]["coverage_percentage"]
+                caps[position] = self.plans[plan]["max_amount"]
+                known[position] = True
+
+        base_amounts = (
+            np.asarray(document_amounts, dtype=np.float64) * percentages[plan_index]
+        )
+        final_amounts = np.minimum(base_amounts, caps[plan_index])
+        capped = final_amounts < base_amounts
+        if self.warning_penalty:
+            final_amounts = np.where(
+                has_warnings,
+                final_amounts * (1.0 - self.warning_penalty),
+                final_amounts,
+            )
 
-            # Remover caracteres não numéricos exceto ponto e vírgula
-            clean_text = re.sub(r"[^\d,.]", "", text)
+        # np.round difere de round() nos empates de meio centavo (o valor
+        # binário exato decide); esses poucos casos usam o round() escalar
+        amounts = np.round(final_amounts, 2)
+        cents = final_amounts * 100
+        for position in np.flatnonzero(np.abs(cents - np.floor(cents) - 0.5) < 1e-6):
+            amounts[position] = round(float(final_amounts[position]), 2)
 
-            # Converter para float
-            if "," in clean_text and "." in clean_text:
-                # Formato: 1.000,00 -> 1000.00
-                clean_text = clean_text.replace(".", "").replace(",", ".")
-            elif "," in clean_text:
-                # Formato: 1000,00 -> 1000.00
-                clean_text = clean_text.replace(",", ".")
+        return {
+            "amount": amounts,
+            "capped": capped,
+            "known_plan": known[plan_index],
+        }
 
-            return float(clean_text) if clean_text else 0.0
 
-        except (ValueError, TypeError) as e:
-            logger.warning(
-                "Erro ao extrair valor monetário",
-                extra={"original_text": text, "error": str(e)},
-            )
-            return 0.0
+class ProcedureMatcher:
+    """
+    Mapeia o texto livre das condições do Bedrock para códigos canônicos de
+    procedimento (catálogo "procedures" da tabela de regras).
+
+    Os sinônimos viram um autômato de Aho-Corasick sobre tokens sem acento
+    (cada aresta é uma palavra reduzida ao singular), então cada texto é
+    percorrido uma única vez independentemente do tamanho do catálogo.
+    Sobreposições são resolvidas pelo casamento mais longo à esquerda
+    ("abscesso periodontal" vence "abscesso").
+    """
+
+    TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+    # Plurais irregulares (já sem acento): lesões, canais, removíveis
+    PLURAL_SUFFIXES = (("oes", "ao"), ("ais", "al"), ("eis", "el"))
+
+    def __init__(self, catalog):
+        # Nó 0 é a raiz; listas paralelas de transições, falhas e saídas
+        self.transitions = [{}]
+        self.outputs = [()]
+        self.codes = frozenset(catalog)
+
+        for code, terms in catalog.items():
+            for term in (code, *terms):
+                tokens = self.tokenize(term)
+                if not tokens:
+                    continue
+                node = 0
+                for token in tokens:
+                    child = self.transitions[node].get(token)
+                    if child is None:
+                        child = len(self.transitions)
+                        self.transitions[node][token] = child
+                        self.transitions.append({})
+                        self.outputs.append(())
+                    node = child
+                self.outputs[node] += ((len(tokens), code),)
+
+        # Links de falha em largura; cada nó herda as saídas do seu sufixo
+        self.fail = [0] * len(self.transitions)
+        queue = deque(self.transitions[0].values())
+        while queue:
+            node = queue.popleft()
+            for token, child in self.transitions[node].items():
+                queue.append(child)
+                fallback = self.fail[node]
+                while fallback and token not in self.transitions[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[child] = self.transitions[fallback].get(token, 0)
+                self.outputs[child] += self.outputs[self.fail[child]]
+
+    @classmethod
+    def tokenize(cls, text):
+        return [
+            cls._singular(token)
+            for token in cls.TOKEN_PATTERN.findall(PlanRules._normalize(text))
+        ]
+
+    @classmethod
+    def _singular(cls, token):
+        """Reduz o plural ao singular; aplicado ao catálogo e ao texto."""
+        if len(token) <= 3 or not token.endswith("s"):
+            return token
+        if len(token) > 4:
+            for plural, singular in cls.PLURAL_SUFFIXES:
+                if token.endswith(plural):
+                    return token[: -len(plural)] + singular
+            # dores, raízes: o singular termina em consoante (próteses não)
+            if token.endswith("es") and token[-3] in "rz":
+                return token[:-2]
+        return token[:-1]
+
+    def find(self, text):
+        """Códigos encontrados no texto, sem repetição, na ordem em que aparecem."""
+        transitions = self.transitions
+        fail = self.fail
+        node = 0
+        matches = []
+        for end, token in enumerate(self.tokenize(text)):
+            while node and token not in transitions[node]:
+                node = fail[node]
+            node = transitions[node].get(token, 0)
+            for length, code in self.outputs[node]:
+                matches.append((end - length + 1, -length, code))
+
+        matches.sort()
+        codes = []
+        next_free = 0
+        for start, negative_length, code in matches:
+            if start >= next_free:
+                codes.append(code)
+                next_free = start - negative_length
+        return list(dict.fromkeys(codes))
+
+    def match_conditions(self, conditions):
+        """
+        Returns:
+            tuple: (conjunto de códigos, condições sem procedimento reconhecido)
+        """
+        if isinstance(conditions, str):
+            conditions = [conditions]
+
+        procedures = set()
+        unmatched = []
+        for condition in conditions or []:
+            codes = self.find(condition)
+            if codes:
+                procedures.update(codes)
+            else:
+                unmatched.append(condition)
+        return procedures, unmatched
 
 
 class ClaimValidator:
     """Responsável por todas as validações de dados e regras de negócio."""
 
-    def __init__(self):
-        logger.info("ClaimValidator inicializado")
+    def __init__(self, plan_rules=None):
+        self.plan_rules = plan_rules or PlanRules.from_environment()
+        logger.info(
+            "ClaimValidator inicializado",
+            extra={"rules_version": self.plan_rules.version},
+        )
 
     def validate_pre_approval_slots(self, slots):
         """
@@ -1259,7 +3849,7 @@ class ClaimValidator:
                 },
             }
 
-        return {"valid": True, "response": None}
+        return self._validate_plan(slots["planoDental"])
 
     def validate_reimbursement_slots(self, slots):
         """
@@ -1299,7 +3889,27 @@ class ClaimValidator:
                 },
             }
 
-        return {"valid": True, "response": None}
+        return self._validate_plan(slots["planoDental"])
+
+    def _validate_plan(self, plan_tier):
+        """Recusa planos ausentes da tabela de regras (sem cair no básico)."""
+        if self.plan_rules.resolve_plan(plan_tier) is not None:
+            return {"valid": True, "response": None}
+
+        logger.warning(
+            "Plano desconhecido",
+            extra={"plan_tier": plan_tier, "rules_version": self.plan_rules.version},
+        )
+        return {
+            "valid": False,
+            "response": {
+                "status": "unknown_plan",
+                "message": (
+                    f"Plano não reconhecido: {plan_tier}. "
+                    f"Planos disponíveis: {', '.join(sorted(self.plan_rules.plans))}"
+                ),
+            },
+        }
 
     def validate_reimbursement_data(self, document_data, claimed_value, plan_tier):
         """
@@ -1372,44 +3982,9 @@ class ClaimValidator:
             dict: Resultado da verificação de cobertura
         """
         try:
-            # Regras de cobertura por plano
-            coverage_rules = {
-                "basic": {
-                    "covered_conditions": ["consulta", "profilaxia", "radiografia"],
-                    "max_coverage": 300.00,
-                    "coverage_percentage": 0.7,
-                },
-                "premium": {
-                    "covered_conditions": [
-                        "consulta",
-                        "profilaxia",
-                        "radiografia",
-                        "restauracao",
-                        "extracao",
-                    ],
-                    "max_coverage": 1000.00,
-                    "coverage_percentage": 0.9,
-                },
-            }
-
-            plan_rules = coverage_rules.get(plan_tier, coverage_rules["basic"])
-            urgency = diagnosis.get("urgency_level", "baixa")
-            complexity = diagnosis.get("estimated_complexity", "simples")
-
-            # Lógica simplificada de aprovação
-            approved = (
-                urgency != "alta"  # Planos básicos não cobrem urgências altas
-                or plan_tier == "premium"
-            ) and complexity != "complexo"
-
-            coverage_info = {
-                "approved": approved,
-                "plan_tier": plan_tier,
-                "coverage_percentage": plan_rules["coverage_percentage"],
-                "max_coverage": plan_rules["max_coverage"],
-                "urgency_level": urgency,
-                "complexity": complexity,
-            }
+            coverage_info = self.plan_rules.evaluate_coverage(diagnosis, plan_tier)
+            approved = coverage_info["approved"]
+            urgency = coverage_info.get("urgency_level")
 
             logger.info(
                 "Verificação de cobertura concluída",
@@ -1417,6 +3992,9 @@ class ClaimValidator:
                     "approved": approved,
                     "plan_tier": plan_tier,
                     "urgency": urgency,
+                    "procedures": coverage_info.get("procedures"),
+                    "uncovered_procedures": coverage_info.get("uncovered_procedures"),
+                    "rules_version": coverage_info["rules_version"],
                 },
             )
 
@@ -1433,6 +4011,16 @@ class ClaimValidator:
 class FlowProcessor:
     """Responsável por orquestrar os fluxos específicos de negócio."""
 
+    # Busca de dentistas: tamanho de página e limite total de resultados
+    DENTIST_PAGE_SIZE = 5
+    MAX_DENTIST_PAGE_SIZE = 20
+    MAX_DENTIST_RESULTS = 100
+    # A localização é arredondada ao centro de uma célula (~550 m): consultas
+    # da mesma célula, plano e especialidade têm a mesma resposta
+    SEARCH_CELL_DEGREES = 0.005
+    # Slot que pede a próxima página da última busca da sessão
+    MORE_RESULTS_SLOT = "maisResultados"
+
     def __init__(
         self,
         validator,
@@ -1440,12 +4028,20 @@ class FlowProcessor:
         document_processor,
         data_manager,
         notification_manager,
+        clinic_directory_loader=None,
+        location_resolver=None,
     ):
         self.validator = validator
         self.ai_analyzer = ai_analyzer
         self.document_processor = document_processor
         self.data_manager = data_manager
         self.notification_manager = notification_manager
+        self.clinic_directory_loader = (
+            clinic_directory_loader or ClinicDirectoryLoader.from_environment()
+        )
+        self.location_resolver = (
+            location_resolver or LocationResolver.from_environment()
+        )
         logger.info("FlowProcessor inicializado")
 
     def process_pre_approval_flow(self, slots, session_attributes):
@@ -1458,7 +4054,7 @@ class FlowProcessor:
 
             # Extração
             symptoms = slots["sintomas"]
-            plan_tier = slots["planoDental"]
+            plan_tier = self.validator.plan_rules.resolve_plan(slots["planoDental"])
             location = slots["localizacao"]
 
             # Análise IA
@@ -1520,7 +4116,7 @@ class FlowProcessor:
 
             # Extração
             document_key = slots["documentKey"]
-            plan_tier = slots["planoDental"]
+            plan_tier = self.validator.plan_rules.resolve_plan(slots["planoDental"])
             procedure_value = float(slots["valorProcedimento"])
 
             # Processamento documento
@@ -1530,142 +4126,1207 @@ class FlowProcessor:
                     "document_error", "Erro no processamento do documento"
                 )
 
-            # Validação dados
-            validation_result = self.validator.validate_reimbursement_data(
-                document_data, procedure_value, plan_tier
+            # Validação dados
+            validation_result = self.validator.validate_reimbursement_data(
+                document_data, procedure_value, plan_tier
+            )
+            if not validation_result["valid"]:
+                return self._build_error_response(
+                    "validation_failed",
+                    f"Dados inválidos: {', '.join(validation_result['errors'])}",
+                )
+
+            # Cálculo reembolso
+            reimbursement_result = self._calculate_reimbursement(
+                validation_result["document_amount"], plan_tier, validation_result
+            )
+
+            # Persistência
+            claim_data = {
+                "document_key": document_key,
+                "plan_tier": plan_tier,
+                "procedure_value": procedure_value,
+                "document_data": document_data,
+                "reimbursement_result": reimbursement_result,
+            }
+            save_result = self.data_manager.save_reimbursement_claim(
+                claim_data, session_attributes
+            )
+            if save_result.get("duplicate_of"):
+                return self._build_error_response(
+                    "duplicate_receipt",
+                    "Este recibo já foi utilizado em outro pedido de reembolso",
+                )
+            if not save_result.get("saved"):
+                # Sem o registro das impressões digitais não há garantia
+                # contra reembolso em dobro: não confirma nem notifica
+                return self._build_error_response(
+                    "save_error", "Não foi possível registrar o reembolso"
+                )
+
+            # Notificação
+            self.notification_manager.send_reimbursement_notification(
+                slots, reimbursement_result
+            )
+
+            return self._build_success_response(
+                "Reembolso processado com sucesso",
+                {
+                    "reimbursement_result": reimbursement_result,
+                    "validation_warnings": validation_result.get("warnings", []),
+                },
+            )
+
+        except Exception as e:
+            logger.error("Erro no fluxo de reembolso", extra={"error": str(e)})
+            return self._build_error_response(
+                "processing_error", "Erro no processamento"
+            )
+
+    @classmethod
+    def dentist_search_cursor(cls, slots, session_attributes):
+        """
+        Cursor da página pedida neste turno: o guardado na sessão quando o
+        usuário pede mais resultados, senão None (nova busca).
+        """
+        if not (slots or {}).get(cls.MORE_RESULTS_SLOT):
+            return None
+        return (session_attributes or {}).get("dentistSearchCursor")
+
+    def process_dentist_search_flow(self, slots, session_attributes):
+        """Processa busca de dentistas."""
+        try:
+            location = slots.get("localizacao", "")
+            plan_tier = slots.get("planoDental", "basic")
+            specialty = slots.get("especialidade", "geral")
+
+            cursor = self.dentist_search_cursor(slots, session_attributes)
+            if slots.get(self.MORE_RESULTS_SLOT) and not cursor:
+                return self._build_success_response(
+                    "Não há mais dentistas para esta busca",
+                    {"clinics": [], "next_cursor": None},
+                )
+
+            # Busca (página seguinte à última da sessão, se pedida)
+            try:
+                page = self.search_dentists(
+                    location, plan_tier, specialty, cursor=cursor
+                )
+            except ValueError:
+                return self._build_error_response(
+                    "invalid_cursor", "Cursor de paginação inválido"
+                )
+            clinics = page["clinics"]
+
+            # Cursor da próxima página disponível na sessão
+            if page["next_cursor"]:
+                session_attributes["dentistSearchCursor"] = page["next_cursor"]
+            else:
+                session_attributes.pop("dentistSearchCursor", None)
+
+            # Persistência
+            search_data = {
+                "location": location,
+                "plan_tier": plan_tier,
+                "specialty": specialty,
+                "dentists_found": len(clinics),
+            }
+            self.data_manager.save_search_record(search_data, session_attributes)
+
+            return self._build_success_response(
+                f"Encontrados {len(clinics)} dentistas",
+                {
+                    "clinics": clinics,
+                    "search_params": search_data,
+                    "next_cursor": page["next_cursor"],
+                },
+            )
+
+        except Exception as e:
+            logger.error("Erro na busca de dentistas", extra={"error": str(e)})
+            return self._build_error_response("search_error", "Erro na busca")
+
+    def _find_nearby_clinics(self, location, plan_tier, specialty="geral"):
+        """Primeira página das clínicas mais próximas no diretório."""
+        return self.search_dentists(location, plan_tier, specialty)["clinics"]
+
+    def search_dentists(
+        self, location, plan_tier, specialty="geral", cursor=None, limit=None
+    ):
+        """
+        Página da busca de clínicas ordenada por distância.
+
+        A consulta é normalizada (centro da célula de SEARCH_CELL_DEGREES,
+        plano e especialidade em minúsculas) e a resposta depende só dela,
+        do deslocamento e da versão do diretório. O cursor é opaco e carrega
+        a consulta normalizada: a próxima página não precisa da localização.
+
+        Raises:
+            ValueError: Cursor inválido
+
+        Returns:
+            dict: {"clinics", "next_cursor", "query", "directory_version"}
+        """
+        directory = self.clinic_directory_loader.current()
+        if cursor:
+            query = self._decode_cursor(cursor)
+        else:
+            # Sem correspondência nas tabelas, o diretório tenta pelos próprios dados
+            coordinates = self.location_resolver.resolve(
+                location
+            ) or directory.resolve_location(location)
+            query = {
+                "cell": self._snap_to_cell(coordinates) if coordinates else None,
+                "plan": self.validator.plan_rules.resolve_plan(plan_tier or "basic")
+                or str(plan_tier).strip().lower(),
+                "specialty": str(specialty or "geral").strip().lower(),
+                "offset": 0,
+                "limit": int(limit or self.DENTIST_PAGE_SIZE),
+            }
+        query["limit"] = max(1, min(query["limit"], self.MAX_DENTIST_PAGE_SIZE))
+
+        page = {
+            "clinics": [],
+            "next_cursor": None,
+            "query": query,
+            "directory_version": directory.version,
+        }
+        if query["cell"] is None:
+            logger.warning(
+                "Localização não resolvida para busca de clínicas",
+                extra={"location": str(location)[:20]},
+            )
+            return page
+
+        offset = query["offset"]
+        end = min(offset + query["limit"], self.MAX_DENTIST_RESULTS)
+        # Uma clínica a mais indica se existe próxima página
+        ranked = directory.search(
+            tuple(query["cell"]), query["plan"], query["specialty"], k=end + 1
+        )
+        page["clinics"] = ranked[offset:end]
+        if len(ranked) > end and end < self.MAX_DENTIST_RESULTS:
+            page["next_cursor"] = self._encode_cursor({**query, "offset": end})
+        return page
+
+    @classmethod
+    def _snap_to_cell(cls, coordinates):
+        size = cls.SEARCH_CELL_DEGREES
+        return [
+            round((math.floor(value / size) + 0.5) * size, 6) for value in coordinates
+        ]
+
+    @staticmethod
+    def _encode_cursor(query):
+        payload = json.dumps(query, sort_keys=True, separators=(",", ":"))
+        return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii")
+
+    @classmethod
+    def _decode_cursor(cls, cursor):
+        try:
+            query = json.loads(base64.urlsafe_b64decode(str(cursor).encode("ascii")))
+            cell = [float(value) for value in query["cell"]]
+            query = {
+                "cell": cell,
+                "plan": str(query["plan"]),
+                "specialty": str(query["specialty"]),
+                "offset": int(query["offset"]),
+                "limit": int(query["limit"]),
+            }
+        except (KeyError, TypeError, ValueError, UnicodeError) as e:
+            raise ValueError(f"Cursor inválido: {e}") from e
+        if len(cell) != 2 or not 0 <= query["offset"] < cls.MAX_DENTIST_RESULTS:
+            raise ValueError("Cursor inválido")
+        return query
+
+    def _calculate_reimbursement(self, document_amount, plan_tier, validation_result):
+        """Calcula valor do reembolso pelas regras do plano (PlanRules)."""
+        result = self.validator.plan_rules.evaluate_reimbursement(
+            document_amount, plan_tier, bool(validation_result.get("warnings"))
+        )
+        result["message"] = self._get_reimbursement_message(
+            result["status"], result["amount"]
+        )
+        return result
+
+    def _get_reimbursement_message(self, status, amount):
+        """Gera mensagem do reembolso."""
+        messages = {
+            "approved": f"Reembolso aprovado no valor de R$ {amount:.2f}",
+            "partial": f"Reembolso parcial aprovado no valor de R$ {amount:.2f}",
+            "rejected": "Reembolso não aprovado conforme regras do plano",
+        }
+        return messages.get(status, "Status desconhecido")
+
+    def _build_success_response(self, message, data=None):
+        """Constrói resposta de sucesso padronizada."""
+        return {"status": "success", "message": message, "data": data or {}}
+
+    def _build_error_response(self, error_type, message):
+        """Constrói resposta de erro padronizada."""
+        return {"status": error_type, "message": message}
+
+
+class ClinicDirectory:
+    """
+    Diretório de clínicas com índice geográfico em grade.
+
+    Carregado de um snapshot versionado no S3 (JSON, opcionalmente gzip:
+    {"version": ..., "clinics": [{"id", "name", "lat", "lon", ...}]}). As
+    clínicas são agrupadas em células de CELL_DEGREES graus; a busca percorre
+    anéis de células a partir da célula do paciente e para quando nenhuma
+    célula ainda não visitada pode conter uma clínica mais próxima que a
+    k-ésima encontrada (distância de haversine).
+
+    Plano e especialidade têm índice invertido: lista ordenada de posições
+    (postings) e bitset (um byte por clínica) para cada valor. O filtro parte
+    da menor lista e testa as demais pelo bitset, custando o número de
+    clínicas compatíveis e não o tamanho do diretório; conjuntos de até
+    DIRECT_RANK_LIMIT candidatas são ranqueados diretamente, sem percorrer a
+    grade.
+
+    As coordenadas ficam em um array NumPy contíguo de vetores unitários: o
+    haversine das candidatas é calculado em um único passe vetorizado (produto
+    escalar) e as k mais próximas são escolhidas com argpartition, ordenando
+    só o resultado.
+    """
+
+    EARTH_RADIUS_KM = 6371.0088
+    CELL_DEGREES = 0.02
+    DEFAULT_MAX_DISTANCE_KM = 100.0
+    # Do mais específico (logradouro/bairro) ao mais amplo (região)
+    CEP_PREFIX_SIZES = (5, 3, 2)
+    # Até este número de candidatas (após os filtros) o ranqueamento é um único
+    # passe vetorizado, sem percorrer a grade
+    DIRECT_RANK_LIMIT = 20000
+    # Fração de lacunas (clínicas removidas/alteradas por deltas) a partir da
+    # qual o índice é reconstruído
+    COMPACT_FRACTION = 0.2
+
+    # Usado quando nenhum snapshot está configurado (desenvolvimento/demo)
+    SAMPLE_CLINICS = [
+        {
+            "id": "clinic_0001",
+            "name": "Clínica Dental Sorriso Saudável",
+            "address": "Rua Principal, 123 - Centro",
+            "city": "São Paulo",
+            "state": "SP",
+            "cep": "01001-000",
+            "phone": "(11) 3333-4444",
+            "lat": -23.5505,
+            "lon": -46.6333,
+            "specialties": ["geral", "ortodontia"],
+            "accepted_plans": ["basic", "premium"],
+        }
+    ]
+
+    def __init__(self, clinics, version=None):
+        self.version = version
+        self.etag = None
+        self.clinics = []
+        self.positions_by_id = {}
+        self.cells = {}
+        self.by_cep_prefix = {}
+        self.by_city = {}
+        plan_positions = {}
+        specialty_positions = {}
+
+        for clinic in clinics:
+            clinic = self._normalize_clinic(clinic)
+            if clinic is None:
+                continue
+
+            position = len(self.clinics)
+            if clinic.get("id") is not None:
+                self.positions_by_id[clinic["id"]] = position
+            self.clinics.append(clinic)
+            self.cells.setdefault(self._cell(clinic["lat"], clinic["lon"]), []).append(
+                position
+            )
+            for plan in set(clinic["accepted_plans"]):
+                plan_positions.setdefault(plan, []).append(position)
+            for name in set(clinic["specialties"]):
+                specialty_positions.setdefault(name, []).append(position)
+            self._update_centroids(clinic, 1)
+
+        # Vetores unitários contíguos (n x 3) para o haversine vetorizado
+        self.unit_vectors = self._unit_vectors(
+            np.fromiter((clinic["lat"] for clinic in self.clinics), dtype=np.float64),
+            np.fromiter((clinic["lon"] for clinic in self.clinics), dtype=np.float64),
+        )
+        self.cells = {
+            cell: np.asarray(positions, dtype=np.int32)
+            for cell, positions in self.cells.items()
+        }
+        # Posições válidas (deltas deixam lacunas até a próxima compactação)
+        self.active_positions = np.arange(len(self.clinics), dtype=np.int32)
+
+        self.plan_index = self._build_inverted_index(plan_positions)
+        self.specialty_index = self._build_inverted_index(specialty_positions)
+
+        logger.info(
+            "Diretório de clínicas carregado",
+            extra={
+                "version": version,
+                "clinics": len(self.active_positions),
+                "cells": len(self.cells),
+                "plans": len(self.plan_index),
+                "specialties": len(self.specialty_index),
+            },
+        )
+
+    def _build_inverted_index(self, positions_by_value):
+        """{valor: (postings ordenados, bitset)} a partir das posições."""
+        index = {}
+        for value, positions in positions_by_value.items():
+            postings = np.asarray(positions, dtype=np.int32)
+            bitset = np.zeros(len(self.clinics), dtype=bool)
+            bitset[postings] = True
+            index[value] = (postings, bitset)
+        return index
+
+    def _filters(self, plan_tier, specialty):
+        """
+        Índices dos filtros pedidos, do mais seletivo ao menos seletivo.
+
+        Returns:
+            list | None: [(postings, bitset)], ou None se algum valor não tem
+                nenhuma clínica (resultado vazio)
+        """
+        filters = []
+        for index, value in (
+            (self.plan_index, plan_tier),
+            (self.specialty_index, specialty),
+        ):
+            if value is None:
+                continue
+            if value not in index:
+                return None
+            filters.append(index[value])
+        filters.sort(key=lambda entry: len(entry[0]))
+        return filters
+
+    @staticmethod
+    def _intersect(filters):
+        """Posições presentes em todos os filtros (parte da menor lista)."""
+        candidates = filters[0][0]
+        for _, bitset in filters[1:]:
+            candidates = candidates[bitset[candidates]]
+        return candidates
+
+    @staticmethod
+    def _unit_vectors(lat, lon):
+        """Coordenadas (graus) como vetores unitários na esfera, shape (n, 3)."""
+        phi, lam = np.radians(lat), np.radians(lon)
+        cos_phi = np.cos(phi)
+        return np.ascontiguousarray(
+            np.column_stack((cos_phi * np.cos(lam), cos_phi * np.sin(lam), np.sin(phi)))
+        )
+
+    def cosines(self, lat, lon, positions):
+        """
+        Cosseno do ângulo central entre o ponto e as clínicas em positions.
+
+        hav(θ) = (1 - cos θ) / 2, então a distância de haversine é monotônica
+        em cos θ: o ranqueamento usa só um produto escalar por candidata (sem
+        funções trigonométricas) e a distância em km é calculada apenas para
+        as k selecionadas.
+        """
+        point = self._unit_vectors(lat, lon)[0]
+        return self.unit_vectors.take(positions, axis=0) @ point
+
+    def _cosine_limit(self, distance_km):
+        return math.cos(min(distance_km / self.EARTH_RADIUS_KM, math.pi))
+
+    @staticmethod
+    def _top_k(cosines, positions, k):
+        """As k maiores similaridades com argpartition (sem ordenar o resto)."""
+        if len(cosines) > k:
+            selected = np.argpartition(cosines, len(cosines) - k)[-k:]
+            cosines, positions = cosines[selected], positions[selected]
+        return cosines, positions
+
+    @classmethod
+    def from_s3(cls, bucket, key, version_id=None, s3_client=None):
+        """Carrega o snapshot (versão específica ou a mais recente)."""
+        s3 = s3_client or boto3.client("s3")
+        request = {"Bucket": bucket, "Key": key}
+        if version_id:
+            request["VersionId"] = version_id
+        response = s3.get_object(**request)
+
+        body = response["Body"].read()
+        if body[:2] == b"\x1f\x8b":
+            body = gzip.decompress(body)
+        snapshot = json.loads(body)
+
+        directory = cls(
+            snapshot.get("clinics", []),
+            version=snapshot.get("version")
+            or response.get("VersionId")
+            or response.get("ETag"),
+        )
+        directory.etag = response.get("ETag")
+        return directory
+
+    @classmethod
+    def from_environment(cls):
+        """
+        Diretório configurado por CLINIC_DIRECTORY_BUCKET/KEY (e VERSION,
+        opcional); sem configuração ou com falha de leitura usa SAMPLE_CLINICS.
+        """
+        bucket = os.environ.get("CLINIC_DIRECTORY_BUCKET")
+        key = os.environ.get("CLINIC_DIRECTORY_KEY", "clinics/directory.json.gz")
+        if bucket:
+            try:
+                return cls.from_s3(
+                    bucket, key, version_id=os.environ.get("CLINIC_DIRECTORY_VERSION")
+                )
+            except (ClientError, BotoCoreError, ValueError) as e:
+                logger.error(
+                    "Falha ao carregar diretório de clínicas - usando amostra",
+                    extra={"error_type": type(e).__name__, "error_message": str(e)},
+                )
+        return cls(cls.SAMPLE_CLINICS, version="sample")
+
+    def with_changes(self, upserts=(), removals=(), version=None):
+        """
+        Novo diretório com as inclusões/alterações e remoções de um delta.
+
+        Copy-on-write: este diretório não é modificado (buscas em andamento
+        continuam válidas) e só células, postings e centroides tocados são
+        recriados. Clínicas alteradas ganham nova posição e a antiga vira
+        lacuna; acima de COMPACT_FRACTION de lacunas o índice é reconstruído.
+        """
+        directory = copy.copy(self)
+        directory.version = version or self.version
+        directory.clinics = list(self.clinics)
+        directory.positions_by_id = dict(self.positions_by_id)
+        directory.by_cep_prefix = dict(self.by_cep_prefix)
+        directory.by_city = dict(self.by_city)
+
+        removed = []
+        for clinic_id in removals:
+            position = directory.positions_by_id.pop(str(clinic_id), None)
+            if position is not None:
+                removed.append(position)
+        for clinic in upserts:
+            clinic = self._normalize_clinic(clinic)
+            if clinic is None or clinic["id"] is None:
+                continue
+            position = directory.positions_by_id.pop(clinic["id"], None)
+            if position is not None:
+                removed.append(position)
+            directory.positions_by_id[clinic["id"]] = len(directory.clinics)
+            directory.clinics.append(clinic)
+
+        added = np.arange(len(self.clinics), len(directory.clinics), dtype=np.int32)
+        removed_mask = np.zeros(len(directory.clinics), dtype=bool)
+        removed_mask[removed] = True
+
+        # Inclusões antes das remoções: uma clínica incluída e alterada no
+        # mesmo delta entra e sai dos centroides uma vez cada
+        cell_additions, plan_additions, specialty_additions = {}, {}, {}
+        for position in added.tolist():
+            clinic = directory.clinics[position]
+            directory._update_centroids(clinic, 1)
+            cell_additions.setdefault(
+                self._cell(clinic["lat"], clinic["lon"]), []
+            ).append(position)
+            for plan in set(clinic["accepted_plans"]):
+                plan_additions.setdefault(plan, []).append(position)
+            for name in set(clinic["specialties"]):
+                specialty_additions.setdefault(name, []).append(position)
+        if len(added):
+            directory.unit_vectors = np.concatenate(
+                (
+                    self.unit_vectors,
+                    self._unit_vectors(
+                        [directory.clinics[position]["lat"] for position in added],
+                        [directory.clinics[position]["lon"] for position in added],
+                    ),
+                )
+            )
+        for position in removed:
+            clinic = directory.clinics[position]
+            directory.clinics[position] = None
+            directory._update_centroids(clinic, -1)
+            cell_additions.setdefault(self._cell(clinic["lat"], clinic["lon"]), [])
+            for plan in set(clinic["accepted_plans"]):
+                plan_additions.setdefault(plan, [])
+            for name in set(clinic["specialties"]):
+                specialty_additions.setdefault(name, [])
+
+        size = len(directory.clinics)
+        directory.cells = self._patch_postings(self.cells, cell_additions, removed_mask)
+        directory.plan_index = self._patch_index(
+            self.plan_index, plan_additions, removed_mask
+        )
+        directory.specialty_index = self._patch_index(
+            self.specialty_index, specialty_additions, removed_mask
+        )
+        active = np.concatenate((self.active_positions, added))
+        directory.active_positions = active[~removed_mask[active]]
+
+        holes = size - len(directory.active_positions)
+        logger.info(
+            "Delta aplicado ao diretório de clínicas",
+            extra={
+                "version": directory.version,
+                "added": len(added),
+                "removed": len(removed),
+                "holes": holes,
+            },
+        )
+        if holes > self.COMPACT_FRACTION * size:
+            compacted = type(self)(
+                [clinic for clinic in directory.clinics if clinic is not None],
+                version=directory.version,
+            )
+            compacted.etag = self.etag
+            return compacted
+        return directory
+
+    @staticmethod
+    def _patch_postings(postings_by_key, additions, removed_mask):
+        """Cópia de {chave: posições} com as chaves tocadas recriadas."""
+        patched = dict(postings_by_key)
+        for key, positions in additions.items():
+            merged = np.concatenate(
+                (
+                    postings_by_key.get(key, np.empty(0, dtype=np.int32)),
+                    np.asarray(positions, dtype=np.int32),
+                )
+            )
+            merged = merged[~removed_mask[merged]]
+            if len(merged):
+                patched[key] = merged
+            else:
+                patched.pop(key, None)
+        return patched
+
+    @classmethod
+    def _patch_index(cls, index, additions, removed_mask):
+        """Índice invertido com postings tocados recriados e bitsets estendidos."""
+        size = len(removed_mask)
+        postings = cls._patch_postings(
+            {value: entry[0] for value, entry in index.items()},
+            additions,
+            removed_mask,
+        )
+        patched = {}
+        for value, value_postings in postings.items():
+            entry = index.get(value)
+            if entry is not None and value not in additions:
+                bitset = entry[1]
+                if len(bitset) < size:
+                    bitset = np.concatenate(
+                        (bitset, np.zeros(size - len(bitset), dtype=bool))
+                    )
+            else:
+                bitset = np.zeros(size, dtype=bool)
+                bitset[value_postings] = True
+            patched[value] = (value_postings, bitset)
+        return patched
+
+    @classmethod
+    def _cell(cls, lat, lon):
+        return (
+            math.floor(lat / cls.CELL_DEGREES),
+            math.floor(lon / cls.CELL_DEGREES),
+        )
+
+    @staticmethod
+    def _normalize_city(name):
+        text = unicodedata.normalize("NFKD", str(name))
+        text = "".join(char for char in text if not unicodedata.combining(char))
+        return " ".join(text.lower().split())
+
+    @classmethod
+    def haversine_km(cls, lat1, lon1, lat2, lon2):
+        """Distância de haversine entre dois pontos (graus) em km."""
+        phi1, phi2 = math.radians(lat1), math.radians(lat2)
+        a = (
+            math.sin((phi2 - phi1) / 2) ** 2
+            + math.cos(phi1)
+            * math.cos(phi2)
+            * math.sin(math.radians(lon2 - lon1) / 2) ** 2
+        )
+        return 2 * cls.EARTH_RADIUS_KM * math.asin(math.sqrt(min(1.0, a)))
+
+    def resolve_location(self, location):
+        """
+        Converte a localização informada em coordenadas.
+
+        Aceita coordenadas já resolvidas (LocationResolver), "lat,lon", CEP
+        (centroide das clínicas com o mesmo prefixo de 5, 3 ou 2 dígitos) ou
+        nome da cidade (centroide das clínicas da cidade).
+
+        Returns:
+            tuple | None: (lat, lon)
+        """
+        if isinstance(location, tuple):
+            return location
+
+        text = str(location or "").strip()
+        match = re.fullmatch(
+            r"(-?\d{1,2}(?:\.\d+)?)\s*[,;]\s*(-?\d{1,3}(?:\.\d+)?)", text
+        )
+        if match:
+            return float(match.group(1)), float(match.group(2))
+
+        centroid = None
+        digits = re.sub(r"\D", "", text)
+        if len(digits) == 8:
+            for size in self.CEP_PREFIX_SIZES:
+                centroid = self.by_cep_prefix.get(digits[:size])
+                if centroid:
+                    break
+        elif text:
+            centroid = self.by_city.get(self._normalize_city(text.split("-")[0]))
+
+        if not centroid:
+            return None
+        sum_lat, sum_lon, count = centroid
+        return sum_lat / count, sum_lon / count
+
+    @staticmethod
+    def _normalize_clinic(clinic):
+        """Clínica com coordenadas numéricas e listas em minúsculas (ou None)."""
+        try:
+            lat, lon = float(clinic["lat"]), float(clinic["lon"])
+        except (KeyError, TypeError, ValueError):
+            return None
+        if not (-90.0 <= lat <= 90.0 and -180.0 <= lon <= 180.0):
+            return None
+
+        return {
+            **clinic,
+            "id": None if clinic.get("id") is None else str(clinic["id"]),
+            "lat": lat,
+            "lon": lon,
+            "accepted_plans": [
+                str(plan).lower() for plan in clinic.get("accepted_plans", [])
+            ],
+            "specialties": [
+                str(name).lower() for name in clinic.get("specialties", [])
+            ],
+        }
+
+    def _update_centroids(self, clinic, sign):
+        """Soma (sign=1) ou retira (sign=-1) a clínica dos centroides."""
+        digits = re.sub(r"\D", "", str(clinic.get("cep", "")))
+        if len(digits) == 8:
+            for size in self.CEP_PREFIX_SIZES:
+                self._accumulate(self.by_cep_prefix, digits[:size], clinic, sign)
+        if clinic.get("city"):
+            self._accumulate(
+                self.by_city, self._normalize_city(clinic["city"]), clinic, sign
             )
-            if not validation_result["valid"]:
-                return self._build_error_response(
-                    "validation_failed",
-                    f"Dados inválidos: {', '.join(validation_result['errors'])}",
+
+    @staticmethod
+    def _accumulate(centroids, key, clinic, sign):
+        # Nova lista a cada atualização: cópias do diretório compartilham
+        # o dicionário original sem enxergar as alterações
+        sum_lat, sum_lon, count = centroids.get(key, (0.0, 0.0, 0))
+        if count + sign > 0:
+            centroids[key] = [
+                sum_lat + sign * clinic["lat"],
+                sum_lon + sign * clinic["lon"],
+                count + sign,
+            ]
+        else:
+            centroids.pop(key, None)
+
+    def nearest(
+        self,
+        lat,
+        lon,
+        k=5,
+        plan_tier=None,
+        specialty=None,
+        max_distance_km=DEFAULT_MAX_DISTANCE_KM,
+    ):
+        """
+        As k clínicas mais próximas que atendem o plano/especialidade.
+
+        Returns:
+            list: [(distância_km, clínica)] em ordem crescente de distância
+        """
+        plan_tier = str(plan_tier).lower() if plan_tier else None
+        specialty = str(specialty).lower() if specialty else None
+        if specialty == "geral":
+            specialty = None
+
+        filters = self._filters(plan_tier, specialty)
+        if filters is None or k <= 0 or not len(self.active_positions):
+            return []
+        smallest = filters[0][0] if filters else self.active_positions
+        if len(smallest) <= self.DIRECT_RANK_LIMIT:
+            positions = self._intersect(filters) if filters else smallest
+            return self._rank(lat, lon, positions, k, max_distance_km)
+        bitsets = [bitset for _, bitset in filters]
+
+        center_row, center_col = self._cell(lat, lon)
+        best_cosines = np.empty(0, dtype=np.float64)
+        best_positions = np.empty(0, dtype=np.int32)
+        visited_cells = 0
+        ring = 0
+
+        while True:
+            ring_positions = [
+                self.cells[cell]
+                for cell in self._ring_cells(center_row, center_col, ring)
+                if cell in self.cells
+            ]
+            if ring_positions:
+                visited_cells += len(ring_positions)
+                positions = np.concatenate(ring_positions)
+                for bitset in bitsets:
+                    positions = positions[bitset[positions]]
+                best_cosines, best_positions = self._top_k(
+                    np.concatenate((best_cosines, self.cosines(lat, lon, positions))),
+                    np.concatenate((best_positions, positions)),
+                    k,
                 )
 
-            # Cálculo reembolso
-            reimbursement_result = self._calculate_reimbursement(
-                validation_result["document_amount"], plan_tier, validation_result
-            )
+            # Células além do anel atual estão a pelo menos esta distância
+            reach_km = self._ring_reach_km(lat, ring)
+            if len(best_cosines) == k and best_cosines.min() >= self._cosine_limit(
+                reach_km
+            ):
+                break
+            if reach_km >= max_distance_km or visited_cells >= len(self.cells):
+                break
+            ring += 1
+
+        return self._sorted_results(lat, lon, best_positions, max_distance_km)
+
+    def _rank(self, lat, lon, positions, k, max_distance_km):
+        """Ranqueia diretamente as candidatas filtradas (um único passe)."""
+        # O limite de distância é aplicado às k escolhidas: filtrar antes
+        # custaria mais que o próprio argpartition
+        _, selected = self._top_k(self.cosines(lat, lon, positions), positions, k)
+        return self._sorted_results(lat, lon, selected, max_distance_km)
+
+    def _sorted_results(self, lat, lon, positions, max_distance_km):
+        """Distância exata, limite e ordenação aplicados só às k escolhidas."""
+        results = []
+        for position in positions.tolist():
+            clinic = self.clinics[position]
+            distance = self.haversine_km(lat, lon, clinic["lat"], clinic["lon"])
+            if distance <= max_distance_km:
+                results.append((distance, position, clinic))
+        results.sort(key=lambda result: result[:2])
+        return [(distance, clinic) for distance, _, clinic in results]
+
+    @classmethod
+    def _ring_reach_km(cls, lat, ring):
+        """Distância mínima do ponto até qualquer célula fora do anel."""
+        # Largura em longitude encolhe com a latitude: usa a mais alta alcançada
+        widest_lat = min(89.9, abs(lat) + (ring + 1) * cls.CELL_DEGREES)
+        degree_km = math.pi / 180 * cls.EARTH_RADIUS_KM
+        return ring * cls.CELL_DEGREES * degree_km * math.cos(math.radians(widest_lat))
 
-            # Persistência
-            claim_data = {
-                "document_key": document_key,
-                "plan_tier": plan_tier,
-                "procedure_value": procedure_value,
-                "document_data": document_data,
-                "reimbursement_result": reimbursement_result,
-            }
-            self.data_manager.save_reimbursement_claim(claim_data, session_attributes)
+    @staticmethod
+    def _ring_cells(row, col, ring):
+        if ring == 0:
+            yield row, col
+            return
+        for offset in range(-ring, ring + 1):
+            yield row - ring, col + offset
+            yield row + ring, col + offset
+        for offset in range(-ring + 1, ring):
+            yield row + offset, col - ring
+            yield row + offset, col + ring
+
+    def search(self, location, plan_tier, specialty="geral", k=5):
+        """
+        Busca para os fluxos: resolve a localização e formata as clínicas.
 
-            # Notificação
-            self.notification_manager.send_reimbursement_notification(
-                slots, reimbursement_result
+        Returns:
+            list: Clínicas com "distance" ("1.2 km") e "distance_km"
+        """
+        coordinates = self.resolve_location(location)
+        if coordinates is None:
+            logger.warning(
+                "Localização não resolvida para busca de clínicas",
+                extra={"location": str(location)[:20]},
             )
-
-            return self._build_success_response(
-                "Reembolso processado com sucesso",
+            return []
+
+        results = []
+        for distance, clinic in self.nearest(
+            coordinates[0],
+            coordinates[1],
+            k=k,
+            plan_tier=plan_tier,
+            specialty=specialty,
+        ):
+            results.append(
                 {
-                    "reimbursement_result": reimbursement_result,
-                    "validation_warnings": validation_result.get("warnings", []),
-                },
-            )
-
-        except Exception as e:
-            logger.error("Erro no fluxo de reembolso", extra={"error": str(e)})
-            return self._build_error_response(
-                "processing_error", "Erro no processamento"
+                    "id": clinic.get("id"),
+                    "name": clinic.get("name", ""),
+                    "address": clinic.get("address", ""),
+                    "phone": clinic.get("phone", ""),
+                    "specialties": clinic["specialties"],
+                    "accepted_plans": clinic["accepted_plans"],
+                    "distance": f"{distance:.1f} km",
+                    "distance_km": round(distance, 3),
+                }
             )
+        return results
 
-    def process_dentist_search_flow(self, slots, session_attributes):
-        """Processa busca de dentistas."""
-        try:
-            location = slots.get("localizacao", "")
-            plan_tier = slots.get("planoDental", "basic")
-            specialty = slots.get("especialidade", "geral")
 
-            # Busca
-            clinics = self._find_nearby_clinics(location, plan_tier, specialty)
+class ClinicDirectoryLoader:
+    """
+    Mantém o ClinicDirectory vigente e o atualiza sem novo deploy.
 
-            # Persistência
-            search_data = {
-                "location": location,
-                "plan_tier": plan_tier,
-                "specialty": specialty,
-                "dentists_found": len(clinics),
-            }
-            self.data_manager.save_search_record(search_data, session_attributes)
+    Em invocações quentes, no máximo a cada refresh_seconds, compara o ETag
+    do snapshot no S3: se mudou, recarrega o snapshot inteiro (raro); senão
+    aplica, em ordem de chave, os deltas publicados em
+    <delta_prefix><versão do snapshot>/ depois do último aplicado, cada um
+    um JSON {"version", "upserts": [clínicas], "removals": [ids]}.
 
-            return self._build_success_response(
-                f"Encontrados {len(clinics)} dentistas",
-                {"clinics": clinics, "search_params": search_data},
-            )
+    A verificação roda em uma thread de fundo e termina trocando a
+    referência ao diretório (atribuição atômica): buscas nunca esperam por
+    ela e as que já estão em andamento seguem no diretório anterior.
+    """
 
-        except Exception as e:
-            logger.error("Erro na busca de dentistas", extra={"error": str(e)})
-            return self._build_error_response("search_error", "Erro na busca")
+    def __init__(
+        self,
+        directory,
+        bucket=None,
+        key=None,
+        delta_prefix="clinics/deltas/",
+        refresh_seconds=300.0,
+        s3_client=None,
+    ):
+        self.directory = directory
+        self.bucket = bucket
+        self.key = key
+        self.delta_prefix = delta_prefix
+        self.refresh_seconds = refresh_seconds
+        self.s3 = s3_client or (boto3.client("s3") if bucket else None)
+        self.snapshot_version = directory.version
+        self.last_delta_key = None
+        self.last_check = time.monotonic()
+        self.refresh_lock = threading.Lock()
+
+    @classmethod
+    def from_environment(cls):
+        """
+        Usa a configuração de ClinicDirectory.from_environment, mais
+        CLINIC_DIRECTORY_DELTA_PREFIX e CLINIC_DIRECTORY_REFRESH_SECONDS (0
+        desativa). Uma versão fixada (CLINIC_DIRECTORY_VERSION) não é
+        atualizada; os deltas já publicados são aplicados no cold start.
+        """
+        bucket = os.environ.get("CLINIC_DIRECTORY_BUCKET")
+        if os.environ.get("CLINIC_DIRECTORY_VERSION"):
+            bucket = None
+        loader = cls(
+            ClinicDirectory.from_environment(),
+            bucket=bucket,
+            key=os.environ.get("CLINIC_DIRECTORY_KEY", "clinics/directory.json.gz"),
+            delta_prefix=os.environ.get(
+                "CLINIC_DIRECTORY_DELTA_PREFIX", "clinics/deltas/"
+            ),
+            refresh_seconds=float(
+                os.environ.get("CLINIC_DIRECTORY_REFRESH_SECONDS", "300")
+            ),
+        )
+        if bucket and loader.directory.etag:
+            try:
+                loader.apply_deltas()
+            except (ClientError, BotoCoreError, ValueError) as e:
+                # Sem os deltas o snapshot ainda atende; o refresh tenta de novo
+                logger.error(
+                    "Falha ao aplicar deltas do diretório de clínicas - usando o snapshot",
+                    extra={"error_type": type(e).__name__, "error_message": str(e)},
+                )
+        return loader
+
+    def current(self):
+        """Diretório vigente; dispara a verificação em segundo plano se vencida."""
+        if (
+            self.bucket
+            and self.refresh_seconds > 0
+            and time.monotonic() - self.last_check >= self.refresh_seconds
+            and self.refresh_lock.acquire(blocking=False)
+        ):
+            self.last_check = time.monotonic()
+            # No Lambda a thread fica congelada entre invocações e continua
+            # na seguinte; a busca atual usa o diretório que já está carregado
+            threading.Thread(target=self._refresh_in_background, daemon=True).start()
+        return self.directory
+
+    def _refresh_in_background(self):
+        try:
+            self.refresh()
+        finally:
+            self.refresh_lock.release()
 
-    def _find_nearby_clinics(self, location, plan_tier, specialty="geral"):
-        """Busca clínicas próximas (dados fictícios)."""
-        mock_clinics = [
-            {
-                "name": "Clínica Dental Sorriso Saudável",
-                "address": "Rua Principal, 123 - Centro",
-                "phone": "(11) 3333-4444",
-                "specialties": ["geral", "ortodontia"],
-                "accepted_plans": ["basic", "premium"],
-                "distance": "1.2 km",
-            }
-            # ... outros clinics
-        ]
+    def refresh(self):
+        """Verifica o ETag do snapshot e aplica os deltas pendentes."""
+        try:
+            etag = self.s3.head_object(Bucket=self.bucket, Key=self.key).get("ETag")
+            if etag != self.directory.etag:
+                directory = ClinicDirectory.from_s3(
+                    self.bucket, self.key, s3_client=self.s3
+                )
+                self.snapshot_version = directory.version
+                self.last_delta_key = None
+                self.directory = directory
+                logger.info(
+                    "Snapshot do diretório de clínicas recarregado",
+                    extra={"version": directory.version, "etag": directory.etag},
+                )
+            self.apply_deltas()
+        except (ClientError, BotoCoreError, ValueError) as e:
+            logger.error(
+                "Falha ao atualizar diretório de clínicas - mantendo o atual",
+                extra={"error_type": type(e).__name__, "error_message": str(e)},
+            )
+        finally:
+            self.last_check = time.monotonic()
+        return self.directory
+
+    def apply_deltas(self):
+        """Aplica os deltas publicados após o último aplicado (em ordem)."""
+        request = {
+            "Bucket": self.bucket,
+            "Prefix": f"{self.delta_prefix}{self.snapshot_version}/",
+        }
+        if self.last_delta_key:
+            request["StartAfter"] = self.last_delta_key
+
+        applied = 0
+        paginator = self.s3.get_paginator("list_objects_v2")
+        for page in paginator.paginate(**request):
+            for obj in page.get("Contents", []):
+                body = self.s3.get_object(Bucket=self.bucket, Key=obj["Key"])[
+                    "Body"
+                ].read()
+                if body[:2] == b"\x1f\x8b":
+                    body = gzip.decompress(body)
+                delta = json.loads(body)
+
+                self.directory = self.directory.with_changes(
+                    delta.get("upserts", []),
+                    delta.get("removals", []),
+                    version=delta.get("version") or obj["Key"],
+                )
+                self.last_delta_key = obj["Key"]
+                applied += 1
+        return applied
 
-        return [
-            clinic
-            for clinic in mock_clinics
-            if plan_tier in clinic["accepted_plans"]
-            and (specialty == "geral" or specialty in clinic["specialties"])
-        ][:5]
 
-    def _calculate_reimbursement(self, document_amount, plan_tier, validation_result):
-        """Calcula valor do reembolso."""
-        reimbursement_rules = {
-            "basic": {"percentage": 0.7, "max_amount": 300.00},
-            "premium": {"percentage": 0.9, "max_amount": 1000.00},
-        }
+class LocationResolver:
+    """
+    Resolve o slot localizacao (CEP, cidade ou endereço) em coordenadas.
+
+    Offline, a partir de dois arquivos gerados por build_location_tables.py:
+    cep_prefixes.npy, tabela ordenada (prefixo de 5 dígitos, lat, lon) aberta
+    com mmap (só as páginas consultadas são lidas), e cities.json, com os
+    municípios indexados por trigramas para tolerar erros de digitação e
+    acentuação. Os resultados (inclusive "não encontrado") ficam em cache
+    por container.
+    """
 
-        rules = reimbursement_rules.get(plan_tier, reimbursement_rules["basic"])
-        base_amount = document_amount * rules["percentage"]
-        final_amount = min(base_amount, rules["max_amount"])
+    CEP_TABLE_FILE = "cep_prefixes.npy"
+    CITIES_FILE = "cities.json"
+    CEP_DTYPE = np.dtype([("prefix", "<u4"), ("lat", "<f4"), ("lon", "<f4")])
+    CEP_PATTERN = re.compile(r"\b(\d{5})-?(\d{3})\b")
+    COORDINATES_PATTERN = re.compile(
+        r"(-?\d{1,2}(?:\.\d+)?)\s*[,;]\s*(-?\d{1,3}(?:\.\d+)?)"
+    )
+    UF_PATTERN = re.compile(r"(?:^|[\s,/-])([a-z]{2})$")
+    # Similaridade mínima (Dice sobre trigramas) para aceitar uma cidade
+    MIN_CITY_SIMILARITY = 0.6
+
+    def __init__(self, cep_table=None, cities=None, cache_size=4096):
+        self.cep_table = cep_table
+        self.cep_prefixes = cep_table["prefix"] if cep_table is not None else None
+        self.cities = []
+        self.city_by_name = {}
+        self.trigrams = {}
+        self.cache = ReadCache(
+            max_entries=cache_size,
+            ttl_seconds=float("inf"),
+            negative_ttl_seconds=float("inf"),
+        )
 
-        if validation_result.get("warnings"):
-            final_amount *= 0.9
+        for city in cities or []:
+            name = ClinicDirectory._normalize_city(city["name"])
+            position = len(self.cities)
+            self.cities.append(
+                {
+                    "name": city["name"],
+                    "uf": str(city.get("uf", "")).lower(),
+                    "lat": float(city["lat"]),
+                    "lon": float(city["lon"]),
+                    "key": name,
+                    "trigram_count": len(self._trigrams(name)),
+                }
+            )
+            self.city_by_name.setdefault(name, []).append(position)
+            for trigram in self._trigrams(name):
+                self.trigrams.setdefault(trigram, []).append(position)
+
+    @classmethod
+    def from_directory(cls, data_dir):
+        """Abre os arquivos de data_dir (ausentes são ignorados)."""
+        cep_table = None
+        cities = None
+
+        cep_path = os.path.join(data_dir, cls.CEP_TABLE_FILE)
+        if os.path.exists(cep_path):
+            cep_table = np.load(cep_path, mmap_mode="r")
+            if cep_table.dtype != cls.CEP_DTYPE:
+                raise ValueError(f"Tabela de CEP com formato inesperado: {cep_path}")
+
+        cities_path = os.path.join(data_dir, cls.CITIES_FILE)
+        if os.path.exists(cities_path):
+            with open(cities_path, encoding="utf-8") as cities_file:
+                cities = json.load(cities_file)
+
+        resolver = cls(cep_table, cities)
+        logger.info(
+            "LocationResolver carregado",
+            extra={
+                "data_dir": data_dir,
+                "cep_prefixes": 0 if cep_table is None else len(cep_table),
+                "cities": len(resolver.cities),
+            },
+        )
+        return resolver
+
+    @classmethod
+    def from_environment(cls):
+        """Arquivos em LOCATION_DATA_DIR (padrão: data/ ao lado do módulo)."""
+        data_dir = os.environ.get(
+            "LOCATION_DATA_DIR",
+            os.path.join(os.path.dirname(os.path.abspath(__file__)), "data"),
+        )
+        try:
+            return cls.from_directory(data_dir)
+        except (OSError, ValueError) as e:
+            logger.error(
+                "Falha ao carregar tabelas de localização",
+                extra={"error_type": type(e).__name__, "error_message": str(e)},
+            )
+            return cls()
 
-        status = "approved" if final_amount > 0 else "rejected"
-        if final_amount < base_amount:
-            status = "partial"
+    @staticmethod
+    def _trigrams(text):
+        padded = f"  {text} "
+        return {padded[index : index + 3] for index in range(len(padded) - 2)}
 
-        return {
-            "status": status,
-            "amount": round(final_amount, 2),
-            "percentage": rules["percentage"],
-            "original_amount": document_amount,
-            "max_allowed": rules["max_amount"],
-            "message": self._get_reimbursement_message(status, final_amount),
-        }
+    def resolve(self, location):
+        """
+        Returns:
+            tuple | None: (lat, lon) da localização informada
+        """
+        text = " ".join(str(location or "").split())
+        if not text:
+            return None
+
+        found, coordinates = self.cache.get(text)
+        if found:
+            return coordinates
+
+        coordinates = self._resolve(text)
+        self.cache.put(text, coordinates)
+        return coordinates
+
+    def _resolve(self, text):
+        match = self.COORDINATES_PATTERN.fullmatch(text)
+        if match:
+            return float(match.group(1)), float(match.group(2))
+
+        # CEP em qualquer parte do texto (endereços completos costumam ter)
+        match = self.CEP_PATTERN.search(text)
+        if match:
+            coordinates = self.resolve_cep(match.group(1) + match.group(2))
+            if coordinates:
+                return coordinates
+
+        # Endereço "Rua X, 123, Bairro, Cidade - UF": tenta do fim para o início
+        parts = [part.strip() for part in re.split(r"[,;\n]", text) if part.strip()]
+        for part in reversed(parts):
+            coordinates = self.resolve_city(part)
+            if coordinates:
+                return coordinates
+        return None
+
+    def resolve_cep(self, cep):
+        """Centroide do prefixo de 5 dígitos (ou dos prefixos de 3/2 dígitos)."""
+        if self.cep_prefixes is None or len(self.cep_prefixes) == 0:
+            return None
+
+        digits = re.sub(r"\D", "", str(cep))
+        if len(digits) != 8:
+            return None
+
+        prefix = int(digits[:5])
+        position = int(np.searchsorted(self.cep_prefixes, prefix))
+        if position < len(self.cep_prefixes) and self.cep_prefixes[position] == prefix:
+            row = self.cep_table[position]
+            return round(float(row["lat"]), 5), round(float(row["lon"]), 5)
+
+        # Prefixo sem dados: média dos prefixos vizinhos da mesma região
+        for scale in (100, 1000):
+            low = prefix // scale * scale
+            start = int(np.searchsorted(self.cep_prefixes, low))
+            end = int(np.searchsorted(self.cep_prefixes, low + scale))
+            if end > start:
+                rows = self.cep_table[start:end]
+                return (
+                    round(float(rows["lat"].mean()), 5),
+                    round(float(rows["lon"].mean()), 5),
+                )
+        return None
+
+    def resolve_city(self, text):
+        """Cidade por nome exato ou aproximado (trigramas), com UF opcional."""
+        name = ClinicDirectory._normalize_city(text)
+        uf = None
+        match = self.UF_PATTERN.search(name)
+        if match and len(name) > 3 and name not in self.city_by_name:
+            uf = match.group(1)
+            name = name[: match.start()].strip(" -/,")
+        if not name:
+            return None
+
+        positions = self.city_by_name.get(name)
+        if positions:
+            best = next(
+                (
+                    position
+                    for position in positions
+                    if uf is None or self.cities[position]["uf"] == uf
+                ),
+                positions[0],
+            )
+            return self.cities[best]["lat"], self.cities[best]["lon"]
 
-    def _get_reimbursement_message(self, status, amount):
-        """Gera mensagem do reembolso."""
-        messages = {
-            "approved": f"Reembolso aprovado no valor de R$ {amount:.2f}",
-            "partial": f"Reembolso parcial aprovado no valor de R$ {amount:.2f}",
-            "rejected": "Reembolso não aprovado conforme regras do plano",
-        }
-        return messages.get(status, "Status desconhecido")
+        query = self._trigrams(name)
+        shared = Counter()
+        for trigram in query:
+            shared.update(self.trigrams.get(trigram, ()))
 
-    def _build_success_response(self, message, data=None):
-        """Constrói resposta de sucesso padronizada."""
-        return {"status": "success", "message": message, "data": data or {}}
+        best, best_score = None, self.MIN_CITY_SIMILARITY
+        for position, common in shared.items():
+            city = self.cities[position]
+            score = 2 * common / (len(query) + city["trigram_count"])
+            if uf and city["uf"] == uf:
+                score += 0.05
+            if score > best_score:
+                best, best_score = position, score
 
-    def _build_error_response(self, error_type, message):
-        """Constrói resposta de erro padronizada."""
-        return {"status": error_type, "message": message}
+        if best is None:
+            return None
+        return self.cities[best]["lat"], self.cities[best]["lon"]
 
 
 class DataMasker:
@@ -1832,3 +5493,525 @@ class DataMasker:
             return "***"
 
         return f"{value[:2]}...{value[-2:]}" if len(value) > 4 else "***"
+
+
+class CurrencyParser:
+    """
+    Converte textos monetários (R$ 1.234,56, 1.000, 1,234.56...) em float.
+
+    Os padrões são compilados uma única vez e a conversão em lote retorna um
+    array float64 e uma máscara de validade, para uso em pipelines de muitos
+    documentos.
+    """
+
+    # Primeiro token numérico do texto: dígitos com separadores internos
+    _NUMBER_PATTERN = re.compile(r"\d(?:[\d.,]*\d)?")
+    # Parte inteira agrupada em milhares, por separador de milhar
+    _GROUPED_PATTERNS = {
+        ".": re.compile(r"\d{1,3}(?:\.\d{3})+"),
+        ",": re.compile(r"\d{1,3}(?:,\d{3})+"),
+    }
+
+    # Separador de milhar por locale
+    LOCALES = {
+        "pt_BR": ".",
+        "en_US": ",",
+    }
+    # Forma canônica de cada locale (caminho rápido): milhar opcional + decimal
+    _CANONICAL_PATTERNS = {
+        "pt_BR": re.compile(r"(\d{1,3}(?:\.\d{3})+|\d+)(?:,(\d{1,2}))?"),
+        "en_US": re.compile(r"(\d{1,3}(?:,\d{3})+|\d+)(?:\.(\d{1,2}))?"),
+    }
+
+    @staticmethod
+    def parse(text, locale="pt_BR"):
+        """
+        Converte um texto monetário em float.
+
+        Quando os dois separadores aparecem, o último é o decimal. Quando só
+        um aparece, ele é tratado como milhar se se repetir ou se for o
+        separador de milhar do locale seguido de exatamente 3 dígitos
+        ("1.000" = mil em pt_BR); caso contrário, é decimal.
+
+        Args:
+            text: Texto contendo valor monetário
+            locale: Chave de CurrencyParser.LOCALES
+
+        Returns:
+            float: Valor extraído, ou None quando não há valor reconhecível
+        """
+        if not text or not isinstance(text, str):
+            return None
+
+        match = CurrencyParser._NUMBER_PATTERN.search(text)
+        if match is None:
+            return None
+
+        token = match.group()
+        canonical = CurrencyParser._CANONICAL_PATTERNS[locale].fullmatch(token)
+        if canonical is not None:
+            integer_part, fraction = canonical.groups()
+            integer_part = integer_part.replace(CurrencyParser.LOCALES[locale], "")
+            return float(f"{integer_part}.{fraction}" if fraction else integer_part)
+
+        last_dot = token.rfind(".")
+        last_comma = token.rfind(",")
+
+        if last_dot < 0 and last_comma < 0:
+            return float(token)
+
+        if last_dot >= 0 and last_comma >= 0:
+            decimal_sep = "." if last_dot > last_comma else ","
+            group_sep = "," if decimal_sep == "." else "."
+        else:
+            separator = "." if last_dot >= 0 else ","
+            decimals = len(token) - max(last_dot, last_comma) - 1
+            if token.count(separator) > 1 or (
+                separator == CurrencyParser.LOCALES[locale] and decimals == 3
+            ):
+                decimal_sep, group_sep = None, separator
+            else:
+                decimal_sep, group_sep = separator, None
+
+        if decimal_sep is None:
+            integer_part, fraction = token, ""
+        else:
+            integer_part, _, fraction = token.rpartition(decimal_sep)
+
+        # A parte inteira só aceita o separador de milhar em grupos de 3
+        if not integer_part.isdigit():
+            pattern = CurrencyParser._GROUPED_PATTERNS.get(group_sep)
+            if pattern is None or not pattern.fullmatch(integer_part):
+                return None
+            integer_part = integer_part.replace(group_sep, "")
+
+        return float(f"{integer_part}.{fraction}" if fraction else integer_part)
+
+    @staticmethod
+    def parse_batch(texts, locale="pt_BR"):
+        """
+        Converte vários textos monetários de uma vez.
+
+        Args:
+            texts: Sequência de textos (None/vazio são aceitos)
+            locale: Chave de CurrencyParser.LOCALES
+
+        Returns:
+            tuple: (np.ndarray float64 com os valores, np.ndarray bool de validade)
+        """
+        # Textos repetidos (valores comuns em recibos) são convertidos uma vez
+        parse = CurrencyParser.parse
+        cache = {}
+        parsed = []
+        for text in texts:
+            value = cache.get(text, cache) if isinstance(text, str) else None
+            if value is cache:
+                value = cache[text] = parse(text, locale)
+            parsed.append(value)
+
+        valid = np.array([value is not None for value in parsed], dtype=bool)
+        values = np.array(
+            [0.0 if value is None else value for value in parsed], dtype=np.float64
+        )
+        return values, valid
+
+
+class ReceiptFingerprint:
+    """Gera impressões digitais normalizadas de recibos para detectar duplicidade."""
+
+    # Sufixos societários que não diferenciam prestadores
+    _LEGAL_SUFFIXES = {"ltda", "me", "epp", "eireli", "sa", "ss", "mei"}
+    _NON_ALNUM_PATTERN = re.compile(r"[^a-z0-9]+")
+    _DATE_PATTERNS = (
+        (re.compile(r"(\d{4})-(\d{1,2})-(\d{1,2})"), ("year", "month", "day")),
+        (re.compile(r"(\d{1,2})[/.-](\d{1,2})[/.-](\d{4})"), ("day", "month", "year")),
+        (
+            re.compile(r"(\d{1,2})[/.-](\d{1,2})[/.-](\d{2})\b"),
+            ("day", "month", "year"),
+        ),
+    )
+
+    @staticmethod
+    def normalize_provider(name):
+        """Remove acentos, pontuação e sufixos societários do nome do prestador."""
+        if not name or not isinstance(name, str):
+            return ""
+
+        folded = unicodedata.normalize("NFKD", name.lower())
+        folded = "".join(char for char in folded if not unicodedata.combining(char))
+        tokens = ReceiptFingerprint._NON_ALNUM_PATTERN.sub(" ", folded).split()
+        return " ".join(
+            token for token in tokens if token not in ReceiptFingerprint._LEGAL_SUFFIXES
+        )
+
+    @staticmethod
+    def normalize_date(text):
+        """Converte datas dd/mm/aaaa, dd/mm/aa ou aaaa-mm-dd para ISO (aaaa-mm-dd)."""
+        if not text or not isinstance(text, str):
+            return ""
+
+        for pattern, order in ReceiptFingerprint._DATE_PATTERNS:
+            match = pattern.search(text)
+            if match:
+                parts = dict(zip(order, (int(group) for group in match.groups())))
+                if parts["year"] < 100:
+                    parts["year"] += 2000
+                return f"{parts['year']:04d}-{parts['month']:02d}-{parts['day']:02d}"
+
+        return ""
+
+    @staticmethod
+    def build(document_data):
+        """
+        Gera as impressões digitais de um recibo.
+
+        "content" combina prestador, data, valor total em centavos e, quando
+        disponível, o número do documento; só é gerada se os três primeiros
+        forem identificados. "image" é o hash do arquivo enviado.
+
+        Args:
+            document_data: Dados extraídos pelo DocumentProcessor
+
+        Returns:
+            dict: tipo -> hash sha256 (vazio se não houver dados suficientes)
+        """
+        fingerprints = {}
+        if not document_data:
+            return fingerprints
+
+        provider = ReceiptFingerprint.normalize_provider(
+            document_data.get("provider_name")
+        )
+        date = ReceiptFingerprint.normalize_date(document_data.get("date"))
+        total_cents = int(round(float(document_data.get("total_amount") or 0) * 100))
+
+        if provider and date and total_cents > 0:
+            document_number = re.sub(
+                r"\D", "", str(document_data.get("document_number") or "")
+            ).lstrip("0")
+            content = "|".join([provider, date, str(total_cents), document_number])
+            fingerprints["content"] = hashlib.sha256(content.encode()).hexdigest()
+
+        if document_data.get("image_hash"):
+            fingerprints["image"] = hashlib.sha256(
+                document_data["image_hash"].encode()
+            ).hexdigest()
+
+        return fingerprints
+
+
+class ElectronicInvoiceParser:
+    """
+    Lê notas fiscais eletrônicas (NF-e, NFS-e ABRASF e NFS-e Nacional).
+
+    Os campos são localizados pelo par "pai/tag" (sem namespace), o que cobre
+    os leiautes mais comuns sem depender de um XSD por município.
+    """
+
+    # Candidatos por campo, em ordem de preferência
+    FIELD_PATHS = {
+        "provider_name": (
+            "emit/xNome",
+            "PrestadorServico/RazaoSocial",
+            "Prestador/RazaoSocial",
+            "prest/xNome",
+        ),
+        "provider_tax_id": (
+            "emit/CNPJ",
+            "emit/CPF",
+            "IdentificacaoPrestador/Cnpj",
+            "prest/CNPJ",
+        ),
+        "total_amount": (
+            "ICMSTot/vNF",
+            "Valores/ValorLiquidoNfse",
+            "ValoresNfse/ValorLiquidoNfse",
+            "Valores/ValorServicos",
+            "valores/vLiq",
+            "vServPrest/vServ",
+        ),
+        "date": (
+            "ide/dhEmi",
+            "ide/dEmi",
+            "InfNfse/DataEmissao",
+            "infNFSe/dhProc",
+            "infDPS/dhEmi",
+        ),
+        "procedure_description": (
+            "Servico/Discriminacao",
+            "cServ/xDescServ",
+            "prod/xProd",
+        ),
+        "document_number": (
+            "ide/nNF",
+            "InfNfse/Numero",
+            "infNFSe/nNFSe",
+        ),
+        "access_key": ("infProt/chNFe",),
+    }
+    CURRENCY_FIELDS = ("total_amount",)
+
+    # Raízes que identificam o tipo do documento
+    _SOURCE_BY_ROOT = {
+        "nfeProc": "nfe_xml",
+        "NFe": "nfe_xml",
+        "CompNfse": "nfse_xml",
+        "ConsultarNfseResposta": "nfse_xml",
+        "NFSe": "nfse_xml",
+    }
+
+    _XML_START_PATTERN = re.compile(rb"<(?:\w+:)?(nfeProc|NFe|CompNfse|NFSe)\b")
+    _PDF_STREAM_PATTERN = re.compile(rb"stream\r?\n(.*?)\r?\nendstream", re.DOTALL)
+    _ACCESS_KEY_PATTERN = re.compile(rb"(?<!\d)((?:\d{4}[ .]?){10}\d{4})(?!\d)")
+
+    # Teto de bytes descomprimidos somando todos os streams de um PDF; acima
+    # disso o documento segue para o Textract (protege contra zip bombs)
+    MAX_PDF_INFLATED_BYTES = 16 * 1024 * 1024
+
+    @staticmethod
+    def _local_name(tag):
+        """Remove o namespace de uma tag ElementTree."""
+        return tag.rsplit("}", 1)[-1]
+
+    @staticmethod
+    def parse_xml(content):
+        """
+        Extrai os dados de um XML de NF-e/NFS-e.
+
+        Args:
+            content: Bytes do XML
+
+        Returns:
+            dict: Dados no mesmo formato do Textract, ou None se não for nota
+        """
+        try:
+            root = ElementTree.fromstring(content)
+        except ElementTree.ParseError:
+            return None
+
+        local_name = ElectronicInvoiceParser._local_name
+        source = ElectronicInvoiceParser._SOURCE_BY_ROOT.get(local_name(root.tag))
+        if source is None:
+            return None
+
+        # Primeira ocorrência de cada "pai/tag" em um único percurso da árvore
+        values = {}
+        access_key = None
+        for parent in root.iter():
+            parent_name = local_name(parent.tag)
+            if access_key is None and parent_name in ("infNFe", "infNFSe"):
+                access_key = re.sub(r"\D", "", parent.get("Id", "")) or None
+            for child in parent:
+                text = (child.text or "").strip()
+                if text:
+                    values.setdefault(f"{parent_name}/{local_name(child.tag)}", text)
+
+        invoice = {"source": source}
+        for field, paths in ElectronicInvoiceParser.FIELD_PATHS.items():
+            for path in paths:
+                if path in values:
+                    invoice[field] = values[path]
+                    break
+
+        for field in ElectronicInvoiceParser.CURRENCY_FIELDS:
+            if field in invoice:
+                try:
+                    invoice[field] = float(invoice[field])
+                except ValueError:
+                    invoice[field] = CurrencyParser.parse(invoice[field]) or 0.0
+
+        if "date" in invoice:
+            invoice["date"] = invoice["date"][:10]
+        if access_key and "access_key" not in invoice:
+            invoice["access_key"] = access_key
+
+        return invoice
+
+    @staticmethod
+    def parse_pdf(content):
+        """
+        Procura em um PDF o XML da nota embutido ou a chave de acesso.
+
+        Args:
+            content: Bytes do PDF
+
+        Returns:
+            dict: Dados do XML embutido, dados da chave de acesso, ou None
+                (inclusive quando os streams excedem MAX_PDF_INFLATED_BYTES)
+        """
+        chunks = [content]
+        budget = ElectronicInvoiceParser.MAX_PDF_INFLATED_BYTES
+        for match in ElectronicInvoiceParser._PDF_STREAM_PATTERN.finditer(content):
+            decompressor = zlib.decompressobj()
+            try:
+                # Lê um byte além do saldo para detectar o estouro do teto
+                chunk = decompressor.decompress(match.group(1), budget + 1)
+            except zlib.error:
+                continue
+
+            budget -= len(chunk)
+            if budget < 0:
+                logger.warning(
+                    "PDF excede o limite de descompressão do caminho eletrônico",
+                    extra={"max_bytes": ElectronicInvoiceParser.MAX_PDF_INFLATED_BYTES},
+                )
+                return None
+            chunks.append(chunk)
+
+        access_key = None
+        for chunk in chunks:
+            xml_match = ElectronicInvoiceParser._XML_START_PATTERN.search(chunk)
+            if xml_match:
+                # O XML termina no último fechamento da tag raiz
+                closings = list(
+                    re.finditer(rb"</(?:\w+:)?" + xml_match.group(1) + rb">", chunk)
+                )
+                invoice = None
+                if closings:
+                    invoice = ElectronicInvoiceParser.parse_xml(
+                        chunk[xml_match.start() : closings[-1].end()]
+                    )
+                if invoice:
+                    invoice["source"] = f"{invoice['source']}_embedded"
+                    return invoice
+
+            if access_key is None:
+                for key_match in ElectronicInvoiceParser._ACCESS_KEY_PATTERN.finditer(
+                    chunk
+                ):
+                    candidate = re.sub(rb"\D", b"", key_match.group(1)).decode()
+                    if ElectronicInvoiceParser.is_valid_access_key(candidate):
+                        access_key = candidate
+                        break
+
+        if access_key:
+            return ElectronicInvoiceParser.decode_access_key(access_key)
+        return None
+
+    @staticmethod
+    def is_valid_access_key(access_key):
+        """Valida o dígito verificador (módulo 11) de uma chave de 44 dígitos."""
+        if len(access_key) != 44 or not access_key.isdigit():
+            return False
+
+        weights = (2, 3, 4, 5, 6, 7, 8, 9)
+        total = sum(
+            int(digit) * weights[index % 8]
+            for index, digit in enumerate(reversed(access_key[:43]))
+        )
+        check_digit = 11 - total % 11
+        return (0 if check_digit >= 10 else check_digit) == int(access_key[43])
+
+    @staticmethod
+    def decode_access_key(access_key):
+        """
+        Decodifica os campos contidos na chave de acesso.
+
+        Layout: cUF(2) AAMM(4) CNPJ(14) modelo(2) série(3) número(9)
+        tpEmis(1) código(8) DV(1).
+        """
+        return {
+            "source": "access_key",
+            "access_key": access_key,
+            "provider_tax_id": access_key[6:20],
+            "document_number": str(int(access_key[25:34])),
+            "issue_month": f"20{access_key[2:4]}-{access_key[4:6]}",
+        }
+
+
+class ClaimIdGenerator:
+    """
+    Gera identificadores de sinistro no estilo ULID, ordenáveis por tempo.
+
+    Layout de 128 bits codificado em 26 caracteres Crockford base32:
+    timestamp em ms (48 bits) | container (24 bits) | sequência (56 bits).
+    O container é derivado do log stream da Lambda (ou aleatório), e a
+    sequência começa aleatória a cada milissegundo e é incrementada dentro
+    dele, garantindo ordem monotônica no processo e ausência de colisão
+    entre containers.
+    """
+
+    ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+    PREFIX = "lex_"
+    ENCODED_LENGTH = 26
+    NODE_BITS = 24
+    SEQUENCE_BITS = 56
+
+    _default = None
+    _default_lock = threading.Lock()
+
+    def __init__(self, node_id=None):
+        if node_id is None:
+            stream = os.environ.get("AWS_LAMBDA_LOG_STREAM_NAME")
+            node_id = (
+                int(hashlib.sha256(stream.encode()).hexdigest(), 16)
+                if stream
+                else random.getrandbits(self.NODE_BITS)
+            )
+        self.node_id = node_id & ((1 << self.NODE_BITS) - 1)
+        self.lock = threading.Lock()
+        self.last_ms = -1
+        self.sequence = 0
+
+    @classmethod
+    def default(cls):
+        """Instância compartilhada pelo container."""
+        if cls._default is None:
+            with cls._default_lock:
+                if cls._default is None:
+                    cls._default = cls()
+        return cls._default
+
+    def new_id(self, prefix=PREFIX):
+        """
+        Gera um novo identificador.
+
+        Args:
+            prefix: Prefixo do identificador (padrão "lex_")
+
+        Returns:
+            str: Identificador monotônico no processo
+        """
+        with self.lock:
+            now_ms = int(time.time() * 1000)
+            if now_ms > self.last_ms:
+                self.last_ms = now_ms
+                # Metade inferior do espaço deixa folga para incrementos
+                self.sequence = random.getrandbits(self.SEQUENCE_BITS - 1)
+            else:
+                # Relógio igual (ou recuou): mantém a ordem incrementando
+                self.sequence += 1
+                if self.sequence >> self.SEQUENCE_BITS:
+                    self.last_ms += 1
+                    self.sequence = 0
+            timestamp_ms, sequence = self.last_ms, self.sequence
+
+        value = (
+            (timestamp_ms << (self.NODE_BITS + self.SEQUENCE_BITS))
+            | (self.node_id << self.SEQUENCE_BITS)
+            | sequence
+        )
+        return f"{prefix}{self.encode(value)}"
+
+    @classmethod
+    def encode(cls, value):
+        """Codifica um inteiro de 128 bits em base32 Crockford (26 caracteres)."""
+        chars = []
+        for _ in range(cls.ENCODED_LENGTH):
+            chars.append(cls.ALPHABET[value & 31])
+            value >>= 5
+        return "".join(reversed(chars))
+
+    @classmethod
+    def decode(cls, claim_id, prefix=PREFIX):
+        """Retorna o inteiro de 128 bits de um identificador."""
+        encoded = claim_id[len(prefix) :] if claim_id.startswith(prefix) else claim_id
+        value = 0
+        for char in encoded.upper():
+            value = (value << 5) | cls.ALPHABET.index(char)
+        return value
+
+    @classmethod
+    def shard_of(cls, claim_id, shard_count):
+        """Shard estável derivado dos bits de sequência do identificador."""
+        return cls.decode(claim_id) % shard_count
@@ -0,0 +1,270 @@
+"""
+Reprocessamento em lote de recibos com o Amazon Textract.
+
+Lê chaves de documentos de um prefixo S3 ou de um manifesto (arquivo local ou
+s3://bucket/chave, uma chave por linha ou JSONL com "document_key"), executa
+DocumentProcessor.process_receipt em um pool de threads com concorrência
+limitada e taxa máxima de requisições (TPS), e grava cada extração como uma
+linha JSONL. O próprio arquivo de saída funciona como checkpoint: ao ser
+executado novamente, as chaves já gravadas são puladas.
+
+Uso:
+    python back-end/reprocess_receipts.py --bucket meu-bucket --prefix recibos/ \\
+        --output extracoes.jsonl --workers 8 --tps 5
+    python back-end/reprocess_receipts.py --bucket meu-bucket \\
+        --manifest s3://meu-bucket/manifestos/reauditoria.txt --output extracoes.jsonl
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import (
+    ALL_COMPLETED,
+    FIRST_COMPLETED,
+    ThreadPoolExecutor,
+    wait,
+)
+from datetime import datetime
+
+import boto3
+from botocore.config import Config
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from orchestrator_lambda import DocumentProcessor  # noqa: E402
+
+logger = logging.getLogger("reprocess_receipts")
+
+
+class RateLimiter:
+    """Limitador de taxa (token bucket) compartilhado entre threads."""
+
+    def __init__(self, rate_per_second):
+        self.interval = 1.0 / rate_per_second if rate_per_second > 0 else 0.0
+        self.lock = threading.Lock()
+        self.next_slot = time.monotonic()
+
+    def acquire(self):
+        """Bloqueia até que a próxima requisição possa ser enviada."""
+        if not self.interval:
+            return
+
+        with self.lock:
+            now = time.monotonic()
+            slot = max(self.next_slot, now)
+            self.next_slot = slot + self.interval
+
+        delay = slot - now
+        if delay > 0:
+            time.sleep(delay)
+
+
+def iter_prefix_keys(s3, bucket, prefix):
+    """Gera as chaves de um prefixo S3 página a página."""
+    paginator = s3.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+        for obj in page.get("Contents", []):
+            if not obj["Key"].endswith("/"):
+                yield obj["Key"]
+
+
+def iter_manifest_keys(s3, manifest):
+    """Gera as chaves de um manifesto local ou s3://, sem carregá-lo inteiro."""
+    if manifest.startswith("s3://"):
+        bucket, _, key = manifest[len("s3://") :].partition("/")
+        body = s3.get_object(Bucket=bucket, Key=key)["Body"]
+        lines = (line.decode("utf-8") for line in body.iter_lines())
+    else:
+        lines = open(manifest, encoding="utf-8")
+
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        if line.startswith("{"):
+            record = json.loads(line)
+            line = record.get("document_key") or record.get("key", "")
+        if line:
+            yield line
+
+
+def load_checkpoint(output_path, retry_errors):
+    """Retorna as chaves já presentes no arquivo de saída."""
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+
+    with open(output_path, encoding="utf-8") as output:
+        for line in output:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # Última linha truncada por uma interrupção
+                continue
+            if retry_errors and record.get("status") != "ok":
+                continue
+            done.add(record["document_key"])
+
+    return done
+
+
+def process_key(processor, limiter, document_key, max_retries):
+    """Processa uma chave, repetindo com backoff quando o Textract limita a taxa."""
+    started = time.monotonic()
+    attempt = 0
+
+    while True:
+        limiter.acquire()
+        data = processor.process_receipt(document_key)
+        if data.get("error") != "textract_throttled" or attempt >= max_retries:
+            break
+        attempt += 1
+        time.sleep(min(2**attempt * 0.2, 10.0))
+
+    error = data.get("error")
+    return {
+        "document_key": document_key,
+        "status": "error" if error else "ok",
+        "error": error,
+        "data": None if error else data,
+        "attempts": attempt + 1,
+        "elapsed_ms": round((time.monotonic() - started) * 1000, 1),
+        "processed_at": datetime.utcnow().isoformat(),
+    }
+
+
+def run(args):
+    session = boto3.session.Session(region_name=args.region)
+    s3 = session.client("s3")
+    textract = session.client(
+        "textract",
+        config=Config(
+            max_pool_connections=args.workers,
+            retries={"mode": "standard", "max_attempts": 3},
+        ),
+    )
+    processor = DocumentProcessor(
+        textract_client=textract, documents_bucket=args.bucket
+    )
+    limiter = RateLimiter(args.tps)
+
+    done = load_checkpoint(args.output, args.retry_errors)
+    if args.manifest:
+        keys = iter_manifest_keys(s3, args.manifest)
+    else:
+        keys = iter_prefix_keys(s3, args.bucket, args.prefix)
+
+    stats = Counter()
+    errors = Counter()
+    latencies = []
+    started = time.monotonic()
+    max_in_flight = args.workers * 2
+    next_progress = args.progress_every
+
+    with open(args.output, "a", encoding="utf-8") as output, ThreadPoolExecutor(
+        max_workers=args.workers
+    ) as executor:
+        pending = set()
+
+        def drain(return_when):
+            nonlocal pending, next_progress
+            finished, pending = wait(pending, return_when=return_when)
+            for future in finished:
+                record = future.result()
+                output.write(json.dumps(record, ensure_ascii=False, default=str))
+                output.write("\n")
+                stats[record["status"]] += 1
+                latencies.append(record["elapsed_ms"])
+                if record["error"]:
+                    errors[record["error"]] += 1
+            output.flush()
+
+            total = stats["ok"] + stats["error"]
+            if total >= next_progress:
+                next_progress += args.progress_every
+                logger.warning(
+                    "%d processados (%.1f/s)",
+                    total,
+                    total / (time.monotonic() - started),
+                )
+
+        for document_key in keys:
+            if document_key in done:
+                stats["skipped"] += 1
+                continue
+            if args.limit and stats["submitted"] >= args.limit:
+                break
+
+            pending.add(
+                executor.submit(
+                    process_key, processor, limiter, document_key, args.max_retries
+                )
+            )
+            stats["submitted"] += 1
+
+            # Mantém a leitura das chaves no ritmo do pool (memória limitada)
+            if len(pending) >= max_in_flight:
+                drain(FIRST_COMPLETED)
+
+        if pending:
+            drain(ALL_COMPLETED)
+
+    elapsed = time.monotonic() - started
+    processed = stats["ok"] + stats["error"]
+    latencies.sort()
+
+    summary = {
+        "processed": processed,
+        "ok": stats["ok"],
+        "errors": stats["error"],
+        "skipped_from_checkpoint": stats["skipped"],
+        "errors_by_type": dict(errors),
+        "elapsed_seconds": round(elapsed, 2),
+        "throughput_per_second": round(processed / elapsed, 2) if elapsed else 0.0,
+        "latency_p50_ms": latencies[len(latencies) // 2] if latencies else None,
+        "latency_p95_ms": (
+            latencies[int(len(latencies) * 0.95)] if latencies else None
+        ),
+    }
+    print(json.dumps(summary, indent=2, ensure_ascii=False))
+    return 0 if not stats["error"] else 1
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Reprocessa recibos em lote com o Textract"
+    )
+    parser.add_argument("--bucket", default=os.environ.get("DOCUMENTS_BUCKET"))
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--prefix", help="Prefixo S3 com os documentos")
+    source.add_argument("--manifest", help="Manifesto local ou s3://bucket/chave")
+    parser.add_argument("--output", required=True, help="Arquivo JSONL de saída")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument(
+        "--tps", type=float, default=5.0, help="Máximo de chamadas Textract por segundo"
+    )
+    parser.add_argument("--max-retries", type=int, default=5)
+    parser.add_argument("--limit", type=int, default=0)
+    parser.add_argument(
+        "--retry-errors",
+        action="store_true",
+        help="Reprocessa chaves que falharam na execução anterior",
+    )
+    parser.add_argument("--progress-every", type=int, default=500)
+    parser.add_argument("--region", default=os.environ.get("AWS_REGION"))
+    args = parser.parse_args()
+
+    if not args.bucket:
+        parser.error("--bucket ou DOCUMENTS_BUCKET é obrigatório")
+
+    logging.basicConfig(level=logging.WARNING, format="%(asctime)s %(message)s")
+    return run(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
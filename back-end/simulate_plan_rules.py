@@ -0,0 +1,385 @@
+"""
+Simulação de cenários ("what-if") das regras de reembolso sobre o histórico.
+
+Carrega os sinistros de reembolso exportados (JSONL, com ou sem gzip: a
+exportação do backfill_claims.py ou o arquivo frio do ClaimArchive, local ou
+s3://bucket/prefixo) em colunas NumPy (plano, valor do documento, valor
+pago e máscara de avisos) e aplica uma versão candidata da tabela de regras
+a todos de uma vez com PlanRules.evaluate_reimbursement_batch, incluindo a
+penalidade por avisos e os tetos. O relatório mostra, por plano, quanto
+seria pago contra a linha de base: os valores gravados ou, com
+--baseline-rules, outra versão da tabela recalculada da mesma forma.
+
+Sinistros duplicados ou sem valor de documento ficam de fora, e um
+sinistro repetido na exportação (mesmo sessionId/createdAt, por exemplo
+após uma retomada do backfill ou com fontes sobrepostas) conta uma vez. Para
+sinistros gravados antes do campo warning_penalty_applied, a penalidade é
+inferida comparando o valor pago com o teto calculado.
+
+Com --columns-cache, as colunas são gravadas em um .npz na primeira
+execução e reaproveitadas nas seguintes, de modo que comparar várias
+versões candidatas não exige reler a exportação.
+
+Uso:
+    python back-end/simulate_plan_rules.py --input export/ \\
+        --rules candidatas/plan_rules_2025_3.json --columns-cache colunas.npz
+    python back-end/simulate_plan_rules.py \\
+        --input s3://meu-bucket/claims-archive/claimType=reimbursement/ \\
+        --rules s3://referencia/rules/plan_rules.json \\
+        --baseline-rules back-end/plan_rules.json --workers 8
+"""
+
+import argparse
+import gzip
+import hashlib
+import io
+import json
+import logging
+import os
+import sys
+import time
+from collections import Counter
+from multiprocessing import Pool
+
+import boto3
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from orchestrator_lambda import PlanRules  # noqa: E402
+
+logger = logging.getLogger("simulate_plan_rules")
+
+EXPORT_SUFFIXES = (".jsonl", ".jsonl.gz", ".json.gz")
+
+
+def list_sources(inputs):
+    """Expande arquivos, diretórios locais e prefixos s3:// em fontes."""
+    sources = []
+    s3 = None
+    for path in inputs:
+        if path.startswith("s3://"):
+            s3 = s3 or boto3.client("s3")
+            bucket, _, prefix = path[len("s3://") :].partition("/")
+            paginator = s3.get_paginator("list_objects_v2")
+            for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+                for obj in page.get("Contents", []):
+                    if obj["Key"].endswith(EXPORT_SUFFIXES):
+                        sources.append(f"s3://{bucket}/{obj['Key']}")
+        elif os.path.isdir(path):
+            for root, _, files in sorted(os.walk(path)):
+                sources.extend(
+                    os.path.join(root, name)
+                    for name in sorted(files)
+                    if name.endswith(EXPORT_SUFFIXES)
+                )
+        else:
+            sources.append(path)
+    return sources
+
+
+def open_source(source):
+    """Abre uma fonte local ou s3:// como texto, descomprimindo gzip."""
+    if source.startswith("s3://"):
+        bucket, _, key = source[len("s3://") :].partition("/")
+        body = boto3.client("s3").get_object(Bucket=bucket, Key=key)["Body"]
+        if source.endswith(".gz"):
+            return io.TextIOWrapper(gzip.GzipFile(fileobj=body), encoding="utf-8")
+        return io.TextIOWrapper(body, encoding="utf-8")
+    if source.endswith(".gz"):
+        return gzip.open(source, "rt", encoding="utf-8")
+    return open(source, encoding="utf-8")
+
+
+def penalty_applied(result, paid):
+    """Penalidade por avisos: gravada no resultado ou inferida pelo valor pago."""
+    if "warning_penalty_applied" in result:
+        return bool(result["warning_penalty_applied"])
+    try:
+        expected = min(
+            float(result["original_amount"]) * float(result["percentage"]),
+            float(result["max_allowed"]),
+        )
+    except (KeyError, TypeError, ValueError):
+        return False
+    return result.get("status") == "partial" and paid < round(expected, 2) - 0.005
+
+
+def claim_key(claim):
+    """Hash de 64 bits de (sessionId, createdAt) para deduplicar as colunas."""
+    digest = hashlib.blake2b(
+        f"{claim.get('sessionId', '')}|{claim.get('createdAt', '')}".encode("utf-8"),
+        digest_size=8,
+    ).digest()
+    return int.from_bytes(digest, "little", signed=True)
+
+
+def load_source(source):
+    """
+    Lê os sinistros de reembolso de uma fonte.
+
+    Returns:
+        dict: Listas das colunas e contadores de sinistros descartados
+    """
+    keys = []
+    plans = []
+    amounts = []
+    paid = []
+    warnings = []
+    skipped = Counter()
+
+    with open_source(source) as lines:
+        for line in lines:
+            # Filtro barato antes do json.loads: só interessam reembolsos
+            if '"reimbursement"' not in line:
+                continue
+            claim = json.loads(line)
+            if claim.get("claimType") != "reimbursement":
+                continue
+
+            result = claim.get("reimbursementResult") or {}
+            if (
+                claim.get("status") == "duplicate"
+                or result.get("status") == "duplicate"
+            ):
+                skipped["duplicate"] += 1
+                continue
+            amount = result.get("original_amount")
+            if amount is None:
+                amount = (claim.get("documentData") or {}).get("total_amount")
+            if not amount:
+                skipped["missing_amount"] += 1
+                continue
+
+            recorded = float(
+                claim.get("reimbursementAmount", result.get("amount", 0.0))
+            )
+            keys.append(claim_key(claim))
+            plans.append(str(result.get("plan_tier") or claim.get("planTier") or ""))
+            amounts.append(float(amount))
+            paid.append(recorded)
+            warnings.append(penalty_applied(result, recorded))
+
+    return {
+        "keys": keys,
+        "plans": plans,
+        "amounts": amounts,
+        "paid": paid,
+        "warnings": warnings,
+        "skipped": skipped,
+    }
+
+
+def load_columns(sources, workers):
+    """Carrega as fontes em paralelo e monta as colunas NumPy."""
+    plan_names = []
+    plan_positions = {}
+    chunks = {
+        "keys": [],
+        "plan_index": [],
+        "amounts": [],
+        "paid": [],
+        "warnings": [],
+    }
+    skipped = Counter()
+
+    with Pool(workers) as pool:
+        for loaded in pool.imap(load_source, sources):
+            positions = []
+            for name in loaded["plans"]:
+                position = plan_positions.get(name)
+                if position is None:
+                    position = plan_positions[name] = len(plan_names)
+                    plan_names.append(name)
+                positions.append(position)
+            chunks["keys"].append(np.asarray(loaded["keys"], dtype=np.int64))
+            chunks["plan_index"].append(np.asarray(positions, dtype=np.int32))
+            chunks["amounts"].append(np.asarray(loaded["amounts"], dtype=np.float64))
+            chunks["paid"].append(np.asarray(loaded["paid"], dtype=np.float64))
+            chunks["warnings"].append(np.asarray(loaded["warnings"], dtype=bool))
+            skipped.update(loaded["skipped"])
+
+    columns = {
+        name: (
+            np.concatenate(parts)
+            if parts
+            else np.zeros(0, dtype=np.int32 if name == "plan_index" else np.float64)
+        )
+        for name, parts in chunks.items()
+    }
+    columns["warnings"] = columns["warnings"].astype(bool)
+
+    # Mantém a primeira ocorrência de cada (sessionId, createdAt)
+    _, first = np.unique(columns["keys"], return_index=True)
+    if len(first) < len(columns["keys"]):
+        skipped["repeated_in_export"] += len(columns["keys"]) - len(first)
+        first.sort()
+        columns = {name: column[first] for name, column in columns.items()}
+    columns["plan_names"] = np.asarray(plan_names, dtype=str)
+    return columns, skipped
+
+
+def load_rules(location):
+    if location.startswith("s3://"):
+        bucket, _, key = location[len("s3://") :].partition("/")
+        return PlanRules.from_s3(bucket, key)
+    return PlanRules.from_file(location)
+
+
+def summarize(group_names, groups, baseline, candidate, capped, warnings):
+    """Totais por plano com np.bincount (uma passada por métrica)."""
+    size = len(group_names)
+    delta = candidate - baseline
+    totals = {
+        "claims": np.bincount(groups, minlength=size),
+        "baseline_total": np.bincount(groups, weights=baseline, minlength=size),
+        "candidate_total": np.bincount(groups, weights=candidate, minlength=size),
+        "increased": np.bincount(groups, weights=delta > 0.005, minlength=size),
+        "decreased": np.bincount(groups, weights=delta < -0.005, minlength=size),
+        "capped": np.bincount(groups, weights=capped, minlength=size),
+        "penalized": np.bincount(groups, weights=warnings, minlength=size),
+    }
+
+    def row(index):
+        baseline_total = float(totals["baseline_total"][index])
+        candidate_total = float(totals["candidate_total"][index])
+        claims = int(totals["claims"][index])
+        return {
+            "claims": claims,
+            "baseline_total": round(baseline_total, 2),
+            "candidate_total": round(candidate_total, 2),
+            "delta": round(candidate_total - baseline_total, 2),
+            "delta_pct": (
+                round((candidate_total / baseline_total - 1) * 100, 2)
+                if baseline_total
+                else None
+            ),
+            "mean_candidate_payout": (
+                round(candidate_total / claims, 2) if claims else None
+            ),
+            "claims_increased": int(totals["increased"][index]),
+            "claims_decreased": int(totals["decreased"][index]),
+            "claims_capped": int(totals["capped"][index]),
+            "claims_penalized": int(totals["penalized"][index]),
+        }
+
+    by_plan = {name: row(index) for index, name in enumerate(group_names)}
+    baseline_total = float(baseline.sum())
+    candidate_total = float(candidate.sum())
+    overall = {
+        "claims": int(len(baseline)),
+        "baseline_total": round(baseline_total, 2),
+        "candidate_total": round(candidate_total, 2),
+        "delta": round(candidate_total - baseline_total, 2),
+        "delta_pct": (
+            round((candidate_total / baseline_total - 1) * 100, 2)
+            if baseline_total
+            else None
+        ),
+    }
+    return by_plan, overall
+
+
+def run(args):
+    started = time.monotonic()
+    if args.columns_cache and os.path.exists(args.columns_cache) and not args.refresh:
+        with np.load(args.columns_cache) as cached:
+            columns = {name: cached[name] for name in cached.files}
+        skipped = Counter()
+        logger.warning("Colunas lidas de %s", args.columns_cache)
+    else:
+        sources = list_sources(args.input)
+        if not sources:
+            logger.error("Nenhum arquivo de exportação encontrado")
+            return 1
+        columns, skipped = load_columns(sources, args.workers)
+        if args.columns_cache:
+            np.savez(args.columns_cache, **columns)
+    load_seconds = time.monotonic() - started
+
+    candidate_rules = load_rules(args.rules)
+    baseline_rules = load_rules(args.baseline_rules) if args.baseline_rules else None
+
+    started = time.monotonic()
+    plan_names = columns["plan_names"].tolist()
+    plan_index = columns["plan_index"]
+    candidate = candidate_rules.evaluate_reimbursement_batch(
+        plan_names, plan_index, columns["amounts"], columns["warnings"]
+    )
+    if baseline_rules:
+        baseline = baseline_rules.evaluate_reimbursement_batch(
+            plan_names, plan_index, columns["amounts"], columns["warnings"]
+        )["amount"]
+    else:
+        baseline = columns["paid"]
+
+    # Agrupa pelos nomes canônicos da versão candidata (aliases somados)
+    group_names = []
+    group_of_plan = np.zeros(len(plan_names), dtype=np.int32)
+    for position, name in enumerate(plan_names):
+        group = candidate_rules.resolve_plan(name) or f"desconhecido:{name}"
+        if group not in group_names:
+            group_names.append(group)
+        group_of_plan[position] = group_names.index(group)
+
+    by_plan, overall = summarize(
+        group_names,
+        group_of_plan[plan_index],
+        baseline,
+        candidate["amount"],
+        candidate["capped"],
+        columns["warnings"],
+    )
+    simulate_seconds = time.monotonic() - started
+
+    summary = {
+        "candidate_rules_version": candidate_rules.version,
+        "baseline": baseline_rules.version if baseline_rules else "recorded",
+        "overall": overall,
+        "by_plan": by_plan,
+        "unknown_plan_claims": int((~candidate["known_plan"]).sum()),
+        "skipped_claims": dict(skipped),
+        "load_seconds": round(load_seconds, 2),
+        "simulate_seconds": round(simulate_seconds, 3),
+    }
+    print(json.dumps(summary, indent=2, ensure_ascii=False))
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Simula uma versão candidata das regras sobre o histórico"
+    )
+    parser.add_argument(
+        "--input",
+        nargs="+",
+        default=[],
+        help="Arquivos JSONL(.gz), diretórios ou prefixos s3:// da exportação",
+    )
+    parser.add_argument(
+        "--rules", required=True, help="Tabela candidata (arquivo ou s3://)"
+    )
+    parser.add_argument(
+        "--baseline-rules",
+        help="Recalcula a linha de base com esta tabela em vez dos valores pagos",
+    )
+    parser.add_argument("--columns-cache", help="Arquivo .npz com as colunas")
+    parser.add_argument(
+        "--refresh",
+        action="store_true",
+        help="Relê a exportação mesmo com o cache de colunas presente",
+    )
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    if not args.input and not (
+        args.columns_cache and os.path.exists(args.columns_cache)
+    ):
+        parser.error("--input é obrigatório sem um --columns-cache existente")
+
+    logging.basicConfig(level=logging.WARNING, format="%(asctime)s %(message)s")
+    return run(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())